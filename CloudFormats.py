@@ -0,0 +1,148 @@
+# CloudFormats.py - Functions to write GeoParquet and FlatGeobuf copies of library shapefiles
+#
+# The copies are written with the GDAL/OGR python bindings (osgeo), which are optional. Without them, or without the
+# GDAL driver for a format, writing that format raises CloudFormatsWarning and the shapefile is unaffected. LibMgrSettings
+# checks the formats once when the configuration is loaded and disables the ones that can't be written.
+#   GeoParquet is written in compressed row groups with bbox covering columns, so readers can skip row groups
+#   outside a query window. FlatGeobuf is written with its packed Hilbert R-tree spatial index.
+# The source is the feature class the shapefile was exported from, read from a file geodatabase, so the copies keep
+# its full field names and types. Each copy is written to a temporary name and renamed into place.
+#
+# The bbox query latency of a shapefile and its copies can be compared from the command line:
+#   python CloudFormats.py <shapefile> <xmin> <ymin> <xmax> <ymax> [repeats]
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import sys
+import time
+try:
+    from osgeo import gdal, ogr
+except ImportError:
+    gdal = None
+    ogr = None
+
+# custom error exception for all functions in this module
+class CloudFormatsError(Exception):
+    pass
+
+# custom warning exception for all functions in this module. Raised when a format can't be written in this environment.
+class CloudFormatsWarning(Exception):
+    pass
+
+parquetCompression = 'ZSTD' # GeoParquet column compression
+parquetRowGroupSize = 65536 # features per GeoParquet row group
+
+# formats by cloudFormats name with values (GDAL driver, file extension, layer creation options)
+dictFormats = {'geoparquet': ('Parquet', '.parquet', ['COMPRESSION=' + parquetCompression,
+                                                      'ROW_GROUP_SIZE=' + str(parquetRowGroupSize),
+                                                      'WRITE_COVERING_BBOX=YES', 'GEOMETRY_ENCODING=WKB']),
+               'flatgeobuf': ('FlatGeobuf', '.fgb', ['SPATIAL_INDEX=YES'])}
+
+
+# Get the path of a format copy of a feature class in a directory (ie. parcels.parquet)
+def GetOutputPath(outDir, featName, fmt):
+    return os.path.join(outDir, featName.lower() + dictFormats[fmt][1])
+
+
+# Check that a format can be written. Raises CloudFormatsWarning if the bindings or the GDAL driver are missing.
+def CheckFormat(fmt):
+    if ogr is None:
+        raise CloudFormatsWarning('GDAL python bindings (osgeo) are not installed')
+    if ogr.GetDriverByName(dictFormats[fmt][0]) is None:
+        raise CloudFormatsWarning('GDAL ' + gdal.__version__ + ' has no ' + dictFormats[fmt][0] + ' driver')
+
+
+# Delete the format copy of a feature class in outDir, ie. one left stale by a failed export.
+#   Returns True if there was a copy to delete.
+def DeleteCloudFormat(outDir, featName, fmt):
+    outPath = GetOutputPath(outDir, featName, fmt)
+    if not os.path.exists(outPath):
+        return False
+    os.remove(outPath)
+    return True
+
+
+# Write a format copy of a feature class to outDir. srcPath is a shapefile or a file geodatabase with the layer
+#   layerName. Returns the path of the copy.
+def ExportCloudFormat(srcPath, layerName, outDir, featName, fmt):
+    CheckFormat(fmt)
+    driverName, ext, lstLayerOptions = dictFormats[fmt]
+    outPath = GetOutputPath(outDir, featName, fmt)
+    tmpPath = os.path.join(outDir, featName.lower() + '.tmp' + ext) # keep the extension, the drivers look at it
+    if os.path.exists(tmpPath):
+        os.remove(tmpPath) # left behind by an earlier failed export
+
+    gdal.UseExceptions()
+    lstLayers = [layerName] if layerName else None
+    translateOptions = gdal.VectorTranslateOptions(format=driverName, layers=lstLayers, layerName=featName.lower(),
+                                                   layerCreationOptions=lstLayerOptions)
+    try:
+        ds = gdal.VectorTranslate(tmpPath, srcPath, options=translateOptions)
+        if ds is None:
+            raise CloudFormatsError('GDAL could not write ' + tmpPath)
+        ds = None # close the dataset so the file is complete
+    except Exception as e:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+    if os.path.exists(outPath):
+        os.remove(outPath)
+    os.rename(tmpPath, outPath)
+    return outPath
+
+
+# Count the features of a dataset in a bounding box (xmin, ymin, xmax, ymax) with its spatial index if it has one
+def QueryBBox(path, bbox):
+    ds = ogr.Open(path)
+    if ds is None:
+        raise CloudFormatsError('GDAL could not open ' + path)
+    lyr = ds.GetLayer(0)
+    lyr.SetSpatialFilterRect(bbox[0], bbox[1], bbox[2], bbox[3])
+    iCnt = 0
+    feat = lyr.GetNextFeature()
+    while feat is not None:
+        feat.GetGeometryRef()
+        iCnt += 1
+        feat = lyr.GetNextFeature()
+    ds = None
+    return iCnt
+
+
+# Time a bbox query of a shapefile and of the format copies next to it. Each query opens the dataset, so the
+#   times include reading the header and spatial index. Returns a list of (name, path, feature count, best seconds).
+def BenchmarkBBoxQuery(shpFilePath, bbox, repeats=5):
+    if ogr is None:
+        raise CloudFormatsWarning('GDAL python bindings (osgeo) are not installed')
+    outDir, shpName = os.path.split(shpFilePath)
+    featName = os.path.splitext(shpName)[0]
+    lstPaths = [('shapefile', shpFilePath)]
+    for fmt in sorted(dictFormats):
+        if os.path.isfile(GetOutputPath(outDir, featName, fmt)):
+            lstPaths.append((fmt, GetOutputPath(outDir, featName, fmt)))
+
+    lstResults = []
+    for name, path in lstPaths:
+        best = None
+        for i in range(max(1, repeats)):
+            start = time.time()
+            iCnt = QueryBBox(path, bbox)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        lstResults.append((name, path, iCnt, best))
+    return lstResults
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 6:
+        print('Usage: python CloudFormats.py <shapefile> <xmin> <ymin> <xmax> <ymax> [repeats]')
+        sys.exit(1)
+    bbox = [float(v) for v in sys.argv[2:6]]
+    repeats = int(sys.argv[6]) if len(sys.argv) > 6 else 5
+    for name, path, iCnt, best in BenchmarkBBoxQuery(sys.argv[1], bbox, repeats):
+        print('%-12s %10d features %10.4f seconds  %s' % (name, iCnt, best, path))
@@ -0,0 +1,155 @@
+# ConnectionPool.py - Pool of reusable ODBC connections keyed by connection string
+#
+# Opening a Trusted_Connection to SQL Server costs a login handshake, so connections to the metadata and geodatabase
+# system tables are kept open for the whole run and borrowed as needed. A connection that has been idle for a while
+# is checked with a trivial query before it is handed out and replaced if the server dropped it. A connection that
+# fails while borrowed is discarded rather than returned to the pool. Each process has its own pool.
+# A connection that was idle for less than healthCheckAge can still have been dropped (ie. a server restart), so
+# queries run with Run are run once more on a new connection if they fail on a connection reused from the pool.
+#
+# Usage:
+#   with ConnectionPool.Connection(connStr) as conn:
+#       curs = conn.cursor()
+#       ...
+#   rslt = ConnectionPool.Run(connStr, fnQuery) # fnQuery(conn) returns rslt and must be safe to run again
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import pyodbc
+import threading
+import time
+from contextlib import contextmanager
+try:
+    from pandas.io.sql import DatabaseError as PandasDatabaseError # pandas read_sql wraps pyodbc errors in it
+except ImportError:
+    PandasDatabaseError = None
+
+# custom error exception for all functions in this module
+class ConnectionPoolError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class ConnectionPoolWarning(Exception):
+    pass
+
+maxIdle = 4 # idle connections kept per connection string
+healthCheckAge = 60 # seconds a connection can be idle before it is checked when borrowed
+
+# idle connections keyed by connection string. Values are lists of (connection, time returned to the pool)
+dictPools = {}
+poolLock = threading.Lock()
+
+# exceptions raised by a failed query, after which the connection is discarded
+if PandasDatabaseError is None:
+    tplDatabaseErrors = (pyodbc.Error,)
+else:
+    tplDatabaseErrors = (pyodbc.Error, PandasDatabaseError)
+
+
+# Determine if a connection still works
+def IsHealthy(conn):
+    try:
+        curs = conn.cursor()
+        curs.execute('SELECT 1')
+        curs.fetchone()
+        curs.close()
+    except pyodbc.Error as e:
+        return False
+    return True
+
+
+# Close a connection, ignoring errors from a connection that is already broken
+def CloseConnection(conn):
+    try:
+        conn.close()
+    except pyodbc.Error as e:
+        pass
+
+
+# Take an idle connection for a connection string from the pool (after a health check if it has been idle longer
+#   than healthCheckAge). Returns None if there isn't one.
+def TakeIdle(connStr):
+    while True:
+        with poolLock:
+            lstIdle = dictPools.get(connStr, [])
+            if len(lstIdle) == 0:
+                return None
+            conn, returned = lstIdle.pop()
+        if time.time() - returned < healthCheckAge or IsHealthy(conn):
+            return conn
+        CloseConnection(conn) # dropped by the server. Try the next idle connection.
+
+
+# Borrow a connection for a connection string. An idle connection is reused, otherwise a new connection is opened.
+def Acquire(connStr):
+    conn = TakeIdle(connStr)
+    if conn is None:
+        conn = pyodbc.connect(connStr)
+    return conn
+
+
+# Return a borrowed connection to the pool. Any open transaction is rolled back. Broken connections are closed.
+def Release(connStr, conn, bBroken=False):
+    if not bBroken:
+        try:
+            conn.rollback()
+        except pyodbc.Error as e:
+            bBroken = True
+    with poolLock:
+        lstIdle = dictPools.setdefault(connStr, [])
+        if not bBroken and len(lstIdle) < maxIdle:
+            lstIdle.append((conn, time.time()))
+            return
+    CloseConnection(conn)
+
+
+# Borrow a connection for the length of a with block, or open a new one if bNew is True. The connection is
+#   discarded if a database error is raised.
+@contextmanager
+def Connection(connStr, bNew=False):
+    if bNew:
+        conn = pyodbc.connect(connStr)
+    else:
+        conn = Acquire(connStr)
+    try:
+        yield conn
+    except tplDatabaseErrors:
+        Release(connStr, conn, True)
+        raise
+    except Exception:
+        Release(connStr, conn)
+        raise
+    else:
+        Release(connStr, conn)
+
+
+# Run fnQuery(conn) on a borrowed connection and return its result. If it raises a database error on a connection
+#   reused from the pool, the connection is discarded and fnQuery is run once more on a new connection.
+def Run(connStr, fnQuery):
+    conn = TakeIdle(connStr)
+    if conn is not None:
+        try:
+            rslt = fnQuery(conn)
+        except tplDatabaseErrors:
+            Release(connStr, conn, True) # possibly dropped by the server since it was returned. Retry below.
+        except Exception:
+            Release(connStr, conn)
+            raise
+        else:
+            Release(connStr, conn)
+            return rslt
+
+    with Connection(connStr, True) as conn:
+        return fnQuery(conn)
+
+
+# Close every idle connection in the pool (end of the run)
+def CloseAll():
+    with poolLock:
+        lstConns = [conn for lstIdle in dictPools.values() for conn, returned in lstIdle]
+        dictPools.clear()
+    for conn in lstConns:
+        CloseConnection(conn)
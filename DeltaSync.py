@@ -0,0 +1,186 @@
+# DeltaSync.py - Functions to apply a staged feature class to the library as row inserts, updates and deletes
+#
+# Rows are matched on a stable ID field. Each row's geometry and attribute values are hashed in the staged and library
+# feature classes, and only the rows that were added, changed or removed are written to the library. Values are
+# normalized before hashing (coordinates snapped to the xy resolution, floats to 15 significant digits, dates to the
+# second, text to utf-8), so differences in how the file and enterprise geodatabases store them aren't changes.
+# The library feature class stays in place, so readers are not locked out for the length of a full reload.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import arcpy
+import hashlib
+import datetime
+import ShapefileWriter
+
+# custom error exception for all functions in this module
+class DeltaSyncError(Exception):
+    pass
+
+# custom warning exception for all functions in this module. Raised when a delta can't be applied and the
+#   library feature class must be replaced instead.
+class DeltaSyncWarning(Exception):
+    pass
+
+# field types that are not compared or written by a delta
+lstSkipFieldTypes = ['OID', 'Geometry', 'GlobalID', 'Blob', 'Raster']
+
+# largest number of key values put in a where clause to limit the library update cursor
+maxWhereKeys = 1000
+
+
+# Get the delta field names of the staged feature class and the matching library field names (same order), and the
+#   coarser xy resolution of the two feature classes for comparing geometries.
+#   Raises DeltaSyncWarning if the schemas, geometry types or spatial references differ or the key field is missing.
+def GetDeltaFields(stagePath, libPath, keyField):
+    descStage = arcpy.Describe(stagePath)
+    descLib = arcpy.Describe(libPath)
+    if descStage.shapeType != descLib.shapeType:
+        raise DeltaSyncWarning('Geometry type differs')
+    if descStage.spatialReference.name != descLib.spatialReference.name:
+        raise DeltaSyncWarning('Spatial reference differs')
+
+    dictStageFields = {}
+    for fld in arcpy.ListFields(stagePath):
+        if fld.type not in lstSkipFieldTypes and fld.editable:
+            dictStageFields[fld.name.upper()] = fld
+    dictLibFields = {}
+    for fld in arcpy.ListFields(libPath):
+        if fld.type not in lstSkipFieldTypes and fld.editable:
+            dictLibFields[fld.name.upper()] = fld
+
+    if keyField.upper() not in dictStageFields or keyField.upper() not in dictLibFields:
+        raise DeltaSyncWarning('Key field ' + keyField + ' does not exist')
+    if set(dictStageFields.keys()) != set(dictLibFields.keys()):
+        raise DeltaSyncWarning('Field schema differs')
+    for fldName in dictStageFields:
+        if dictStageFields[fldName].type != dictLibFields[fldName].type:
+            raise DeltaSyncWarning('Field type differs on ' + fldName)
+
+    lstFieldNames = sorted(dictStageFields.keys())
+    lstFieldNames.remove(keyField.upper())
+    lstStageFields = [dictStageFields[fldName].name for fldName in lstFieldNames]
+    lstLibFields = [dictLibFields[fldName].name for fldName in lstFieldNames]
+    xyResolution = max(descStage.spatialReference.XYResolution, descLib.spatialReference.XYResolution)
+    if descStage.hasZ or descStage.hasM: # the snapped xy coordinates would miss Z and M changes, so compare the WKB
+        xyResolution = 0
+    return (dictStageFields[keyField.upper()], dictLibFields[keyField.upper()], lstStageFields, lstLibFields, xyResolution)
+
+
+# Normalize an attribute value for hashing, so the same value read from a file and an enterprise geodatabase hashes
+#   the same (ie. unicode and str text, long and int, float rounding, sub-second date precision)
+def NormalizeValue(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, long)):
+        return int(value)
+    if isinstance(value, float):
+        return '%.15g' % value
+    if isinstance(value, datetime.datetime):
+        return value.replace(microsecond=0)
+    return value
+
+
+# Normalize a WKB geometry for hashing as its parts with the coordinates snapped to the xy resolution grid.
+#   Without a resolution (ie. unknown coordinate system, Z or M values) the WKB is used as it is.
+def NormalizeGeometry(wkb, xyResolution):
+    if wkb is None:
+        return None
+    if not xyResolution or xyResolution != xyResolution: # zero, None or NaN
+        return bytes(wkb)
+    return [[(int(round(x / xyResolution)), int(round(y / xyResolution))) for x, y in part]
+            for part in ShapefileWriter.ParseWKB(wkb)]
+
+
+# Hash every row of a feature class. Returns a dictionary of key value to row hash.
+#   Raises DeltaSyncWarning if a key value is null or duplicated.
+def HashRows(featPath, keyField, lstFields, xyResolution=0):
+    dictHashes = {}
+    with arcpy.da.SearchCursor(featPath, [keyField, 'SHAPE@WKB'] + lstFields) as cursor:
+        for row in cursor:
+            key = row[0]
+            if key is None:
+                raise DeltaSyncWarning('Key field ' + keyField + ' has null values')
+            if key in dictHashes:
+                raise DeltaSyncWarning('Key field ' + keyField + ' has duplicate values')
+            hasher = hashlib.md5()
+            hasher.update(repr(NormalizeGeometry(row[1], xyResolution)))
+            hasher.update(repr([NormalizeValue(value) for value in row[2:]]))
+            dictHashes[key] = hasher.digest()
+    return dictHashes
+
+
+# Build a where clause selecting a list of key values, or '' if there are too many values to list
+def BuildKeyWhereClause(featPath, keyFld, lstKeys):
+    if len(lstKeys) > maxWhereKeys:
+        return ''
+    fldDelim = arcpy.AddFieldDelimiters(featPath, keyFld.name)
+    if keyFld.type in ['String', 'Guid']:
+        lstValues = ['\'' + unicode(key).replace('\'', '\'\'') + '\'' for key in lstKeys]
+    else:
+        lstValues = [str(key) for key in lstKeys]
+    return fldDelim + ' IN (' + ','.join(lstValues) + ')'
+
+
+# Apply the staged feature class to the library feature class as inserts, updates and deletes matched on keyField.
+#   libWrkspc is the library workspace (sde connection file) used for the edit session.
+#   Returns a tuple of the (inserted, updated, deleted) row counts.
+#   Raises DeltaSyncWarning if the delta can't be applied and the library feature class must be replaced instead.
+def ApplyDelta(stagePath, libPath, libWrkspc, keyField):
+    stageKeyFld, libKeyFld, lstStageFields, lstLibFields, xyResolution = GetDeltaFields(stagePath, libPath, keyField)
+
+    dictStageHashes = HashRows(stagePath, stageKeyFld.name, lstStageFields, xyResolution)
+    dictLibHashes = HashRows(libPath, libKeyFld.name, lstLibFields, xyResolution)
+
+    setInsert = set()
+    setUpdate = set()
+    for key, rowHash in dictStageHashes.iteritems():
+        if key not in dictLibHashes:
+            setInsert.add(key)
+        elif dictLibHashes[key] != rowHash:
+            setUpdate.add(key)
+    setDelete = set(dictLibHashes.keys()) - set(dictStageHashes.keys())
+
+    if len(setInsert) + len(setUpdate) + len(setDelete) == 0:
+        return (0, 0, 0)
+
+    # read the new and changed rows from the staged feature class
+    dictStageRows = {}
+    if len(setInsert) + len(setUpdate) > 0:
+        whereClause = BuildKeyWhereClause(stagePath, stageKeyFld, list(setInsert | setUpdate))
+        with arcpy.da.SearchCursor(stagePath, [stageKeyFld.name, 'SHAPE@'] + lstStageFields, whereClause) as cursor:
+            for row in cursor:
+                if row[0] in setInsert or row[0] in setUpdate:
+                    dictStageRows[row[0]] = row
+
+    # write the changes to the library in a single edit operation
+    lstLibCursorFields = [libKeyFld.name, 'SHAPE@'] + lstLibFields
+    edit = arcpy.da.Editor(libWrkspc)
+    edit.startEditing(False, False) # no undo, non-versioned
+    edit.startOperation()
+    try:
+        if len(setUpdate) + len(setDelete) > 0:
+            whereClause = BuildKeyWhereClause(libPath, libKeyFld, list(setUpdate | setDelete))
+            with arcpy.da.UpdateCursor(libPath, lstLibCursorFields, whereClause) as cursor:
+                for row in cursor:
+                    if row[0] in setDelete:
+                        cursor.deleteRow()
+                    elif row[0] in setUpdate:
+                        cursor.updateRow(dictStageRows[row[0]])
+        if len(setInsert) > 0:
+            with arcpy.da.InsertCursor(libPath, lstLibCursorFields) as cursor:
+                for key in setInsert:
+                    cursor.insertRow(dictStageRows[key])
+    except Exception as e:
+        edit.abortOperation()
+        edit.stopEditing(False)
+        raise
+    edit.stopOperation()
+    edit.stopEditing(True)
+
+    return (len(setInsert), len(setUpdate), len(setDelete))
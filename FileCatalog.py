@@ -0,0 +1,207 @@
+# FileCatalog.py - Functions to snapshot shapefile directories so existence, dates and sizes are read from memory
+#
+# Each directory is listed once per run. Every shapefile sidecar (.shp, .dbf, .shx, .prj) is indexed by feature name
+# with its last modified time and size. On Windows, scandir returns the file times and sizes with the directory
+# listing, so a UNC directory costs one SMB round-trip instead of several per shapefile. ArcMap's Python 2.7 has no
+# os.scandir, so the scandir backport (pip install scandir) is used if it is installed. Without it, the directory is
+# listed and only the sidecar files are stat'ed.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import stat
+import datetime
+import hashlib
+import mmap
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # scandir backport for python 2.7
+    except ImportError:
+        scandir = None
+
+# custom error exception for all functions in this module
+class FileCatalogError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class FileCatalogWarning(Exception):
+    pass
+
+# shapefile sidecar extensions indexed in a directory snapshot
+lstShapefileExts = ['.shp', '.dbf', '.shx', '.prj']
+
+# length of a record in the arc.dir of a coverage workspace's info directory
+arcDirRecordLength = 380
+
+# size of each memory mapped window when hashing files (must be a multiple of mmap.ALLOCATIONGRANULARITY)
+hashChunkSize = 64 * 1024 * 1024
+
+# loaded snapshots keyed by normalized directory path
+#   each snapshot is a dictionary keyed by lowercase feature name with values {ext: (mtime, size)}
+dictDirs = {}
+
+
+# return the snapshot key for a directory path (case and trailing slash insensitive)
+def GetDirKey(dirPath):
+    return os.path.normcase(os.path.normpath(dirPath))
+
+
+# add a file to a directory snapshot if it is a shapefile sidecar
+def AddFile(dictFeats, fileName, mtime, size):
+    featName, ext = os.path.splitext(fileName.lower())
+    if ext in lstShapefileExts:
+        if featName not in dictFeats:
+            dictFeats[featName] = {}
+        dictFeats[featName][ext] = (mtime, size)
+
+
+# List a directory once and index its shapefile sidecars. A directory that can't be listed has no shapefiles.
+def ScanDirectory(dirPath):
+    key = GetDirKey(dirPath)
+    if key in dictDirs:
+        return dictDirs[key]
+
+    dictFeats = {}
+    try:
+        if scandir is not None:
+            for entry in scandir(dirPath):
+                if entry.is_file():
+                    st = entry.stat()
+                    AddFile(dictFeats, entry.name, st.st_mtime, st.st_size)
+        else: # without scandir, only the sidecar files are stat'ed, each once
+            for fileName in os.listdir(dirPath):
+                if os.path.splitext(fileName.lower())[1] in lstShapefileExts:
+                    st = os.stat(os.path.join(dirPath, fileName))
+                    if stat.S_ISREG(st.st_mode):
+                        AddFile(dictFeats, fileName, st.st_mtime, st.st_size)
+    except OSError as e:
+        pass # directory doesn't exist or can't be read
+    dictDirs[key] = dictFeats
+    return dictFeats
+
+
+# Scan a list of directories. Returns the total number of shapefile feature names indexed.
+def ScanDirectories(lstDirPaths):
+    iCnt = 0
+    for dirPath in lstDirPaths:
+        iCnt += len(ScanDirectory(dirPath))
+    return iCnt
+
+
+# return the sidecar dictionary {ext: (mtime, size)} for a shapefile, or an empty dictionary if there are no files
+def GetShapefileEntry(dirPath, featName):
+    dictFeats = ScanDirectory(dirPath)
+    return dictFeats.get(featName.lower(), {})
+
+
+# Determine if a shapefile exists (the .shp file is present)
+def ShapefileExists(dirPath, featName):
+    return '.shp' in GetShapefileEntry(dirPath, featName)
+
+
+# Get the last modified datetime of a shapefile (.shp file)
+def GetShapefileLastModDate(dirPath, featName):
+    entry = GetShapefileEntry(dirPath, featName)
+    if '.shp' not in entry:
+        raise FileCatalogError('Shapefile does not exist - ' + featName)
+    return datetime.datetime.fromtimestamp(entry['.shp'][0])
+
+
+# Get the size in bytes of a shapefile (total of the .shp, .dbf, .shx and .prj files)
+def GetShapefileSize(dirPath, featName):
+    size = 0
+    for mtime, fileSize in GetShapefileEntry(dirPath, featName).values():
+        size += fileSize
+    return size
+
+
+# Get a fingerprint of a shapefile from the .shp and .dbf times and sizes, or None if the shapefile doesn't exist
+def GetFingerprint(dirPath, featName):
+    entry = GetShapefileEntry(dirPath, featName)
+    if '.shp' not in entry:
+        return None
+    lstParts = []
+    for ext in ['.shp', '.dbf']:
+        if ext in entry:
+            lstParts.append(ext + ' ' + str(int(entry[ext][0])) + ' ' + str(entry[ext][1]))
+    return ';'.join(lstParts)
+
+
+# Get the file paths to hash for a shapefile (.shp and .dbf)
+def GetShapefileHashFiles(dirPath, featName):
+    return [os.path.join(dirPath, featName.lower() + '.shp'), os.path.join(dirPath, featName.lower() + '.dbf')]
+
+
+# Get the INFO table files of a coverage from the arc.dir of its workspace's info directory. Each 380 byte arc.dir
+#   record starts with the table name (ie. PARCELS.PAT, padded to 32 characters) and the name of its data file
+#   (ie. ARC0001, 8 characters), which is stored as <name>.dat with its definition <name>.nit. Returns the paths of the
+#   files that exist, in table name order.
+def GetCoverageInfoFiles(covPath):
+    wrkspcPath, covName = os.path.split(os.path.normpath(covPath))
+    infoPath = os.path.join(wrkspcPath, 'info')
+    try:
+        with open(os.path.join(infoPath, 'arc.dir'), 'rb') as dirFile:
+            data = dirFile.read()
+    except (IOError, OSError) as e:
+        return [] # no INFO directory
+    prefix = covName.upper() + '.'
+    lstTables = []
+    for offset in range(0, len(data) - arcDirRecordLength + 1, arcDirRecordLength):
+        tableName = data[offset:offset + 32].decode('ascii', 'ignore').strip().upper()
+        infoName = data[offset + 32:offset + 40].decode('ascii', 'ignore').strip().lower()
+        if tableName.startswith(prefix) and infoName != '':
+            lstTables.append((tableName, infoName))
+    lstFilePaths = []
+    for tableName, infoName in sorted(lstTables):
+        for ext in ['.dat', '.nit']:
+            if os.path.isfile(os.path.join(infoPath, infoName + ext)):
+                lstFilePaths.append(os.path.join(infoPath, infoName + ext))
+    return lstFilePaths
+
+
+# Get the file paths to hash for a coverage (the .adf files in the coverage directory, in name order, then its INFO
+#   table files, which hold the feature attributes)
+def GetCoverageHashFiles(covPath):
+    lstFilePaths = []
+    for fileName in sorted(os.listdir(covPath)):
+        if fileName.lower().endswith('.adf'):
+            lstFilePaths.append(os.path.join(covPath, fileName))
+    return lstFilePaths + GetCoverageInfoFiles(covPath)
+
+
+# Get a content hash of a list of files. Files are read through memory mapped windows of hashChunkSize bytes
+#   so large files are hashed without reading them into memory. The file names and sizes are part of the hash.
+def HashFiles(lstFilePaths):
+    hasher = hashlib.sha1()
+    for filePath in lstFilePaths:
+        with open(filePath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            hasher.update(os.path.basename(filePath).lower() + ' ' + str(size) + '\n')
+            offset = 0
+            while offset < size:
+                length = min(hashChunkSize, size - offset)
+                mm = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+                try:
+                    hasher.update(mm)
+                finally:
+                    mm.close()
+                offset += length
+    return hasher.hexdigest()
+
+
+# Refresh the snapshot entry for one shapefile after it has been written
+def RefreshShapefile(dirPath, featName):
+    dictFeats = ScanDirectory(dirPath)
+    entry = {}
+    for ext in lstShapefileExts:
+        try:
+            st = os.stat(os.path.join(dirPath, featName.lower() + ext))
+        except OSError as e:
+            continue # sidecar doesn't exist
+        entry[ext] = (st.st_mtime, st.st_size)
+    dictFeats[featName.lower()] = entry
@@ -0,0 +1,155 @@
+# GDBCatalog.py - Functions to snapshot geodatabase catalogs so feature class existence and dates are checked in memory
+#
+# A snapshot is loaded with one query per geodatabase schema at startup. Existence, create date and (for versioned
+# sources) last modified date lookups use the snapshot when one is loaded and fall back to the live arcpy and
+# PC_Geoprocessing probes when it isn't.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import ConnectionPool
+import PC_Geoprocessing
+import arcpy
+import datetime
+
+# custom error exception for all functions in this module
+class GDBCatalogError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class GDBCatalogWarning(Exception):
+    pass
+
+# loaded snapshots keyed by (sql connection string, schema) in lowercase
+#   each snapshot is a dictionary keyed by lowercase feature class name with values {'createdate': , 'modifydate': }
+dictCatalogs = {}
+
+
+# build the catalog query for registered feature classes in a schema, optionally limited to one feature class
+def BuildCatalogQuery(bOneFeature):
+    qry = 'SELECT LOWER(t.name) AS feature, t.create_date AS createdate ' +\
+        'FROM sys.tables t ' +\
+        'JOIN sys.schemas s ON s.schema_id = t.schema_id ' +\
+        'JOIN sde.GDB_ITEMS i ON UPPER(i.PhysicalName) = UPPER(DB_NAME() + \'.\' + s.name + \'.\' + t.name) ' +\
+        'WHERE UPPER(s.name) = ?'
+    if bOneFeature:
+        qry = qry + ' AND UPPER(t.name) = ?'
+    return qry
+
+
+# build the query for the last user update of versioned feature classes (base, adds and deletes tables) in a schema.
+#   sys.dm_db_index_usage_stats is cleared when SQL Server restarts, so a NULL date means "unknown" rather than "never"
+def BuildLastModQuery():
+    qry = 'SELECT LOWER(r.table_name) AS feature, ' +\
+        '(SELECT MAX(u.last_user_update) FROM sys.dm_db_index_usage_stats u ' +\
+        'WHERE u.database_id = DB_ID() AND u.object_id IN (' +\
+        'OBJECT_ID(QUOTENAME(r.owner) + \'.\' + QUOTENAME(r.table_name)), ' +\
+        'OBJECT_ID(QUOTENAME(r.owner) + \'.\' + QUOTENAME(\'a\' + CAST(r.registration_id AS VARCHAR(10)))), ' +\
+        'OBJECT_ID(QUOTENAME(r.owner) + \'.\' + QUOTENAME(\'D\' + CAST(r.registration_id AS VARCHAR(10)))))) AS modifydate ' +\
+        'FROM sde.SDE_table_registry r ' +\
+        'WHERE UPPER(r.owner) = ?'
+    return qry
+
+
+# return the snapshot key for a connection string and schema
+def GetCatalogKey(sqlConnStr, schemaName):
+    return (sqlConnStr.lower(), schemaName.lower())
+
+
+# Load a snapshot of all registered feature classes in a geodatabase schema with one query.
+#   If bVersioned is True, also load last modified dates for versioned feature classes.
+#   Returns the number of feature classes in the snapshot.
+def LoadCatalog(sqlConnStr, schemaName, bVersioned=False):
+    def QueryCatalog(conn):
+        dictFeats = {}
+        curs = conn.cursor()
+        curs.execute(BuildCatalogQuery(False), schemaName.upper())
+        for feature, createdate in curs.fetchall():
+            dictFeats[feature] = {'createdate': createdate, 'modifydate': None}
+
+        if bVersioned:
+            try:
+                curs.execute(BuildLastModQuery(), schemaName.upper())
+                for feature, modifydate in curs.fetchall():
+                    if feature in dictFeats:
+                        dictFeats[feature]['modifydate'] = modifydate
+            except Exception as e:
+                pass # no usage stats permission. Last modified dates will be read live for each feature class.
+        curs.close()
+        return dictFeats
+
+    dictFeats = ConnectionPool.Run(sqlConnStr, QueryCatalog)
+
+    dictCatalogs[GetCatalogKey(sqlConnStr, schemaName)] = dictFeats
+    return len(dictFeats)
+
+
+# Return True if a snapshot is loaded for the connection string and schema
+def IsLoaded(sqlConnStr, schemaName):
+    return GetCatalogKey(sqlConnStr, schemaName) in dictCatalogs
+
+
+# Determine if a geodatabase feature class exists. Uses the snapshot if loaded, otherwise arcpy.Exists on featPath.
+def FeatureClassExists(featPath, featName, schemaName, sqlConnStr):
+    key = GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictCatalogs:
+        return featName.lower() in dictCatalogs[key]
+    return arcpy.Exists(featPath)
+
+
+# Get a non-versioned feature class create date. Uses the snapshot if loaded, otherwise queries the geodatabase.
+def GetCreateDate(featName, schemaName, sqlConnStr):
+    key = GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictCatalogs and featName.lower() in dictCatalogs[key]:
+        return dictCatalogs[key][featName.lower()]['createdate']
+    return PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, schemaName, sqlConnStr)
+
+
+# Get a versioned feature class last modified date. Uses the snapshot if it has a date, otherwise queries the geodatabase.
+def GetLastModDate(featName, schemaName, sqlConnStr):
+    key = GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictCatalogs and featName.lower() in dictCatalogs[key]:
+        modifydate = dictCatalogs[key][featName.lower()]['modifydate']
+        if modifydate is not None:
+            return modifydate
+    return PC_Geoprocessing.GetVersionedGDBLastModDate(featName, sqlConnStr, schemaName)
+
+
+# Get a fingerprint of a feature class from the snapshot, or None if it isn't in a loaded snapshot.
+#   Versioned feature classes use the last modified date, which is None (unknown) when the usage stats were cleared.
+def GetFingerprint(featName, schemaName, sqlConnStr, bVersioned=False):
+    key = GetCatalogKey(sqlConnStr, schemaName)
+    if key not in dictCatalogs or featName.lower() not in dictCatalogs[key]:
+        return None
+    entry = dictCatalogs[key][featName.lower()]
+    if bVersioned:
+        if entry['modifydate'] is None:
+            return None
+        return 'modified ' + str(entry['modifydate'])
+    return 'created ' + str(entry['createdate'])
+
+
+# Refresh the snapshot entry for one feature class after it has been replaced (ie. SafeConvert to the library)
+#   If the catalog can't be read, the feature class is assumed to exist with a create date of now.
+def RefreshFeatureClass(featName, schemaName, sqlConnStr):
+    key = GetCatalogKey(sqlConnStr, schemaName)
+    if key not in dictCatalogs:
+        return # no snapshot for this geodatabase. Live probes are used.
+
+    entry = {'createdate': datetime.datetime.now(), 'modifydate': None}
+    def QueryFeatureClass(conn):
+        curs = conn.cursor()
+        curs.execute(BuildCatalogQuery(True), schemaName.upper(), featName.upper())
+        rslt = curs.fetchone()
+        curs.close()
+        return rslt
+
+    try:
+        rslt = ConnectionPool.Run(sqlConnStr, QueryFeatureClass)
+    except Exception as e:
+        rslt = None
+    if rslt:
+        entry['createdate'] = rslt[1]
+    dictCatalogs[key][featName.lower()] = entry
@@ -0,0 +1,71 @@
+# GDBLocks.py - Functions to detect feature classes locked by other geodatabase users before they are replaced
+#
+# The locked tables of a schema are read from the geodatabase lock tables (sde.SDE_table_locks and sde.SDE_layer_locks)
+# with one query. The result is kept for lockCacheSeconds, so checking every feature class in a run costs one query per
+# interval instead of one per feature class. A lock check that can't be run reports the feature class as unlocked, so
+# processing continues as it did without the check.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import ConnectionPool
+import GDBCatalog
+import time
+
+# custom error exception for all functions in this module
+class GDBLocksError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class GDBLocksWarning(Exception):
+    pass
+
+lockCacheSeconds = 15 # seconds a lock snapshot is used before the lock tables are read again
+
+# lock snapshots keyed by (sql connection string, schema) in lowercase like GDBCatalog
+#   values are (time loaded, set of lowercase locked table names)
+dictLocks = {}
+
+
+# build the query for the tables in a schema with table or layer locks held by geodatabase connections
+def BuildLocksQuery():
+    qry = 'SELECT LOWER(r.table_name) AS feature ' +\
+        'FROM sde.SDE_table_locks l ' +\
+        'JOIN sde.SDE_table_registry r ON r.registration_id = l.registration_id ' +\
+        'WHERE UPPER(r.owner) = ? ' +\
+        'UNION ' +\
+        'SELECT LOWER(y.table_name) AS feature ' +\
+        'FROM sde.SDE_layer_locks l ' +\
+        'JOIN sde.SDE_layers y ON y.layer_id = l.layer_id ' +\
+        'WHERE UPPER(y.owner) = ?'
+    return qry
+
+
+# Get the set of locked tables in a schema, reading the lock tables if the snapshot is older than lockCacheSeconds
+def GetLockedTables(schemaName, sqlConnStr):
+    key = GDBCatalog.GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictLocks and time.time() - dictLocks[key][0] < lockCacheSeconds:
+        return dictLocks[key][1]
+
+    def QueryLocks(conn):
+        setLocked = set()
+        curs = conn.cursor()
+        curs.execute(BuildLocksQuery(), schemaName.upper(), schemaName.upper())
+        for feature, in curs.fetchall():
+            setLocked.add(feature)
+        curs.close()
+        return setLocked
+
+    setLocked = ConnectionPool.Run(sqlConnStr, QueryLocks)
+    dictLocks[key] = (time.time(), setLocked)
+    return setLocked
+
+
+# Determine if a feature class is locked by another geodatabase user. Returns False if the locks can't be read.
+def IsLocked(featName, schemaName, sqlConnStr):
+    try:
+        return featName.lower() in GetLockedTables(schemaName, sqlConnStr)
+    except Exception as e:
+        return False
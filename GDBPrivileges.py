@@ -0,0 +1,136 @@
+# GDBPrivileges.py - Functions to snapshot and change the read privileges of library geodatabase tables
+#
+# The SELECT grants of every table in a schema are loaded with one query at startup. Setting the privileges of a
+# feature class compares the users that should be able to read it with the users that can, and issues only the missing
+# GRANT and extra REVOKE statements in one transaction. A feature class whose grants are already correct costs nothing.
+# Only the library read users in lstManagedUsers are granted or revoked. Other grants (ie. owners, editors) are left
+# alone. If the statements can't be run over the SQL connection, arcpy ChangePrivileges is used for the changes.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import ConnectionPool
+import GDBCatalog
+import arcpy
+
+# custom error exception for all functions in this module
+class GDBPrivilegesError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class GDBPrivilegesWarning(Exception):
+    pass
+
+# read users of sensitive feature class sub groups keyed by lowercase SenSubGrp
+dictSubGroupUsers = {'cultres': 'cultres_read', 'infotech': 'infotech_read', 'cultres_natres': 'cultres_natres_read',
+                     'natres': 'natres_read', 'wwconres': 'wwconres_read'}
+
+# library read users managed by the library manager (lowercase)
+lstManagedUsers = ['gisread', 'spread'] + sorted(dictSubGroupUsers.values())
+
+# loaded snapshots keyed by (sql connection string, schema) in lowercase like GDBCatalog
+#   each snapshot is a dictionary keyed by lowercase table name with values of the set of lowercase users with SELECT
+dictGrants = {}
+
+
+# build the query for the SELECT grants on tables in a schema, optionally limited to one table
+def BuildGrantsQuery(bOneFeature):
+    qry = 'SELECT LOWER(o.name) AS feature, LOWER(u.name) AS grantee ' +\
+        'FROM sys.database_permissions p ' +\
+        'JOIN sys.objects o ON o.object_id = p.major_id ' +\
+        'JOIN sys.schemas s ON s.schema_id = o.schema_id ' +\
+        'JOIN sys.database_principals u ON u.principal_id = p.grantee_principal_id ' +\
+        'WHERE p.class = 1 AND p.minor_id = 0 AND p.permission_name = \'SELECT\' AND p.state IN (\'G\', \'W\') ' +\
+        'AND UPPER(s.name) = ?'
+    if bOneFeature:
+        qry = qry + ' AND UPPER(o.name) = ?'
+    return qry
+
+
+# Load a snapshot of the SELECT grants on all tables in a schema with one query.
+#   Returns the number of tables with grants.
+def LoadGrants(sqlConnStr, schemaName):
+    def QueryGrants(conn):
+        dictFeats = {}
+        curs = conn.cursor()
+        curs.execute(BuildGrantsQuery(False), schemaName.upper())
+        for feature, grantee in curs.fetchall():
+            dictFeats.setdefault(feature, set()).add(grantee)
+        curs.close()
+        return dictFeats
+
+    dictFeats = ConnectionPool.Run(sqlConnStr, QueryGrants)
+
+    dictGrants[GDBCatalog.GetCatalogKey(sqlConnStr, schemaName)] = dictFeats
+    return len(dictFeats)
+
+
+# Get the set of lowercase users with SELECT on a table. The snapshot is used if loaded, unless bRefresh is set
+#   (ie. the feature class was replaced since the snapshot was loaded), otherwise the grants are queried.
+def GetGrants(featName, schemaName, sqlConnStr, bRefresh=False):
+    key = GDBCatalog.GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictGrants and not bRefresh:
+        return set(dictGrants[key].get(featName.lower(), set()))
+
+    def QueryGrantees(conn):
+        setGrantees = set()
+        curs = conn.cursor()
+        curs.execute(BuildGrantsQuery(True), schemaName.upper(), featName.upper())
+        for feature, grantee in curs.fetchall():
+            setGrantees.add(grantee)
+        curs.close()
+        return setGrantees
+
+    return ConnectionPool.Run(sqlConnStr, QueryGrantees)
+
+
+# Get the set of lowercase users that should be able to read a feature class from the SENSITIVE and SenSubGrp metadata
+def GetDesiredUsers(sensitive, sensubgrp):
+    if not sensitive:
+        return set(['gisread'])
+    setUsers = set(['spread'])
+    if isinstance(sensubgrp, basestring) and sensubgrp.lower() in dictSubGroupUsers:
+        setUsers.add(dictSubGroupUsers[sensubgrp.lower()])
+    return setUsers
+
+
+# Apply lists of users to grant SELECT to and revoke privileges from on a table in one transaction.
+#   bRevokeEdit also revokes INSERT, UPDATE and DELETE from the revoked users.
+def ApplyChanges(featName, schemaName, sqlConnStr, lstGrant, lstRevoke, bRevokeEdit=False):
+    tableName = '[' + schemaName + '].[' + featName + ']'
+    if bRevokeEdit:
+        revokePrivs = 'SELECT, INSERT, UPDATE, DELETE'
+    else:
+        revokePrivs = 'SELECT'
+    lstStatements = []
+    for user in lstGrant:
+        lstStatements.append('GRANT SELECT ON ' + tableName + ' TO [' + user + ']')
+    for user in lstRevoke:
+        lstStatements.append('REVOKE ' + revokePrivs + ' ON ' + tableName + ' FROM [' + user + ']')
+
+    with ConnectionPool.Connection(sqlConnStr) as conn:
+        curs = conn.cursor()
+        for stmt in lstStatements:
+            curs.execute(stmt)
+        conn.commit()
+        curs.close()
+
+
+# Apply the changes with arcpy ChangePrivileges, one call per user (used if the SQL statements can't be run)
+def ApplyChangesArcpy(inFeature, lstGrant, lstRevoke, bRevokeEdit=False):
+    for user in lstGrant:
+        arcpy.ChangePrivileges_management(in_dataset=inFeature, user=user, View="GRANT", Edit="AS_IS")
+    for user in lstRevoke:
+        if bRevokeEdit:
+            arcpy.ChangePrivileges_management(in_dataset=inFeature, user=user, View="REVOKE", Edit="REVOKE")
+        else:
+            arcpy.ChangePrivileges_management(in_dataset=inFeature, user=user, View="REVOKE", Edit="AS_IS")
+
+
+# Record changed grants in the snapshot so later comparisons in this run see them
+def UpdateSnapshot(featName, schemaName, sqlConnStr, setGrantees):
+    key = GDBCatalog.GetCatalogKey(sqlConnStr, schemaName)
+    if key in dictGrants:
+        dictGrants[key][featName.lower()] = setGrantees
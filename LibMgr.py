@@ -20,11 +20,15 @@
 #   StgSHPtoLIB - Used to sync changes made in shapefiles to the library geodatabase. 
 #   StgGDBtoLIB - Used to sync changes made in library stage geodatabase to the library geodatabase.
 #   COVtoLIB - Used to sync changes made in coverages to library geodatabase.
+#   METAONLY - Used to push feature class metadata changes to the library geodatabase without reloading data.
 #   LIBtoSHP - Final step used to sync changes made in the library geodatabase to the shapefiles on the library file server.
-#   FORCE - Used to disconnect users with locks in the library geodatabase.
+#   FORCE - Used to disconnect users with locks in the library geodatabase. Locked library feature classes are deferred
+#           and retried at the end of the run. FORCE is only used on those still locked after the retries.
 #   -FC featClass,featClass,... - Indicates a comma-separated list of feature classes to process instead of processing all
 #   -FX featClass,featClass,... - Indicates a comma-separated list of feature classes to exclude from processing
 #   IGNORESTATUS - Used to cause sync regardless of timestamp comparison.
+#   --WORKERS n - Process feature classes in a pool of n worker processes, each with its own staging file geodatabase.
+#           The workers only read the sync state manifest. Their manifest writes are made by the main process.
 #
 # Revision History:
 # Date          Developer           Description
@@ -34,7 +38,7 @@
 logMsg = ''
 
 import arcpy
-import ConfigParser
+import LibMgrSettings
 import os, sys, traceback
 import logging
 import datetime
@@ -44,248 +48,351 @@ import Metadata
 import PC_Notification
 import base64
 import UpdateLib
+import LibMgrWorker
+import GDBCatalog
+import GDBPrivileges
+import FileCatalog
+import SyncManifest
+import ConnectionPool
 import PC_Python
 
 scriptName = 'GIS_LibraryManager'
+usage = 'Usage: LibMgr.py [EditGDBtoLIB] [StgSHPtoLIB] [StgGDBtoLIB] [COVtoLIB] [METAONLY] [LIBtoSHP] [FORCE] ' +\
+    '[-FC featClass,...] [-FX featClass,...] [IGNORESTATUS] [--WORKERS n]'
 
-# Set connection strings and get other settings from configuration file
-parser = ConfigParser.SafeConfigParser()
-parser.read('LibMgr.ini')
-metaServer = parser.get('Source', 'metaServer').replace('"', '')
-metaDb = parser.get('Source', 'metaDb')
-libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-libGDBDb = parser.get('Library', 'libGDBDb')
-libGDBSchema = parser.get('Library', 'libGDBSchema').upper()
-logPath = parser.get('Local', 'logPath')
-outLocalPath = parser.get('Local', 'outLocalPath')
-outLocalFGDB = parser.get('Local', 'outLocalFGDB')
-exchangeserver = parser.get('Notification', 'exchangeserver')
-emailFrom = parser.get('Notification', 'emailFrom')
-emailToList = parser.get('Notification', 'emailToList').replace('"','').split(',') # Parse items to python list object
-
-# set up python logging before the overall try..except structure of the script
-strDt = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") # string datetime for log file name
-logging.basicConfig(level=logging.NOTSET)
-logger = logging.getLogger(__name__)
-logger.propagate = False
-formatter = logging.Formatter('%(asctime)s %(message)s: %(module)s %(lineno)d', datefmt='%H:%M:%S') # create a logging format
-formatterMessageOnly = logging.Formatter('%(message)s') # create a logging format for message only
-# Info logger
-logInfFilePath = logPath + '/' + scriptName + ' DETAIL LOG ' + strDt + '.log' # this will create a new file for every run
-handler = logging.FileHandler(logInfFilePath, mode='w') # create an info log file handler
-handler.setFormatter(formatterMessageOnly)
-handler.setLevel(logging.INFO)
-logger.addHandler(handler)
-# Error and warning logger
-logErrFilePath = logPath + '/' + scriptName + ' ERROR LOG ' + strDt + '.log' # this will create a new file for every run
-handler = logging.FileHandler(logErrFilePath, mode='w') # create a warning/error log file handler
-handler.setFormatter(formatterMessageOnly)
-handler.setLevel(logging.WARNING)
-logger.addHandler(handler)
-# Console logger to send messages to the console as well
-consoleHandler = logging.StreamHandler()
-consoleHandler.setFormatter(formatterMessageOnly)
-consoleHandler.setLevel(logging.NOTSET)
-logger.addHandler(consoleHandler)
-
-lstErrCnt = [0,0]   # create running error/warning count for notification.
-                    #lstErrCnt[0] error count
-                    #lstErrCnt[1] warning count
-
-attachFilePathList = [logInfFilePath,logErrFilePath] # list used when we are writing to multiple log files
-lstRefreshed = []   # list for feature class names that get refreshed for notification
-sListRefreshed = ''
-
-
+# Load and validate the configuration once. A bad configuration stops the run here, before any work is done, with the
+#   problems written to stderr, a non-zero exit code and, if the notification options can be read, an email.
 try:
-    metaConnStr = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
-
-    sNotifyArgs = ''
-    sqlLstFC = ''
-    sqlLstFX = ''
-
-    ## Store arguments
-    editgdbtolib = False
-    covtolib = False
-    stgshptolib = False
-    stggdbtolib = False
-    libtoshp = False
-    force = False
-    ignorestatus = False
-
-    # strip first argument and convert the rest to lowercase
-    argv = sys.argv[1:] # delete first argument
-    i = 0
-    while i < len(argv):
-        argv[i] = argv[i].lower() # convert to lower case
-        i = i + 1
-
-    if 'editgdbtolib' in argv:
-        editgdbtolib = True
-        sNotifyArgs = 'EditGDBtoLIB'
-    if 'covtolib' in argv:
-        covtolib = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'COVtoLIB'
-        else:
-            sNotifyArgs = sNotifyArgs + ', COVtoLIB'
-    if 'stgshptolib' in argv:
-        stgshptolib = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'StgSHPtoLIB'
-        else:
-            sNotifyArgs = sNotifyArgs + ', StgSHPtoLIB'
-    if 'stggdbtolib' in argv:
-        stggdbtolib = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'StgGDBtoLIB'
-        else:
-            sNotifyArgs = sNotifyArgs + ', StgGDBtoLIB'
-    if 'libtoshp' in argv:
-        libtoshp = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'LIBtoSHP'
-        else:
-            sNotifyArgs = sNotifyArgs + ', LIBtoSHP'
-    if 'force' in argv:
-        force = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'FORCE'
-        else:
-            sNotifyArgs = sNotifyArgs + ', FORCE'
-    if '-fc' in argv:
-        iFc = argv.index('-fc') + 1
-        sqlLstFC = '(\'' + '\',\''.join(str(fc) for fc in argv[iFc].split(",")) + '\')'
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'Include: ' + sqlLstFC
-        else:
-            sNotifyArgs = sNotifyArgs + ', Process Only: ' + sqlLstFC
-    if '-fx' in argv:
-        iFc = argv.index('-fx') + 1
-        sqlLstFX = '(\'' + '\',\''.join(str(fc) for fc in argv[iFc].split(",")) + '\')'
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'Process All Excluding: ' + sqlLstFX
-        else:
-            sNotifyArgs = sNotifyArgs + ', Process All Excluding: ' + sqlLstFX
-    if 'ignorestatus' in argv:
-        ignorestatus = True
-        if len(sNotifyArgs) == 0:
-            sNotifyArgs = 'IGNORESTATUS'
-        else:
-            sNotifyArgs = sNotifyArgs + ', IGNORESTATUS'
-
-    logger.critical('Configuration Settings: Email to = ' + str(emailToList))
-    logger.critical('Program arguments: ' + sNotifyArgs + '\n')
-
-    logger.critical('** START *******************************************************************************************')
-
-    for l in logger.handlers: # switch logger formatter to full format
-        l.setFormatter(formatter)
-
-    outLocalFGDBPath = outLocalPath + '/' + outLocalFGDB
-    if arcpy.Exists(outLocalFGDBPath):
-        arcpy.Delete_management(outLocalFGDBPath)
-    arcpy.CreateFileGDB_management(outLocalPath, outLocalFGDB)
-    logger.info('SUCCESS - Replacing local staging file geodatabase.')
-
-    # Load metadata for processing
-    logMsg = 'Loading metadata for processing'
-    df = Metadata.LoadMetadata(metaConnStr, sqlLstFC, sqlLstFX) # load from SQL table
-    logger.info('SUCCESS - ' + logMsg)
-    logMsg = ''
-
-    # iterate metadata dataframe
-    i = 0
-    while (i < len(df)):
-        row = df.iloc[i]
-        libInput = row['LIBINPUT'].lower()
-        featName = row['feature'].lower()
-        libNameQual = libGDBDb + '.' + libGDBSchema + '.' + featName
-        libPathName = libGDBDirectConn + '/' + libNameQual
-        shpNameQual = featName + '.shp'
-
-        # GDB maintenance feature classes
-        if editgdbtolib and libInput == 'gdb std':
+    settings = LibMgrSettings.Load()
+except LibMgrSettings.LibMgrSettingsError as e:
+    sys.stderr.write('ERROR - Loading configuration - ' + str(e) + '\n')
+    notification = LibMgrSettings.GetNotification()
+    if __name__ == '__main__' and notification is not None:
+        try:
+            PC_Notification.SendEmail_ListAttach(notification[0], notification[1], notification[2],
+                                                 scriptName + ' ERROR - Loading configuration', str(e), [])
+        except Exception as e:
+            sys.stderr.write('ERROR - Sending configuration error notification - ' + str(e) + '\n')
+    sys.exit(1)
+libGDBDb = settings.libGDBDb
+libGDBServer = settings.libGDBServer
+stageGDBServer = settings.stageGDBServer
+stageGDBDb = settings.stageGDBDb
+stageGDBSchema = settings.stageGDBSchema
+libGDBSchema = settings.libGDBSchema.upper()
+logPath = settings.logPath
+outLocalPath = settings.outLocalPath
+outLocalFGDB = settings.outLocalFGDB
+syncManifest = settings.syncManifest
+exchangeserver = settings.exchangeserver
+emailFrom = settings.emailFrom
+emailToList = settings.emailToList
+
+if __name__ == '__main__': # guard so worker processes can import this module without running the job
+    # set up python logging before the overall try..except structure of the script
+    strDt = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") # string datetime for log file name
+    logging.basicConfig(level=logging.NOTSET)
+    logger = logging.getLogger(__name__)
+    logger.propagate = False
+    formatter = logging.Formatter('%(asctime)s %(message)s: %(module)s %(lineno)d', datefmt='%H:%M:%S') # create a logging format
+    formatterMessageOnly = logging.Formatter('%(message)s') # create a logging format for message only
+    # Info logger
+    logInfFilePath = logPath + '/' + scriptName + ' DETAIL LOG ' + strDt + '.log' # this will create a new file for every run
+    handler = logging.FileHandler(logInfFilePath, mode='w') # create an info log file handler
+    handler.setFormatter(formatterMessageOnly)
+    handler.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    # Error and warning logger
+    logErrFilePath = logPath + '/' + scriptName + ' ERROR LOG ' + strDt + '.log' # this will create a new file for every run
+    handler = logging.FileHandler(logErrFilePath, mode='w') # create a warning/error log file handler
+    handler.setFormatter(formatterMessageOnly)
+    handler.setLevel(logging.WARNING)
+    logger.addHandler(handler)
+    # Console logger to send messages to the console as well
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setFormatter(formatterMessageOnly)
+    consoleHandler.setLevel(logging.NOTSET)
+    logger.addHandler(consoleHandler)
+
+    lstErrCnt = [0,0]   # create running error/warning count for notification.
+                        #lstErrCnt[0] error count
+                        #lstErrCnt[1] warning count
+
+    attachFilePathList = [logInfFilePath,logErrFilePath] # list used when we are writing to multiple log files
+    lstRefreshed = []   # list for feature class names that get refreshed for notification
+    sListRefreshed = ''
+
+
+    try:
+        metaConnStr = settings.metaDBSqlConn
+
+        sNotifyArgs = ''
+        sqlLstFC = ''
+        sqlLstFX = ''
+
+        ## Store arguments
+        editgdbtolib = False
+        covtolib = False
+        stgshptolib = False
+        stggdbtolib = False
+        libtoshp = False
+        metaonly = False
+        force = False
+        ignorestatus = False
+        workers = 1
+
+        # strip first argument and convert the rest to lowercase
+        argv = sys.argv[1:] # delete first argument
+        i = 0
+        while i < len(argv):
+            argv[i] = argv[i].lower() # convert to lower case
+            i = i + 1
+
+        if 'editgdbtolib' in argv:
+            editgdbtolib = True
+            sNotifyArgs = 'EditGDBtoLIB'
+        if 'covtolib' in argv:
+            covtolib = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'COVtoLIB'
+            else:
+                sNotifyArgs = sNotifyArgs + ', COVtoLIB'
+        if 'stgshptolib' in argv:
+            stgshptolib = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'StgSHPtoLIB'
+            else:
+                sNotifyArgs = sNotifyArgs + ', StgSHPtoLIB'
+        if 'stggdbtolib' in argv:
+            stggdbtolib = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'StgGDBtoLIB'
+            else:
+                sNotifyArgs = sNotifyArgs + ', StgGDBtoLIB'
+        if 'metaonly' in argv:
+            metaonly = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'METAONLY'
+            else:
+                sNotifyArgs = sNotifyArgs + ', METAONLY'
+        if 'libtoshp' in argv:
+            libtoshp = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'LIBtoSHP'
+            else:
+                sNotifyArgs = sNotifyArgs + ', LIBtoSHP'
+        if 'force' in argv:
+            force = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'FORCE'
+            else:
+                sNotifyArgs = sNotifyArgs + ', FORCE'
+        if '-fc' in argv:
+            iFc = argv.index('-fc') + 1
+            sqlLstFC = '(\'' + '\',\''.join(str(fc) for fc in argv[iFc].split(",")) + '\')'
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'Include: ' + sqlLstFC
+            else:
+                sNotifyArgs = sNotifyArgs + ', Process Only: ' + sqlLstFC
+        if '-fx' in argv:
+            iFc = argv.index('-fx') + 1
+            sqlLstFX = '(\'' + '\',\''.join(str(fc) for fc in argv[iFc].split(",")) + '\')'
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'Process All Excluding: ' + sqlLstFX
+            else:
+                sNotifyArgs = sNotifyArgs + ', Process All Excluding: ' + sqlLstFX
+        if 'ignorestatus' in argv:
+            ignorestatus = True
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'IGNORESTATUS'
+            else:
+                sNotifyArgs = sNotifyArgs + ', IGNORESTATUS'
+        if '--workers' in argv:
+            iWk = argv.index('--workers') + 1
             try:
-                rsltUpdated = UpdateLib.EditGDBtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr)
-            except Exception as e:
-                pass # The error has already been logged and we want to continue with next feature class
+                workers = int(argv[iWk])
+            except (IndexError, ValueError) as e:
+                workers = 0
+            if workers < 1: # stop before any work is done
+                logger.error('ERROR - --WORKERS must be followed by a number of worker processes of at least 1')
+                logger.error(usage)
+                sys.exit(2)
+            if len(sNotifyArgs) == 0:
+                sNotifyArgs = 'Workers: ' + str(workers)
             else:
-                if rsltUpdated:
-                    lstRefreshed.append('EditGDBtoLIB - ' + libNameQual)
+                sNotifyArgs = sNotifyArgs + ', Workers: ' + str(workers)
+
+        logger.critical('Configuration Settings: Email to = ' + str(emailToList))
+        for warning in settings.lstWarnings:
+            logger.warning('WARNING - ' + warning)
+            lstErrCnt[1] += 1
+        logger.critical('Program arguments: ' + sNotifyArgs + '\n')
+
+        logger.critical('** START *******************************************************************************************')
+
+        for l in logger.handlers: # switch logger formatter to full format
+            l.setFormatter(formatter)
+
+        outLocalFGDBPath = settings.outLocalFGDBPath
+        if arcpy.Exists(outLocalFGDBPath):
+            arcpy.Delete_management(outLocalFGDBPath)
+        arcpy.CreateFileGDB_management(outLocalPath, outLocalFGDB)
+        logger.info('SUCCESS - Replacing local staging file geodatabase.')
+
+        # Open the sync state manifest of the last successful sync of each feature class
+        try:
+            SyncManifest.Open(syncManifest)
+        except Exception as e:
+            logger.warning('WARNING - Opening sync state manifest. Feature classes will be checked without it.', exc_info=True)
+            lstErrCnt[1] += 1
+        else:
+            logger.info('SUCCESS - Opening sync state manifest')
+
+        # Load metadata for processing
+        logMsg = 'Loading metadata for processing'
+        df = Metadata.LoadMetadata(metaConnStr, sqlLstFC, sqlLstFX) # load from SQL table
+        logger.info('SUCCESS - ' + logMsg)
+        logMsg = ''
 
-        # Stage shapefiles
-        if stgshptolib and libInput == 'shape std':
+        # Prefetch descriptive metadata and field descriptions so feature class metadata is built without per class queries
+        if editgdbtolib or stgshptolib or stggdbtolib or covtolib or metaonly:
             try:
-                rsltUpdated = UpdateLib.StgSHPtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr)
+                iCnt = Metadata.LoadMetadataCache(metaConnStr, list(df['feature']))
             except Exception as e:
-                pass # The error has already been logged and we want to continue with next feature class
+                logger.warning('WARNING - Prefetching feature class metadata. Metadata will be queried per feature class.', exc_info=True)
+                lstErrCnt[1] += 1
             else:
-                if rsltUpdated:
-                    lstRefreshed.append('StgSHPtoLIB - ' + libNameQual)
-
-        # Stage GDB feature classes
-        if stggdbtolib and libInput == 'gdb spec':
+                logger.info('SUCCESS - Prefetching feature class metadata (' + str(iCnt) + ' feature classes)')
+
+        # Snapshot geodatabase catalogs with one query per geodatabase so existence and date checks run in memory
+        #   list items are (server.database.schema for log, sql connection string, schema, versioned)
+        lstCatalogs = []
+        libGDBSqlConn = settings.libGDBSqlConn
+        lstCatalogs.append((libGDBServer + '.' + libGDBDb + '.' + libGDBSchema, libGDBSqlConn, libGDBSchema, False))
+        if stggdbtolib:
+            stageGDBSqlConn = settings.stageGDBSqlConn
+            lstCatalogs.append((stageGDBServer + '.' + stageGDBDb + '.' + stageGDBSchema, stageGDBSqlConn, stageGDBSchema, False))
+        if editgdbtolib:
+            for stdExpSrc in df[df['LIBINPUT'].str.lower() == 'gdb std']['STDEXPSOURCE'].dropna().str.lower().unique():
+                lstSrc = stdExpSrc.split('.') # STDEXPSOURCE is server.dbname.schema
+                if len(lstSrc) == 3:
+                    srcGDBSqlConn = LibMgrSettings.GetSqlConnStr(lstSrc[0], lstSrc[1])
+                    lstCatalogs.append((stdExpSrc, srcGDBSqlConn, lstSrc[2], True))
+        for catName, catSqlConn, catSchema, bVersioned in lstCatalogs:
             try:
-                rsltUpdated = UpdateLib.StgGDBtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr)
+                iCnt = GDBCatalog.LoadCatalog(catSqlConn, catSchema, bVersioned)
             except Exception as e:
-                pass # The error has already been logged and we want to continue with next feature class
+                logger.warning('WARNING - Loading geodatabase catalog snapshot. Using live checks for ' + catName, exc_info=True)
+                lstErrCnt[1] += 1
             else:
-                if rsltUpdated:
-                    lstRefreshed.append('StgGDBtoLIB - ' + libNameQual)
+                logger.info('SUCCESS - Loading geodatabase catalog snapshot for ' + catName + ' (' + str(iCnt) + ' feature classes)')
 
-        # Coverages
-        if covtolib and libInput == 'cover spec':
+        # Snapshot the library read grants with one query so privileges are only changed where they differ
+        if editgdbtolib or stgshptolib or stggdbtolib or covtolib:
             try:
-                rsltUpdated = UpdateLib.COVtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr)
+                iCnt = GDBPrivileges.LoadGrants(libGDBSqlConn, libGDBSchema)
             except Exception as e:
-                pass # The error has already been logged and we want to continue with next feature class
+                logger.warning('WARNING - Loading library privileges snapshot. Privileges will be read per feature class.', exc_info=True)
+                lstErrCnt[1] += 1
             else:
-                if rsltUpdated:
-                    lstRefreshed.append('COVtoLIB - ' + libNameQual)
+                logger.info('SUCCESS - Loading library privileges snapshot (' + str(iCnt) + ' tables with grants)')
 
-        # GDBLib feature classes to library shapefiles
-        if libtoshp:
+        # Snapshot staged and library shapefile directories with one listing per directory
+        lstShapeDirs = []
+        i = 0
+        while (i < len(df)):
+            row = df.iloc[i]
             try:
-                rsltUpdated = UpdateLib.LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt)
+                if stgshptolib and row['LIBINPUT'].lower() == 'shape std':
+                    lstShapeDirs.append(UpdateLib.GetStageShapePath(row))
+                if libtoshp:
+                    lstShapeDirs.append(UpdateLib.GetLibraryShapePath(row))
             except Exception as e:
-                pass # The error has already been logged and we want to continue with next feature class
-            else:
-                if rsltUpdated:
-                    lstRefreshed.append('LIBtoSHP - ' + shpNameQual)
-        i += 1
-
-    for l in logger.handlers: # switch logger formatter to message only
-        l.setFormatter(formatterMessageOnly)
-
-    logger.critical('**  END  *******************************************************************************************')
-
-    if len(lstRefreshed) > 0:
-        for fc in lstRefreshed:
-            sListRefreshed = sListRefreshed + '\t' + fc + '\n'
-    else:
-        sListRefreshed = '\tNone'
-
-    logger.critical('\nFeature Classes Refreshed:\n' + sListRefreshed)
+                pass # missing path in metadata. The error is logged when the feature class is processed.
+            i += 1
+        iCnt = FileCatalog.ScanDirectories(lstShapeDirs)
+        logger.info('SUCCESS - Scanning shapefile directories (' + str(len(FileCatalog.dictDirs)) + ' directories, ' + str(iCnt) + ' shapefiles)')
+
+        # program arguments and settings needed to process each feature class
+        dictOpts = {'editgdbtolib': editgdbtolib, 'stgshptolib': stgshptolib, 'stggdbtolib': stggdbtolib,
+                    'covtolib': covtolib, 'metaonly': metaonly, 'libtoshp': libtoshp, 'force': force,
+                    'ignorestatus': ignorestatus, 'deferlocked': settings.lockRetries > 0,
+                    'overlapexports': workers == 1 and settings.shapefileTransfer == 'local',
+                    'metaConnStr': metaConnStr, 'libGDBDb': libGDBDb, 'libGDBSchema': libGDBSchema}
+
+        lstDeferred = [] # rows deferred because their library feature classes are locked
+        if workers > 1:
+            # process feature classes in a pool of worker processes
+            logger.info('Processing feature classes with ' + str(workers) + ' worker processes')
+            LibMgrWorker.ProcessFeatureClassesInPool(df, dictOpts, workers, logger, lstErrCnt, lstRefreshed, outLocalPath, outLocalFGDB, lstDeferred)
+        else:
+            # iterate metadata dataframe
+            i = 0
+            while (i < len(df)):
+                row = df.iloc[i]
+                if LibMgrWorker.ProcessFeatureClass(row, dictOpts, logger, lstErrCnt, lstRefreshed, outLocalFGDBPath):
+                    lstDeferred.append(row)
+                UpdateLib.FinishPendingExports(1) # the newest shapefile keeps transferring while the next row starts
+                i += 1
+
+        # retry the locked feature classes with backoff now that everything else is done
+        if len(lstDeferred) > 0:
+            logMsg = 'Processing deferred locked feature classes'
+            LibMgrWorker.ProcessDeferredFeatureClasses(lstDeferred, dictOpts, logger, lstErrCnt, lstRefreshed, outLocalFGDBPath)
+            logMsg = ''
+
+        # finish the shapefile transfers still running at the end of processing
+        UpdateLib.FinishPendingExports()
+
+        # write the metadata table updates still queued at the end of processing
+        try:
+            Metadata.FlushLibraryMetadata(metaConnStr, logger)
+        except Exception as e:
+            logger.error('ERROR - Writing metadata table updates', exc_info=True)
+            lstErrCnt[0] += 1
+
+        for l in logger.handlers: # switch logger formatter to message only
+            l.setFormatter(formatterMessageOnly)
+
+        logger.critical('**  END  *******************************************************************************************')
+
+        if len(lstRefreshed) > 0:
+            for fc in lstRefreshed:
+                sListRefreshed = sListRefreshed + '\t' + fc + '\n'
+        else:
+            sListRefreshed = '\tNone'
+
+        logger.critical('\nFeature Classes Refreshed:\n' + sListRefreshed)
+
+        # send email notification of process completion with attached log files
+        if lstErrCnt[0] + lstErrCnt[1] > 0:
+            subject = scriptName + ' ERRORS or WARNINGS  Error(s):' + str(lstErrCnt[0]) + '    Warning(s):' + str(lstErrCnt[1])
+        else: 
+            subject = scriptName + ' SUCCESS'
+        tbmsg = 'Program arguments: ' + sNotifyArgs + '\n\nFeature classes refreshed:\n' + sListRefreshed
+        PC_Notification.SendEmail_ListAttach(exchangeserver, emailFrom, emailToList, subject, tbmsg, attachFilePathList)
+
+    except Exception as e:
+        # we only get here if there was an unhandled fatal error and we need to send a notification
+        # log the current logMsg and traceback message as an error to the log file
+        logger.error('ERROR - ' + logMsg, exc_info=True) # exc_info=True will add the traceback message
+        logger.error('Fatal error encountered. Exiting the process.')
+
+        # keep the metadata table updates of feature classes that were refreshed before the fatal error
+        try:
+            Metadata.FlushLibraryMetadata(metaConnStr, logger)
+        except Exception as e:
+            logger.error('ERROR - Writing metadata table updates', exc_info=True)
+            lstErrCnt[0] += 1
+
+        # Get the fatal error traceback object seperately to display in the email body
+        lstExcInfo = PC_Python.ParseTracebackInfo()
+        tbmsg = lstExcInfo[2] + '\n' + sListRefreshed
 
-    # send email notification of process completion with attached log files
-    if lstErrCnt[0] + lstErrCnt[1] > 0:
         subject = scriptName + ' ERRORS or WARNINGS  Error(s):' + str(lstErrCnt[0]) + '    Warning(s):' + str(lstErrCnt[1])
-    else: 
-        subject = scriptName + ' SUCCESS'
-    tbmsg = 'Program arguments: ' + sNotifyArgs + '\n\nFeature classes refreshed:\n' + sListRefreshed
-    PC_Notification.SendEmail_ListAttach(exchangeserver, emailFrom, emailToList, subject, tbmsg, attachFilePathList)
-
-except Exception as e:
-    # we only get here if there was an unhandled fatal error and we need to send a notification
-    # log the current logMsg and traceback message as an error to the log file
-    logger.error('ERROR - ' + logMsg, exc_info=True) # exc_info=True will add the traceback message
-    logger.error('Fatal error encountered. Exiting the process.')
-
-    # Get the fatal error traceback object seperately to display in the email body
-    lstExcInfo = PC_Python.ParseTracebackInfo()
-    tbmsg = lstExcInfo[2] + '\n' + sListRefreshed
 
-    subject = scriptName + ' ERRORS or WARNINGS  Error(s):' + str(lstErrCnt[0]) + '    Warning(s):' + str(lstErrCnt[1])
+        PC_Notification.SendEmail_ListAttach(exchangeserver, emailFrom, emailToList, subject, tbmsg, attachFilePathList)
 
-    PC_Notification.SendEmail_ListAttach(exchangeserver, emailFrom, emailToList, subject, tbmsg, attachFilePathList)
+    finally:
+        ConnectionPool.CloseAll() # close the pooled metadata and geodatabase connections
+        SyncManifest.Close()
@@ -0,0 +1,214 @@
+# LibMgrSettings.py - Load and validate the LibMgr.ini configuration once per process
+#
+# The configuration is read from LibMgr.ini in the script directory (not the current directory), so the job can be
+# started from anywhere. Every value is validated and typed when it is loaded, and the SQL Server and SDE connection
+# strings and local paths are built once. A bad configuration raises LibMgrSettingsError at startup with every problem
+# found, rather than failing on the first feature class that reads it. The options of features added after the original
+# configuration ([Local] syncManifest, the [Settings] options after geographicWKID and [Metadata] preserveExistingMetadata)
+# are optional. A missing or empty optional option gets a default that keeps the behavior from before the feature.
+#
+# Usage: settings = LibMgrSettings.Get() then settings.libGDBSqlConn, settings.geographicWKID, etc.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import ConfigParser
+import CloudFormats
+
+# custom error exception for all functions in this module
+class LibMgrSettingsError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class LibMgrSettingsWarning(Exception):
+    pass
+
+# default configuration file path (LibMgr.ini beside this module)
+iniPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LibMgr.ini')
+
+# settings loaded for this process, set by Load
+settings = None
+
+
+# Build a SQL Server trusted connection string
+def GetSqlConnStr(server, db):
+    return 'DRIVER={SQL Server};SERVER=' + server + ';DATABASE=' + db + ';Trusted_Connection=yes'
+
+
+# Build the SDE connection file path of a source maintenance geodatabase (logon user)
+def GetSdeConnFile(server, db):
+    return 'Database Connections/logon@' + db + '@' + server + '.sde'
+
+
+# Typed, validated settings from LibMgr.ini. Attribute names match the configuration option names.
+class Settings(object):
+    def __init__(self, path):
+        if not os.path.isfile(path):
+            raise LibMgrSettingsError('Configuration file not found - ' + path)
+        self.iniPath = path
+        self.lstErrors = []
+        self.parser = ConfigParser.SafeConfigParser()
+        self.parser.read(path)
+
+        # Source
+        self.stageGDBDirectConn = self.GetString('Source', 'stageGDBDirectConn')
+        self.stageGDBServer = self.GetString('Source', 'stageGDBServer')
+        self.stageGDBDb = self.GetString('Source', 'stageGDBDb')
+        self.stageGDBSchema = self.GetString('Source', 'stageGDBSchema')
+        self.metaServer = self.GetString('Source', 'metaServer').replace('"', '')
+        self.metaDb = self.GetString('Source', 'metaDb')
+        self.stageFilePath = self.GetString('Source', 'stageFilePath')
+        # Library
+        self.libGDBDirectConn = self.GetString('Library', 'libGDBDirectConn')
+        self.libGDBAdminConn = self.GetString('Library', 'libGDBAdminConn')
+        self.libGDBServer = self.GetString('Library', 'libGDBServer')
+        self.libGDBDb = self.GetString('Library', 'libGDBDb')
+        self.libGDBSchema = self.GetString('Library', 'libGDBSchema')
+        # Local
+        self.logPath = self.GetString('Local', 'logPath')
+        self.outLocalPath = self.GetString('Local', 'outLocalPath')
+        self.outLocalFGDB = self.GetString('Local', 'outLocalFGDB')
+        self.syncManifest = self.GetString('Local', 'syncManifest', self.outLocalPath + '/sync_manifest.sqlite')
+        # Settings
+        self.statePlaneWKID = self.GetInt('Settings', 'statePlaneWKID')
+        self.geographicWKID = self.GetInt('Settings', 'geographicWKID')
+        self.fingerprintMode = self.GetChoice('Settings', 'fingerprintMode', ['mtime', 'hash'], 'mtime')
+        self.deltaSync = self.GetBoolean('Settings', 'deltaSync', False)
+        self.deltaKeyField = self.GetString('Settings', 'deltaKeyField', '')
+        if self.deltaSync and self.deltaKeyField.strip() == '':
+            self.lstErrors.append('[Settings] deltaKeyField is required with deltaSync = true')
+        self.shapefileWriter = self.GetChoice('Settings', 'shapefileWriter', ['arcpy', 'native'], 'arcpy')
+        self.stagingBackend = self.GetChoice('Settings', 'stagingBackend', ['disk', 'memory'], 'disk')
+        self.memoryStagingMaxBytes = self.GetInt('Settings', 'memoryStagingMaxBytes', 104857600)
+        self.memoryStagingMaxRows = self.GetInt('Settings', 'memoryStagingMaxRows', 250000)
+        self.lockRetries = self.GetInt('Settings', 'lockRetries', 0) # 0 doesn't defer locked feature classes
+        self.lockRetryDelay = self.GetInt('Settings', 'lockRetryDelay', 60)
+        self.lockEscalateForce = self.GetBoolean('Settings', 'lockEscalateForce', False)
+        self.publishMode = self.GetChoice('Settings', 'publishMode', ['replace', 'shadow'], 'replace')
+        self.shapefileTransfer = self.GetChoice('Settings', 'shapefileTransfer', ['direct', 'local'], 'direct')
+        self.transferThreads = self.GetInt('Settings', 'transferThreads', 4)
+        self.shapefileIndex = self.GetBoolean('Settings', 'shapefileIndex', False)
+        self.cloudFormats = self.GetChoiceList('Settings', 'cloudFormats', ['geoparquet', 'flatgeobuf'], 'none') # python list
+        # Metadata
+        self.disclaimerFile = self.GetString('Metadata', 'disclaimerFile')
+        self.idCredit = self.GetString('Metadata', 'idCredit')
+        self.constraint_useLimit = self.GetString('Metadata', 'constraint_useLimit')
+        self.organization = self.GetString('Metadata', 'organization')
+        self.timeperd_current = self.GetString('Metadata', 'timeperd_current')
+        self.addrtype = self.GetString('Metadata', 'addrtype')
+        self.address = self.GetString('Metadata', 'address')
+        self.city = self.GetString('Metadata', 'city')
+        self.state = self.GetString('Metadata', 'state')
+        self.zip = self.GetString('Metadata', 'zip')
+        self.country = self.GetString('Metadata', 'country')
+        self.phone = self.GetString('Metadata', 'phone')
+        self.librarian = self.GetString('Metadata', 'librarian')
+        self.thumbnailsPath = self.GetString('Metadata', 'thumbnailsPath')
+        self.preserveExistingMetadata = self.GetBoolean('Metadata', 'preserveExistingMetadata', True)
+        # Notification
+        self.exchangeserver = self.GetString('Notification', 'exchangeserver')
+        self.emailFrom = self.GetString('Notification', 'emailFrom')
+        self.emailToList = self.GetString('Notification', 'emailToList').replace('"', '').split(',') # python list
+
+        # formats that can't be written here (no GDAL bindings or driver) are disabled once instead of failing for
+        #   every feature class. lstWarnings is logged by LibMgr.
+        self.lstWarnings = []
+        for fmt in list(self.cloudFormats):
+            try:
+                CloudFormats.CheckFormat(fmt)
+            except CloudFormats.CloudFormatsWarning as e:
+                self.cloudFormats.remove(fmt)
+                self.lstWarnings.append('[Settings] cloudFormats ' + fmt + ' is disabled - ' + str(e))
+
+        if len(self.lstErrors) > 0:
+            raise LibMgrSettingsError('Invalid configuration in ' + path + ' - ' + '; '.join(self.lstErrors))
+        self.parser = None
+
+        # connection strings and paths built once for the whole run
+        self.metaDBSqlConn = GetSqlConnStr(self.metaServer, self.metaDb)
+        self.libGDBSqlConn = GetSqlConnStr(self.libGDBServer, self.libGDBDb)
+        self.stageGDBSqlConn = GetSqlConnStr(self.stageGDBServer, self.stageGDBDb)
+        self.outLocalFGDBPath = self.outLocalPath + '/' + self.outLocalFGDB
+
+    # Get a string option. Missing or empty options are recorded as errors, unless the option is optional (has a
+    #   default), in which case the default is returned.
+    def GetString(self, section, option, default=None):
+        try:
+            value = self.parser.get(section, option)
+        except (ConfigParser.NoSectionError, ConfigParser.NoOptionError) as e:
+            if default is not None:
+                return default
+            self.lstErrors.append('[' + section + '] ' + option + ' is missing')
+            return ''
+        if value.strip() == '':
+            if default is not None:
+                return default
+            self.lstErrors.append('[' + section + '] ' + option + ' is empty')
+        return value
+
+    # Get an integer option
+    def GetInt(self, section, option, default=None):
+        value = self.GetString(section, option, None if default is None else str(default))
+        try:
+            return int(value)
+        except ValueError as e:
+            if value.strip() != '':
+                self.lstErrors.append('[' + section + '] ' + option + ' is not an integer')
+            return 0
+
+    # Get a boolean option (true/false, yes/no, on/off, 1/0)
+    def GetBoolean(self, section, option, default=None):
+        value = self.GetString(section, option, None if default is None else str(default))
+        if value.lower() not in ConfigParser.RawConfigParser._boolean_states:
+            if value.strip() != '':
+                self.lstErrors.append('[' + section + '] ' + option + ' is not true or false')
+            return False
+        return ConfigParser.RawConfigParser._boolean_states[value.lower()]
+
+    # Get an option that must be one of a list of lowercase choices. Returns the value in lowercase.
+    def GetChoice(self, section, option, lstChoices, default=None):
+        value = self.GetString(section, option, default).lower()
+        if value not in lstChoices and value.strip() != '':
+            self.lstErrors.append('[' + section + '] ' + option + ' must be one of ' + ', '.join(lstChoices))
+        return value
+
+    # Get a comma separated list of lowercase choices, or none for an empty list. Returns a python list.
+    def GetChoiceList(self, section, option, lstChoices, default=None):
+        value = self.GetString(section, option, default).lower()
+        if value.strip() in ['', 'none']:
+            return []
+        lstValues = [v.strip() for v in value.split(',')]
+        for v in lstValues:
+            if v not in lstChoices:
+                self.lstErrors.append('[' + section + '] ' + option + ' must be none or a list of ' + ', '.join(lstChoices))
+                return []
+        return lstValues
+
+
+# Read the notification options of a configuration that failed to load, so the failure can still be emailed.
+#   Returns (exchangeserver, emailFrom, emailToList) or None if they can't be read.
+def GetNotification(path=''):
+    try:
+        parser = ConfigParser.SafeConfigParser()
+        parser.read(path or iniPath)
+        return (parser.get('Notification', 'exchangeserver'), parser.get('Notification', 'emailFrom'),
+                parser.get('Notification', 'emailToList').replace('"', '').split(','))
+    except Exception as e:
+        return None
+
+
+# Load and validate the configuration for this process. Raises LibMgrSettingsError if it is invalid.
+def Load(path=''):
+    global settings
+    settings = Settings(path or iniPath)
+    return settings
+
+
+# Get the settings for this process, loading them on first use (ie. in a worker process)
+def Get():
+    if settings is None:
+        Load()
+    return settings
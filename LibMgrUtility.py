@@ -7,7 +7,10 @@
 
 import arcpy
 import PC_Python
-import ConfigParser
+import LibMgrSettings
+import numpy
+import Projection
+import GDBPrivileges
 
 # custom error exception for all functions in this module
 class LibMgrUtilityError(Exception):
@@ -19,49 +22,115 @@ class LibMgrUtilityWarning(Exception):
 
 
 # Grant or revoke proper permissions (parameter "grant" is True=Grant, False=Revoke)
+#   Only the differences from the current grants are applied, in one SQL transaction on sqlConnStr. Granting also
+#   revokes read access from managed library users that shouldn't have it (ie. the feature class became sensitive).
+#   bRefresh reads the current grants from the geodatabase instead of the startup snapshot (ie. after a replace).
+#   Returns the number of users changed.
 def SetFeatureClassPrivileges(sensitive, sensubgrp, sdeConn, dbName, schemaOwner
-                              , featName, grant):
+                              , featName, grant, sqlConnStr, bRefresh=False):
     funcName = 'SetFeatureClassPrivileges'
-    userName = []
-
-    if sensitive:
-        userName.append('SPREAD')
-        if sensubgrp.lower() <> 'none' and sensubgrp <> None:
-            if sensubgrp.lower() == 'cultres':
-                userName.append('cultres_read')
-            if sensubgrp.lower() == 'infotech':
-                userName.append('infotech_read')
-            if sensubgrp.lower() == 'cultres_natres':
-                userName.append('cultres_natres_read')
-            if sensubgrp.lower() == 'natres':
-                userName.append('natres_read')
-            if sensubgrp.lower() == 'wwconres':
-                userName.append('wwconres_read')
-    else:
-        userName.append('GISREAD')
-    inFeature = '"' + sdeConn + '\\' + dbName + '.' + schemaOwner + '.' + featName + '"'
+    setDesired = GDBPrivileges.GetDesiredUsers(sensitive, sensubgrp)
+    setCurrent = GDBPrivileges.GetGrants(featName, schemaOwner, sqlConnStr, bRefresh)
+
     if grant:
-        for user in userName:
-            arcpy.ChangePrivileges_management(in_dataset=inFeature, user=user, View="GRANT", Edit="AS_IS")
+        lstGrant = sorted(setDesired - setCurrent)
+        lstRevoke = sorted((setCurrent - setDesired) & set(GDBPrivileges.lstManagedUsers))
     else:
-        for user in userName:
-            arcpy.ChangePrivileges_management(in_dataset=inFeature, user=user, View="REVOKE", Edit="REVOKE")
-
-
-def PrepFieldsForLibrary(featPath):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    geographicWKID = parser.get('Settings', 'geographicWKID')
-
-    srGeographic = arcpy.SpatialReference(int(geographicWKID))
-
-    # create list of field names (uppercase)
+        lstGrant = []
+        lstRevoke = sorted(setDesired & setCurrent)
+    if len(lstGrant) + len(lstRevoke) == 0:
+        return 0 # grants are already correct
+
+    try:
+        GDBPrivileges.ApplyChanges(featName, schemaOwner, sqlConnStr, lstGrant, lstRevoke, not grant)
+    except Exception as e: # no permission to grant over the SQL connection. Use the geodatabase connection.
+        inFeature = '"' + sdeConn + '\\' + dbName + '.' + schemaOwner + '.' + featName + '"'
+        GDBPrivileges.ApplyChangesArcpy(inFeature, lstGrant, lstRevoke, not grant)
+    GDBPrivileges.UpdateSnapshot(featName, schemaOwner, sqlConnStr, (setCurrent | set(lstGrant)) - set(lstRevoke))
+    return len(lstGrant) + len(lstRevoke)
+
+
+# Get the number of rows in a feature class or table. Returns None if it can't be counted.
+def GetRowCount(featPath):
+    try:
+        return int(arcpy.GetCount_management(featPath).getOutput(0))
+    except Exception as e:
+        return None
+
+
+# Add and calculate LAT and LON fields on a point feature class in one pass. The State Plane coordinates are read as
+#   NumPy arrays, projected to geographic with the vectorized inverse Transverse Mercator and written back with
+#   ExtendTable. Returns False (nothing changed) if the feature class has no points or isn't Transverse Mercator on
+#   the same datum as srGeographic, so the caller can fall back to AddXY.
+def AddLatLonFields(featPath, desc, srGeographic):
+    params = Projection.GetTransverseMercatorParams(desc.spatialReference, srGeographic.datumName)
+    if params is None:
+        return False
+
+    arrXY = arcpy.da.FeatureClassToNumPyArray(featPath, ['OID@', 'SHAPE@X', 'SHAPE@Y'], skip_nulls=True)
+    if len(arrXY) == 0:
+        return False # no points to project. AddXY adds the empty fields.
+    arrLatLon = numpy.empty(len(arrXY), dtype=[('OID', numpy.int32), ('LAT', numpy.float64), ('LON', numpy.float64)])
+    arrLatLon['OID'] = arrXY['OID@']
+    arrLatLon['LAT'], arrLatLon['LON'] = Projection.InverseTransverseMercator(arrXY['SHAPE@X'], arrXY['SHAPE@Y'], params)
+    arcpy.da.ExtendTable(featPath, desc.OIDFieldName, arrLatLon, 'OID') # adds LAT/LON and writes them in one pass
+    return True
+
+
+# field name prefixes dropped from feature classes for the library (the first field starting with each prefix)
+lstDropFieldPrefixes = ['EDITOR_N', 'EDIT_D', 'GLOBALID'] # EDITOR_NAM or EDITOR_NAME, EDIT_DATE, GLOBALID
+
+
+# Plan the library schema of a feature class before it is copied to staging. Returns a dictionary with
+#   'dropFields' - field names dropped for the library
+#   'addLatLon' - True if LAT and LON fields are added (point feature classes without them)
+def GetSchemaPlan(featPath):
     lstFields = arcpy.ListFields(featPath)
     lstFieldNames = []
     for fld in lstFields:
         lstFieldNames.append(fld.name.lower()) # change all field names to lowercase
 
+    lstDropFields = []
+    for prefix in lstDropFieldPrefixes:
+        iRslt = PC_Python.FindStartsWithInStringList(lstFieldNames, prefix, False) # case insensitive compare
+        if iRslt >= 0:
+            lstDropFields.append(lstFields[iRslt].name)
+
+    desc = arcpy.Describe(featPath)
+    bLatLon = ((desc.shapeType == 'Point') or (desc.shapeType == 'MultiPoint')) and \
+        ('lat' not in lstFieldNames) and ('lon' not in lstFieldNames)
+    return {'dropFields': lstDropFields, 'addLatLon': bLatLon}
+
+
+# Build the field mappings that copy a feature class with its library schema (planned fields dropped). The copy keeps
+#   the source domains whatever the output field says, so they are removed from the staged copy by PrepFeatClassForLibrary.
+def GetLibraryFieldMappings(featPath, schemaPlan):
+    fieldMappings = arcpy.FieldMappings()
+    fieldMappings.addTable(featPath)
+    for fldName in schemaPlan['dropFields']:
+        ndx = fieldMappings.findFieldMapIndex(fldName)
+        if ndx >= 0:
+            fieldMappings.removeFieldMap(ndx)
+    return fieldMappings
+
+
+# Copy a source feature class to the staging workspace with its library schema applied by field mappings, so the
+#   staged copy is library ready in one write. Returns the schema plan to pass to PrepFieldsForLibrary.
+def CopyToStaging(srcFeatPath, outWrkspc, featName):
+    schemaPlan = GetSchemaPlan(srcFeatPath)
+    arcpy.FeatureClassToFeatureClass_conversion(srcFeatPath, outWrkspc, featName, '',
+                                                GetLibraryFieldMappings(srcFeatPath, schemaPlan))
+    return schemaPlan
+
+
+# Prepare the fields of a staged feature class for the library. If schemaPlan is given (the feature class was copied
+#   with CopyToStaging), the planned fields are already dropped and only LAT/LON are added.
+def PrepFieldsForLibrary(featPath, schemaPlan=None):
+    # Get settings loaded once from the configuration file
+    geographicWKID = LibMgrSettings.Get().geographicWKID
+
+    srGeographic = arcpy.SpatialReference(int(geographicWKID))
+
     ## if field PC_UID doesn't exist, add and calculate it
     #if 'pc_uid' not in lstFieldNames:
     #    # Add and set unique ID 'PC_UID' field
@@ -77,66 +146,51 @@ def PrepFieldsForLibrary(featPath):
 
     #    arcpy.CalculateField_management(in_table=featPath, field="PC_UID", \
     #        expression=strExp, expression_type="PYTHON_9.3")
-    
-    # if field starting with 'EDITOR_N' (EDITOR_NAM or EDITOR_NAME) exists, delete it
-    iRslt = PC_Python.FindStartsWithInStringList(lstFieldNames, 'EDITOR_N', False) # case insensitive compare
-    if iRslt >= 0:
-        dropField = lstFieldNames[iRslt]
-        arcpy.DeleteField_management(in_table=featPath,drop_field=dropField)
-    
-    # if field starting with 'EDIT_D' (EDIT_DATE) exists, delete it
-    iRslt = PC_Python.FindStartsWithInStringList(lstFieldNames, 'EDIT_D', False) # case insensitive compare
-    if iRslt >= 0:
-        dropField = lstFieldNames[iRslt]
-        arcpy.DeleteField_management(in_table=featPath,drop_field=dropField)
-    
-    # if field starting with 'GLOBALID' (GLOBALID) exists, delete it
-    iRslt = PC_Python.FindStartsWithInStringList(lstFieldNames, 'GLOBALID', False) # case insensitive compare
-    if iRslt >= 0:
-        dropField = lstFieldNames[iRslt]
-        arcpy.DeleteField_management(in_table=featPath,drop_field=dropField)
-    
-    # determine if feature class is point geometry type
-    bPt = False
+
+    # drop the EDITOR_N, EDIT_D and GLOBALID fields in one call if they weren't dropped by the copy
+    if schemaPlan is None:
+        schemaPlan = GetSchemaPlan(featPath)
+        if len(schemaPlan['dropFields']) > 0:
+            arcpy.DeleteField_management(in_table=featPath, drop_field=schemaPlan['dropFields'])
+
     desc = arcpy.Describe(featPath) # Get the shapefile feature class description
-    if (desc.shapeType == 'Point') or (desc.shapeType == 'MultiPoint'):
-        bPt = True
-    
-    # Add and calculate LAT and LON coordinate fields for point geometry type
-    if bPt: # check that this is a point feature type
-        if ('lat' not in lstFieldNames) and ('lon' not in lstFieldNames): # check that the fields are not already there
-            # Add lat/lon fields
-            # Prepare for adding XY point fields. Transform state plane to latitude/longitude
-            arcpy.env.outputCoordinateSystem = srGeographic # Set output XY coordinate system to WGS84
-            arcpy.env.geographicTransformations = "NAD_1983_HARN_To_WGS_1984" # Set geographic transformation
-            arcpy.AddXY_management(featPath) # add the new calculated Point_X and Point_Y fields
-            arcpy.env.outputCoordinateSystem = None # Clear output XY coordinate system
-            arcpy.env.geographicTransformations = None # Clear geographic transformation
-            # Recalculate previous lat/lon fields or add new if they don't exist
-            fndLAT = False
-            fndLON = False
-            for fld in desc.fields:
-                if fld.name == 'LAT':
-                    fndLAT = True
-                if fld.name == 'LON':
-                    fndLON = True
-            if not fndLAT:
-                arcpy.AddField_management(in_table=featPath, \
-                    field_name="LAT", field_type="DOUBLE", field_precision="", field_scale="", \
+
+    # Add and calculate LAT and LON coordinate fields for point geometry type without them
+    if schemaPlan['addLatLon']:
+        if AddLatLonFields(featPath, desc, srGeographic):
+            return
+        # Add lat/lon fields
+        # Prepare for adding XY point fields. Transform state plane to latitude/longitude
+        arcpy.env.outputCoordinateSystem = srGeographic # Set output XY coordinate system to WGS84
+        arcpy.env.geographicTransformations = "NAD_1983_HARN_To_WGS_1984" # Set geographic transformation
+        arcpy.AddXY_management(featPath) # add the new calculated Point_X and Point_Y fields
+        arcpy.env.outputCoordinateSystem = None # Clear output XY coordinate system
+        arcpy.env.geographicTransformations = None # Clear geographic transformation
+        # Recalculate previous lat/lon fields or add new if they don't exist
+        fndLAT = False
+        fndLON = False
+        for fld in desc.fields:
+            if fld.name == 'LAT':
+                fndLAT = True
+            if fld.name == 'LON':
+                fndLON = True
+        if not fndLAT:
+            arcpy.AddField_management(in_table=featPath, \
+                field_name="LAT", field_type="DOUBLE", field_precision="", field_scale="", \
+                field_length="", field_alias="", field_is_nullable="NULLABLE", \
+                field_is_required="NON_REQUIRED", field_domain="")
+        if not fndLON:
+            arcpy.AddField_management(in_table=featPath, \
+                    field_name="LON", field_type="DOUBLE", field_precision="", field_scale="", \
                     field_length="", field_alias="", field_is_nullable="NULLABLE", \
                     field_is_required="NON_REQUIRED", field_domain="")
-            if not fndLON:
-                arcpy.AddField_management(in_table=featPath, \
-                        field_name="LON", field_type="DOUBLE", field_precision="", field_scale="", \
-                        field_length="", field_alias="", field_is_nullable="NULLABLE", \
-                        field_is_required="NON_REQUIRED", field_domain="")
-            arcpy.CalculateField_management(in_table=featPath, field="LAT", \
-                expression="!POINT_Y!", expression_type="PYTHON", code_block="")
-            arcpy.CalculateField_management(in_table=featPath, field="LON", \
-                expression="!POINT_X!", expression_type="PYTHON", code_block="")
-            # Delete temp Point_X and Point_Y fields
-            arcpy.DeleteField_management(in_table=featPath, drop_field="POINT_Y")
-            arcpy.DeleteField_management(in_table=featPath, drop_field="POINT_X")
+        arcpy.CalculateField_management(in_table=featPath, field="LAT", \
+            expression="!POINT_Y!", expression_type="PYTHON", code_block="")
+        arcpy.CalculateField_management(in_table=featPath, field="LON", \
+            expression="!POINT_X!", expression_type="PYTHON", code_block="")
+        # Delete temp Point_X and Point_Y fields
+        arcpy.DeleteField_management(in_table=featPath, drop_field="POINT_Y")
+        arcpy.DeleteField_management(in_table=featPath, drop_field="POINT_X")
 
 
 def PrepFeatClassForLibrary(featPath, logger, lstErrCnt):
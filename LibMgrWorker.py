@@ -0,0 +1,288 @@
+# LibMgrWorker.py - Functions to process feature classes one at a time or in a pool of worker processes
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import arcpy
+import os
+import glob
+import logging
+import multiprocessing
+import UpdateLib
+import GDBCatalog
+import GDBPrivileges
+import LibMgrSettings
+import time
+import FileCatalog
+import SyncManifest
+import Metadata
+
+# custom error exception for all functions in this module
+class LibMgrWorkerError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class LibMgrWorkerWarning(Exception):
+    pass
+
+
+# Logging handler that keeps log records in a list so a worker process can hand them back to the main process
+class RecordListHandler(logging.Handler):
+    def __init__(self, lstRecords):
+        logging.Handler.__init__(self)
+        self.lstRecords = lstRecords
+
+    def emit(self, record):
+        if record.exc_info: # traceback objects can't be pickled, so render the traceback text now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage() # merge the args into the message so the record pickles cleanly
+        record.args = None
+        self.lstRecords.append(record)
+
+
+# per process state set by InitWorker in each pool worker process
+workerOpts = None
+workerLogger = None
+workerRecords = []
+workerFGDBPath = ''
+
+
+# library inputs (LIBINPUT) of metadata rows that have a library geodatabase feature class
+lstLibInputs = ['gdb std', 'shape std', 'gdb spec', 'cover spec']
+
+
+# Process a single metadata row for every program mode that applies to it.
+#   Returns True if the library refresh of the row was deferred because the library feature class has to be replaced
+#   but is locked by other users (dictOpts deferlocked), otherwise False. Metadata only and LIBtoSHP aren't deferred.
+#   dictOpts holds the program arguments (editgdbtolib, stgshptolib, stggdbtolib, covtolib, metaonly, libtoshp, ignorestatus,
+#   force), whether locked feature classes are deferred (deferlocked), whether LIBtoSHP transfers are finished while
+#   the next feature class is processed (overlapexports),
+#   the metadata connection string (metaConnStr) and the library database and schema names (libGDBDb, libGDBSchema)
+def ProcessFeatureClass(row, dictOpts, logger, lstErrCnt, lstRefreshed, localFGDBPath):
+    libInput = row['LIBINPUT'].lower()
+    featName = row['feature'].lower()
+    libNameQual = dictOpts['libGDBDb'] + '.' + dictOpts['libGDBSchema'] + '.' + featName
+    shpNameQual = featName + '.shp'
+    ignorestatus = dictOpts['ignorestatus']
+    force = dictOpts['force']
+    metaConnStr = dictOpts['metaConnStr']
+
+    bDeferred = False
+
+    # GDB maintenance feature classes
+    if dictOpts['editgdbtolib'] and libInput == 'gdb std':
+        try:
+            rsltUpdated = UpdateLib.EditGDBtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr, localFGDBPath,
+                                                 dictOpts['deferlocked'])
+        except UpdateLib.UpdateLibLocked as e:
+            bDeferred = True # the library feature class is locked by other users. Retried at the end of the run
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('EditGDBtoLIB - ' + libNameQual)
+
+    # Stage shapefiles
+    if dictOpts['stgshptolib'] and libInput == 'shape std':
+        try:
+            rsltUpdated = UpdateLib.StgSHPtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr, localFGDBPath,
+                                                dictOpts['deferlocked'])
+        except UpdateLib.UpdateLibLocked as e:
+            bDeferred = True # the library feature class is locked by other users. Retried at the end of the run
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('StgSHPtoLIB - ' + libNameQual)
+
+    # Stage GDB feature classes
+    if dictOpts['stggdbtolib'] and libInput == 'gdb spec':
+        try:
+            rsltUpdated = UpdateLib.StgGDBtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr, localFGDBPath,
+                                                dictOpts['deferlocked'])
+        except UpdateLib.UpdateLibLocked as e:
+            bDeferred = True # the library feature class is locked by other users. Retried at the end of the run
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('StgGDBtoLIB - ' + libNameQual)
+
+    # Coverages
+    if dictOpts['covtolib'] and libInput == 'cover spec':
+        try:
+            rsltUpdated = UpdateLib.COVtoLIB(row, ignorestatus, force, logger, lstErrCnt, metaConnStr, localFGDBPath,
+                                             dictOpts['deferlocked'])
+        except UpdateLib.UpdateLibLocked as e:
+            bDeferred = True # the library feature class is locked by other users. Retried at the end of the run
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('COVtoLIB - ' + libNameQual)
+
+    # Library feature class metadata only
+    if dictOpts['metaonly'] and libInput in lstLibInputs:
+        try:
+            rsltUpdated = UpdateLib.METAtoLIB(row, ignorestatus, logger, lstErrCnt, metaConnStr)
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('METAONLY - ' + libNameQual)
+
+    # GDBLib feature classes to library shapefiles
+    if dictOpts['libtoshp']:
+        try:
+            rsltUpdated = UpdateLib.LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt, localFGDBPath, dictOpts['overlapexports'])
+        except Exception as e:
+            pass # The error has already been logged and we want to continue with next feature class
+        else:
+            if rsltUpdated:
+                lstRefreshed.append('LIBtoSHP - ' + shpNameQual)
+
+    # release the staged copy published in this iteration and anything an incomplete update left in the in_memory
+    #   staging workspace, so memory stays bounded
+    UpdateLib.ReleaseStaged(featName)
+    try:
+        arcpy.Delete_management('in_memory')
+    except Exception as e:
+        pass
+
+    return bDeferred
+
+
+# Return the staging file geodatabase name for a worker process (ie. staging.gdb -> staging_1234.gdb)
+def GetWorkerFGDBName(outLocalFGDB, pid):
+    return os.path.splitext(outLocalFGDB)[0] + '_' + str(pid) + '.gdb'
+
+
+# Delete worker staging file geodatabases left behind by this or a previous run
+def DeleteWorkerFGDBs(outLocalPath, outLocalFGDB):
+    for fgdbPath in glob.glob(outLocalPath + '/' + os.path.splitext(outLocalFGDB)[0] + '_*.gdb'):
+        arcpy.Delete_management(fgdbPath)
+
+
+# Pool initializer. Runs once in each worker process to set up its logger and its own staging file geodatabase.
+def InitWorker(dictOpts, outLocalPath, outLocalFGDB, dictCatalogs, dictGrants, dictDirs, manifestPath, tplMetaCache):
+    global workerOpts, workerLogger, workerFGDBPath
+    workerOpts = dictOpts
+    GDBCatalog.dictCatalogs.update(dictCatalogs) # geodatabase catalog snapshots loaded by the main process
+    GDBPrivileges.dictGrants.update(dictGrants) # library grants snapshot loaded by the main process
+    FileCatalog.dictDirs.update(dictDirs) # shapefile directory snapshots loaded by the main process
+    Metadata.dictDescriptive.update(tplMetaCache[0]) # feature class metadata prefetched by the main process
+    Metadata.dictFieldDescriptions.update(tplMetaCache[1])
+    if manifestPath != '': # open this process's own connection to the sync state manifest
+        SyncManifest.Open(manifestPath)
+    SyncManifest.bQueueWrites = True # manifest writes are returned to the main process and written there
+    Metadata.flushInterval = None # metadata table updates are returned to the main process and written there
+
+    # log records are kept in memory and returned with each result so only the main process writes the log files
+    workerLogger = logging.getLogger('LibMgrWorker' + str(os.getpid()))
+    workerLogger.propagate = False
+    workerLogger.setLevel(logging.DEBUG)
+    workerLogger.addHandler(RecordListHandler(workerRecords))
+
+    # each worker stages its feature classes in a file geodatabase of its own
+    workerFGDB = GetWorkerFGDBName(outLocalFGDB, os.getpid())
+    workerFGDBPath = outLocalPath + '/' + workerFGDB
+    if arcpy.Exists(workerFGDBPath):
+        arcpy.Delete_management(workerFGDBPath)
+    arcpy.CreateFileGDB_management(outLocalPath, workerFGDB)
+
+
+# Pool task. Process one metadata row in a worker process.
+#   Returns a tuple of the log records, the [error, warning] counts, the refreshed feature class list, the
+#   queued metadata table updates and manifest writes for the row and whether the row was deferred
+def ProcessFeatureClassTask(row):
+    del workerRecords[:] # clear records from the previous task
+    del Metadata.lstPendingUpdates[:]
+    SyncManifest.ClearPendingWrites()
+    lstErrCnt = [0,0]
+    lstRefreshed = []
+    bDeferred = False
+    try:
+        bDeferred = ProcessFeatureClass(row, workerOpts, workerLogger, lstErrCnt, lstRefreshed, workerFGDBPath)
+    except Exception as e:
+        workerLogger.error('ERROR - Processing feature class in worker process - ' + row['feature'].lower(), exc_info=True)
+        lstErrCnt[0] += 1
+    return (list(workerRecords), lstErrCnt, lstRefreshed, list(Metadata.lstPendingUpdates),
+            list(SyncManifest.lstPendingWrites), bDeferred)
+
+
+# Process all metadata rows in a pool of worker processes.
+#   Log records, error/warning counts, the refreshed list, metadata table updates and manifest writes from the workers
+#   are merged into the main process in metadata order as each row finishes, so the main process is the only writer
+#   of the metadata table and the manifest. Deferred rows are appended to lstDeferred.
+def ProcessFeatureClassesInPool(df, dictOpts, workers, logger, lstErrCnt, lstRefreshed, outLocalPath, outLocalFGDB, lstDeferred):
+    lstRows = [df.iloc[i] for i in range(len(df))]
+    if SyncManifest.IsOpen():
+        manifestPath = SyncManifest.manifestPath
+    else:
+        manifestPath = ''
+    tplMetaCache = (Metadata.dictDescriptive, Metadata.dictFieldDescriptions)
+    pool = multiprocessing.Pool(workers, InitWorker, (dictOpts, outLocalPath, outLocalFGDB, GDBCatalog.dictCatalogs, GDBPrivileges.dictGrants, FileCatalog.dictDirs, manifestPath, tplMetaCache))
+    try:
+        for i, (lstRecords, lstWrkErrCnt, lstWrkRefreshed, lstWrkMetaUpdates, lstWrkManifestWrites, bDeferred) in enumerate(pool.imap(ProcessFeatureClassTask, lstRows, 1)):
+            for record in lstRecords:
+                logger.handle(record)
+            try:
+                SyncManifest.ApplyWrites(lstWrkManifestWrites)
+            except Exception as e:
+                logger.warning('WARNING - Recording sync state in manifest - ' + lstRows[i]['feature'].lower(), exc_info=True)
+                lstErrCnt[1] += 1
+            if bDeferred:
+                lstDeferred.append(lstRows[i])
+            lstErrCnt[0] += lstWrkErrCnt[0]
+            lstErrCnt[1] += lstWrkErrCnt[1]
+            lstRefreshed.extend(lstWrkRefreshed)
+            Metadata.lstPendingUpdates.extend(lstWrkMetaUpdates)
+            if len(Metadata.lstPendingUpdates) >= Metadata.flushInterval:
+                try:
+                    Metadata.FlushLibraryMetadata(dictOpts['metaConnStr'], logger)
+                except Exception as e:
+                    logger.warning('WARNING - Writing metadata table updates. Retrying at the end of the run', exc_info=True)
+                    lstErrCnt[1] += 1
+    finally:
+        pool.close()
+        pool.join()
+        try:
+            DeleteWorkerFGDBs(outLocalPath, outLocalFGDB)
+        except Exception as e:
+            logger.warning('WARNING - Deleting worker staging file geodatabases', exc_info=True)
+            lstErrCnt[1] += 1
+
+
+# Retry the rows deferred because their library feature classes were locked. Each retry waits twice as long as the
+#   one before, starting at lockRetryDelay seconds. Rows still locked after lockRetries retries are processed with
+#   FORCE (disconnecting the users) if the FORCE argument or lockEscalateForce is set, otherwise they are skipped.
+def ProcessDeferredFeatureClasses(lstDeferred, dictOpts, logger, lstErrCnt, lstRefreshed, localFGDBPath):
+    settings = LibMgrSettings.Get()
+    dictRetryOpts = dict(dictOpts, metaonly=False) # metadata only already ran for the deferred rows
+    attempt = 0
+    while len(lstDeferred) > 0 and attempt < settings.lockRetries:
+        delay = settings.lockRetryDelay * 2 ** attempt
+        logger.info('Retrying ' + str(len(lstDeferred)) + ' locked feature classes in ' + str(delay) + ' seconds')
+        time.sleep(delay)
+        lstLocked = []
+        for row in lstDeferred:
+            if ProcessFeatureClass(row, dictRetryOpts, logger, lstErrCnt, lstRefreshed, localFGDBPath):
+                lstLocked.append(row)
+        lstDeferred[:] = lstLocked
+        attempt += 1
+
+    if len(lstDeferred) == 0:
+        return
+    if dictOpts['force'] or settings.lockEscalateForce:
+        dictForceOpts = dict(dictRetryOpts, force=True, deferlocked=False)
+        for row in lstDeferred:
+            logger.warning('WARNING - Library feature class still locked after retries. Disconnecting users - ' + row['feature'].lower())
+            lstErrCnt[1] += 1
+            ProcessFeatureClass(row, dictForceOpts, logger, lstErrCnt, lstRefreshed, localFGDBPath)
+    else:
+        for row in lstDeferred:
+            logger.warning('WARNING - Library feature class still locked after retries. Skipping refresh - ' + row['feature'].lower())
+            lstErrCnt[1] += 1
@@ -9,7 +9,7 @@
 #                                   rather than multiple config sections
 ######################################################################################################################
 
-from pyodbc import connect as odbcconn
+import ConnectionPool
 from pandas import read_sql_query as readsqlqry # pandas 0.19.x
 import LibMgrUtility
 import PC_Python
@@ -17,9 +17,12 @@ import PC_Geoprocessing
 import xml.etree.ElementTree as ET
 import os
 import arcpy
-import ConfigParser
+import LibMgrSettings
 import datetime
-import base64
+import copy
+import hashlib
+import SyncManifest
+import MetadataAssets
 
 # custom error exception for all functions in this module
 class MetadataError(Exception):
@@ -31,7 +34,6 @@ class MetadataWarning(Exception):
 
 # Read metadata into pandas DataFrame object. Returns DataFrame object
 def LoadMetadata(metaConnStr, sqlLstFC, sqlLstFX):
-    conn = odbcconn(metaConnStr)
     metaqry = 'SELECT COVER_NAME AS \'ndx\', COVER_NAME AS feature' + \
         ', [PATH] AS updatepath, SUBSTRING([PATH], LEN([PATH]) - 6, 6) AS subpath' +\
         ', REPLACE(REPLACE([PATH],\'mars1\',\'libstage\mars1\'),\'sdcp\',\'libstage\\sdcp\') AS stagepath' +\
@@ -53,40 +55,65 @@ def LoadMetadata(metaConnStr, sqlLstFC, sqlLstFX):
 
     metaqry = metaqry + ' ORDER BY COVER_NAME' # set sort order last
 
-    df = None
-    df = readsqlqry(metaqry, conn, index_col = 'ndx') # pandas 0.19.1 load query result to pandas dataframe
+    # pandas 0.19.1 load query result to pandas dataframe
+    df = ConnectionPool.Run(metaConnStr, lambda conn: readsqlqry(metaqry, conn, index_col = 'ndx'))
 
     return df
 
 
-# Update single feature class file size and last modified dates in the metadata
+# parameterized update of one feature class's dates and shapefile size in the metadata table.
+#   NULL parameters keep the current value.
+updateMetadataSql = 'UPDATE [dbo].[metadata] SET ' +\
+    '[DATETOUCHED] = COALESCE(?, [DATETOUCHED]), [SHPDATE] = COALESCE(?, [SHPDATE]), ' +\
+    '[COVDATE] = COALESCE(?, [COVDATE]), [GDBDATE] = COALESCE(?, [GDBDATE]), ' +\
+    '[SHAPEFILESIZE] = COALESCE(?, [SHAPEFILESIZE]) WHERE [COVER_NAME] = ?'
+
+# metadata table updates waiting to be written, as parameter tuples for updateMetadataSql
+lstPendingUpdates = []
+flushInterval = 50 # pending updates that trigger a flush. None to only flush when FlushLibraryMetadata is called.
+
+
+# Convert a metadata date value to a datetime parameter, or None if it isn't a valid date
+def GetDateParam(value):
+    strDt = str(value)
+    if not PC_Python.isdate(strDt): # if this is a valid date, update the field. Otherwise, don't update.
+        return None
+    return datetime.datetime.strptime(strDt[:19], '%Y-%m-%d %H:%M:%S')
+
+
+# Queue an update of a single feature class file size and last modified dates in the metadata.
+#   Updates are written in batches by FlushLibraryMetadata, every flushInterval updates and at the end of the run.
 def UpdateLibraryMetadata(dfFeat, connStr, logger):
     funcName = 'UpdateLibraryMetadata'
-    featName = '\'' + dfFeat['feature'].lower() + '\''
-
-    # build sql update statement
-    strSql = 'UPDATE [dbo].[metadata] SET '
-    strDt = str(dfFeat['DATETOUCHED'])
-    if PC_Python.isdate(strDt):     # if this is a valid date, update the field. Otherwise, don't update.
-        strSql = strSql + '[DATETOUCHED] = \'' + strDt + '\','
-    strDt = str(dfFeat['SHPDATE'])
-    if PC_Python.isdate(strDt):     # if this is a valid date, update the field. Otherwise, don't update.
-        strSql = strSql + '[SHPDATE] = \'' + strDt + '\','
-    strDt = str(dfFeat['COVDATE'])
-    if PC_Python.isdate(strDt):     # if this is a valid date, update the field. Otherwise, don't update.
-        strSql = strSql + '[COVDATE] = \'' + strDt + '\','
-    strDt = str(dfFeat['GDBDATE'])
-    if PC_Python.isdate(strDt):     # if this is a valid date, update the field. Otherwise, don't update.
-        strSql = strSql + '[GDBDATE] = \'' + strDt + '\','
-    shpSize = str(dfFeat['SHAPEFILESIZE'])
-    strSql = strSql + '[SHAPEFILESIZE] = ' + shpSize + ' WHERE [COVER_NAME] = ' + featName
-
-    conn = odbcconn(connStr)
-    curs = conn.cursor()
-    curs.execute(strSql)
-    curs.commit()
-    curs.close()
-    conn.close()
+    try:
+        shpSize = float(dfFeat['SHAPEFILESIZE'])
+    except (TypeError, ValueError) as e:
+        shpSize = None
+    if shpSize is not None and shpSize != shpSize: # NaN
+        shpSize = None
+    lstPendingUpdates.append((GetDateParam(dfFeat['DATETOUCHED']), GetDateParam(dfFeat['SHPDATE']),
+                              GetDateParam(dfFeat['COVDATE']), GetDateParam(dfFeat['GDBDATE']),
+                              shpSize, dfFeat['feature'].lower()))
+
+    if flushInterval is not None and len(lstPendingUpdates) >= flushInterval:
+        FlushLibraryMetadata(connStr, logger)
+
+
+# Write all queued metadata table updates with one parameterized executemany and one commit.
+#   Updates stay queued if the write fails. Returns the number of feature classes updated.
+def FlushLibraryMetadata(connStr, logger=None):
+    if len(lstPendingUpdates) == 0:
+        return 0
+    lstParams = list(lstPendingUpdates)
+    with ConnectionPool.Connection(connStr) as conn:
+        curs = conn.cursor()
+        curs.executemany(updateMetadataSql, lstParams)
+        conn.commit()
+        curs.close()
+    del lstPendingUpdates[:len(lstParams)]
+    if logger:
+        logger.info('SUCCESS - Writing ' + str(len(lstParams)) + ' metadata table updates')
+    return len(lstParams)
 
 
 # build a concatenated string of multiple metadata values
@@ -142,42 +169,136 @@ def BuildMetadataSupString(df_row):
     return supField
 
 
-# Update feature class metadata
-def UpdateFCMetadata(fcPathName, metaConnStr):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    disclaimerFile = parser.get('Metadata', 'disclaimerFile')
-    idCredit = parser.get('Metadata', 'idCredit')
-    constraint_useLimit = parser.get('Metadata', 'constraint_useLimit')
-    organization = parser.get('Metadata', 'organization')
-    timeperd_current = parser.get('Metadata', 'timeperd_current')
-    addrtype = parser.get('Metadata', 'addrtype')
-    address = parser.get('Metadata', 'address')
-    city = parser.get('Metadata', 'city')
-    state = parser.get('Metadata', 'state')
-    zip = parser.get('Metadata', 'zip')
-    country = parser.get('Metadata', 'country')
-    phone = parser.get('Metadata', 'phone')
-    librarian = parser.get('Metadata', 'librarian')
-    thumbnailsPath = parser.get('Metadata', 'thumbnailsPath')
-
-    num_elements = 0
-    featName = fcPathName.split('.')[-1]
-    conn = odbcconn(metaConnStr)
-    metaqry = 'SELECT [FULL_NAME],[COVER_NAME],[ABSTRACT],[UPDATEDATE],[OWNERNAME]' +\
-                    ',[PATH],[METAACCESS],[ONMAINT],[MAINTFREQ],[KNOWNERROR],[LINEAGE]' +\
-                    ',[DOMAIN],[RECTIFIED],[MAINTORG],[MAINTDESC],[LIBINPUT],[SOURCNAME]' +\
-                    ',[SOURCCONTACT],[SOURCDOCNAME],[SOURCDATE],[SOURCSCALE],[SOURCFORMAT]' +\
-                    ',[SOUR2NAME],[SOUR2CONTACT],[SOUR2DOCNAME],[SOUR2DATE],[SOUR2SCALE]' +\
-                    ',[SOUR2FORMAT],[ONMG],[MGLAYERNAME],[MGSCALELOW],[MGSCALEHIGH] ' +\
-                    'FROM [dbo].[metadata] WHERE [COVER_NAME] = \'' + featName + '\''
-    df_FCMeta = readsqlqry(metaqry, conn) # pandas 0.19.1 load query result to pandas dataframe
-    df_row = df_FCMeta.iloc[0]
-
-    qry = 'SELECT [FieldName] AS \'ndx\',[FieldName],[Description] FROM [dbo].[master_metafield] WHERE [CoverName] = \'' + featName + '\''
-    df_fieldMeta = readsqlqry(qry, conn, index_col = 'ndx') # pandas 0.19.1 load query result to pandas dataframe
-
+# descriptive metadata columns used to build feature class metadata
+lstDescriptiveColumns = ['FULL_NAME', 'COVER_NAME', 'ABSTRACT', 'UPDATEDATE', 'OWNERNAME', 'PATH', 'METAACCESS', 'ONMAINT',
+                         'MAINTFREQ', 'KNOWNERROR', 'LINEAGE', 'DOMAIN', 'RECTIFIED', 'MAINTORG', 'MAINTDESC', 'LIBINPUT',
+                         'SOURCNAME', 'SOURCCONTACT', 'SOURCDOCNAME', 'SOURCDATE', 'SOURCSCALE', 'SOURCFORMAT',
+                         'SOUR2NAME', 'SOUR2CONTACT', 'SOUR2DOCNAME', 'SOUR2DATE', 'SOUR2SCALE', 'SOUR2FORMAT', 'ONMG',
+                         'MGLAYERNAME', 'MGSCALELOW', 'MGSCALEHIGH']
+
+maxInParams = 1000 # feature names per IN list when prefetching (SQL Server allows 2100 parameters per statement)
+
+# descriptive metadata and field descriptions prefetched by LoadMetadataCache, keyed by lowercase COVER_NAME
+#   dictDescriptive values are {column: value}, dictFieldDescriptions values are {field name: description}
+dictDescriptive = {}
+dictFieldDescriptions = {}
+
+
+# Prefetch the descriptive metadata and field descriptions of a list of feature classes with one query per table
+#   (per maxInParams feature classes). Returns the number of feature classes with descriptive metadata.
+def LoadMetadataCache(metaConnStr, lstFeatNames):
+    lstFeatNames = [featName.lower() for featName in lstFeatNames]
+    for i in range(0, len(lstFeatNames), maxInParams):
+        lstChunk = lstFeatNames[i:i + maxInParams]
+        sqlIn = '(' + ','.join(['?'] * len(lstChunk)) + ')'
+
+        metaqry = 'SELECT ' + ','.join('[' + col + ']' for col in lstDescriptiveColumns) + \
+            ' FROM [dbo].[metadata] WHERE [COVER_NAME] IN ' + sqlIn
+        qry = 'SELECT [CoverName],[FieldName],[Description] FROM [dbo].[master_metafield] WHERE [CoverName] IN ' + sqlIn
+        df, df_fieldMeta = ConnectionPool.Run(metaConnStr, lambda conn: (readsqlqry(metaqry, conn, params=lstChunk),
+                                                                         readsqlqry(qry, conn, params=lstChunk)))
+        for j in range(len(df)):
+            df_row = df.iloc[j].to_dict()
+            dictDescriptive[df_row['COVER_NAME'].lower()] = df_row
+        for coverName, fieldName, description in zip(df_fieldMeta['CoverName'], df_fieldMeta['FieldName'], df_fieldMeta['Description']):
+            dictFieldDescriptions.setdefault(coverName.lower(), {})[fieldName] = description
+    return len(dictDescriptive)
+
+
+# Query the descriptive metadata and field descriptions of one feature class that wasn't prefetched.
+#   Returns a tuple of the descriptive metadata {column: value} and the field descriptions {field name: description}
+def QueryFCMetadata(featName, metaConnStr):
+    metaqry = 'SELECT ' + ','.join('[' + col + ']' for col in lstDescriptiveColumns) + \
+        ' FROM [dbo].[metadata] WHERE [COVER_NAME] = ?'
+    qry = 'SELECT [FieldName],[Description] FROM [dbo].[master_metafield] WHERE [CoverName] = ?'
+    # pandas 0.19.1 load query results to pandas dataframes
+    df_FCMeta, df_fieldMeta = ConnectionPool.Run(metaConnStr, lambda conn: (readsqlqry(metaqry, conn, params=[featName]),
+                                                                            readsqlqry(qry, conn, params=[featName])))
+    df_row = df_FCMeta.iloc[0].to_dict()
+    return (df_row, dict(zip(df_fieldMeta['FieldName'], df_fieldMeta['Description'])))
+
+
+# static metadata subtrees built once per process from the [Metadata] settings by GetTemplates.
+#   Each feature class gets deep copies with only its own values filled in.
+dictTemplates = {}
+
+
+# Build an element path of nested subelements under a parent and return the last element
+def SubElementPath(parentEl, path, text=None):
+    el = parentEl
+    for tag in path.split('/'):
+        el = ET.SubElement(el, tag)
+    if text is not None:
+        el.text = text
+    return el
+
+
+# Get the static metadata subtrees (built on first use). Per class elements are left empty to be filled in.
+def GetTemplates():
+    if len(dictTemplates) > 0:
+        return dictTemplates
+    settings = LibMgrSettings.Get()
+
+    # dataIdInfo credit and use limit elements
+    idCreditEl = ET.Element('idCredit')
+    idCreditEl.text = settings.idCredit
+    resConstEl = ET.Element('resConst')
+    SubElementPath(resConstEl, 'Consts/useLimit', settings.constraint_useLimit)
+
+    # idInfo: use constraint, citation, time period, description, keywords, point of contact and status
+    idInfoEl = ET.Element('idInfo')
+    SubElementPath(idInfoEl, 'useconst', MetadataAssets.GetDisclaimer())
+    citationEl = ET.SubElement(idInfoEl, 'citation')
+    citeinfoEl = ET.SubElement(citationEl, 'citeinfo')
+    ET.SubElement(citationEl, 'onlink')
+    SubElementPath(citeinfoEl, 'origin', settings.organization)
+    ET.SubElement(citeinfoEl, 'pubdate')
+    timeperdEl = ET.SubElement(idInfoEl, 'timeperd')
+    SubElementPath(timeperdEl, 'current', settings.timeperd_current)
+    SubElementPath(timeperdEl, 'timeinfo/sngdate/caldate')
+    descriptEl = ET.SubElement(idInfoEl, 'descript')
+    for tag in ['abstract', 'purpose', 'supplinf']:
+        ET.SubElement(descriptEl, tag)
+    SubElementPath(idInfoEl, 'keywords/theme/themekey')
+    cntinfoEl = SubElementPath(idInfoEl, 'ptcontac/cntinfo')
+    cntperpEl = ET.SubElement(cntinfoEl, 'cntperp')
+    cntaddrEl = ET.SubElement(cntinfoEl, 'cntaddr')
+    ET.SubElement(cntinfoEl, 'cntvoice')
+    ET.SubElement(cntperpEl, 'cntper')
+    SubElementPath(cntperpEl, 'cntorg', settings.organization)
+    AddAddressElements(cntaddrEl, settings)
+    SubElementPath(cntinfoEl, 'cntvoice', settings.phone)
+    statusEl = ET.SubElement(idInfoEl, 'status')
+    ET.SubElement(statusEl, 'progress')
+    ET.SubElement(statusEl, 'update')
+
+    # metainfo point of contact
+    metainfoEl = ET.Element('metainfo')
+    metcEl = ET.SubElement(metainfoEl, 'metc')
+    cntinfoEl = ET.SubElement(metcEl, 'cntinfo')
+    cntorgpEl = ET.SubElement(cntinfoEl, 'cntorgp')
+    cntaddrEl = ET.SubElement(metcEl, 'cntaddr')
+    SubElementPath(cntorgpEl, 'cntper', settings.librarian)
+    ET.SubElement(cntorgpEl, 'cntorg')
+    AddAddressElements(cntaddrEl, settings)
+    SubElementPath(cntinfoEl, 'cntvoice', settings.phone)
+
+    dictTemplates.update({'idCredit': idCreditEl, 'resConst': resConstEl, 'idInfo': idInfoEl, 'metainfo': metainfoEl})
+    return dictTemplates
+
+
+# Add the contact address elements from the [Metadata] settings to a cntaddr element
+def AddAddressElements(cntaddrEl, settings):
+    SubElementPath(cntaddrEl, 'addrtype', settings.addrtype)
+    SubElementPath(cntaddrEl, 'address', settings.address)
+    SubElementPath(cntaddrEl, 'city', settings.city)
+    SubElementPath(cntaddrEl, 'state', settings.state)
+    SubElementPath(cntaddrEl, 'postal', settings.zip)
+    SubElementPath(cntaddrEl, 'country', settings.country)
+
+
+# Export the existing metadata of a feature class and return the parsed root element
+def ExportFCMetadata(fcPathName, xmlfile):
     arcpy.env.overwriteOutput = True
 
     #    install location
@@ -186,254 +307,98 @@ def UpdateFCMetadata(fcPathName, metaConnStr):
     #    stylesheet to use
     copy_xslt = r'{0}'.format(os.path.join(dir,'Metadata\Stylesheets\gpTools\exact copy of.xslt'))
 
-    #    temporary XML file
-    xmlfile = arcpy.CreateScratchName('.xml',workspace=arcpy.env.scratchFolder)
-    
     # export xml
     arcpy.XSLTransform_conversion(fcPathName, copy_xslt, xmlfile, '')
-    
+
     # read in XML
-    tree = ET.parse(xmlfile)
-    root = tree.getroot()
+    return ET.parse(xmlfile).getroot()
+
+
+# Build a new metadata document for a feature class without exporting its existing metadata.
+#   The field list comes from the feature class so field descriptions can be attached.
+def NewFCMetadata(fcPathName):
+    root = ET.Element('metadata')
+    ET.SubElement(root, 'dataIdInfo')
+    detailedEl = SubElementPath(root, 'eainfo/detailed')
+    for fld in arcpy.ListFields(fcPathName):
+        SubElementPath(detailedEl, 'attr/attrlabl', fld.name)
+    return root
+
+
+# elements written by BuildFCMetadata, removed from an exported document before they are built again
+lstDataIdInfoTags = ['idPurp', 'idAbs', 'accconst', 'idCredit', 'resMaint', 'resConst', 'searchKeys'] # under dataIdInfo
+lstRootTags = ['idInfo', 'metainfo'] # under the root
+lstAttrTags = ['attrdef', 'attrdefs'] # under each eainfo/detailed/attr
+
+
+# Remove the child elements with any of a list of tags from an element
+def RemoveChildren(parentEl, lstTags):
+    for childEl in list(parentEl):
+        if childEl.tag in lstTags:
+            parentEl.remove(childEl)
+
+
+# Remove the elements BuildFCMetadata writes from a metadata document, so a document exported from a feature class
+#   that already has library metadata is rebuilt with one copy of each instead of being appended to
+def RemoveBuiltElements(root):
+    for dataIdInfoEl in root.findall('dataIdInfo'):
+        RemoveChildren(dataIdInfoEl, lstDataIdInfoTags)
+    RemoveChildren(root, lstRootTags)
+    for attrEl in root.findall('eainfo/detailed/attr'):
+        RemoveChildren(attrEl, lstAttrTags)
+    for binaryEl in root.findall('Binary'):
+        RemoveChildren(binaryEl, ['Thumbnail'])
+        if len(binaryEl) == 0:
+            root.remove(binaryEl)
+
+
+# Fill a metadata document with a feature class's library metadata using deep copies of the static templates.
+#   Elements from an earlier build are replaced, so building the same document twice gives the same XML.
+def BuildFCMetadata(root, df_row, dictFieldDescrip, featName):
+    templates = GetTemplates()
+    settings = LibMgrSettings.Get()
+    RemoveBuiltElements(root)
 
     # build the supplemental info string
     sSuppInfo = BuildMetadataSupString(df_row)
 
-    # get the dataIdInfo element
+    # dataIdInfo purpose, abstract, access constraint, credit, maintenance frequency, use limit and keyword elements
     dataIdInfoEl = root.find('dataIdInfo')
-
-    # dataIdInfo purpose element
-    subEl = ET.SubElement(dataIdInfoEl,'idPurp')
-    subEl.text = df_row['FULL_NAME']
-    num_elements += 1
-
-    # dataIdInfo abstract element
-    subEl = ET.SubElement(dataIdInfoEl,'idAbs')
-    subEl.text = df_row['ABSTRACT'] + sSuppInfo
-    num_elements += 1
-
-    # dataIdInfo access constraint element
-    subEl = ET.SubElement(dataIdInfoEl,'accconst')
-    subEl.text = df_row['METAACCESS']
-    num_elements += 1
-
-    # dataIdInfo credit element
-    subEl = ET.SubElement(dataIdInfoEl,'idCredit')
-    subEl.text = idCredit
-    num_elements += 1
-
-    # dataIdInfo maintenance frequency element
-    subEl = ET.SubElement(dataIdInfoEl,'resMaint')
-    subEl = ET.SubElement(subEl,'usrDefFreq')
-    subEl = ET.SubElement(subEl,'duration')
-    subEl.text = df_row['MAINTFREQ']
-    num_elements += 1
-
-    # dataIdInfo use limit element
-    subEl = ET.SubElement(dataIdInfoEl,'resConst')
-    subEl = ET.SubElement(subEl,'Consts')
-    subEl = ET.SubElement(subEl,'useLimit')
-    subEl.text = constraint_useLimit
-    num_elements += 1
-
-    # dataIdInfo keyword elements obtained from FULL_NAME
-    searchKeysEl = ET.SubElement(dataIdInfoEl,'searchKeys')
-    keywords = df_row['FULL_NAME'].split(' ')
-    for keyword in keywords:
-        newKeyEl = ET.SubElement(searchKeysEl,'keyword')
-        newKeyEl.text = keyword
-        num_elements += 1
-
-    # create the idInfo element
-    idInfoEl = ET.SubElement(root,'idInfo')
-
-    # idinfo use constraint element
-    with open(disclaimerFile, 'r') as file: # read the disclaimer text file to a string
-        disclaimer = file.read()
-    subEl = ET.SubElement(idInfoEl,'useconst')
-    subEl.text = disclaimer
-    num_elements += 1
-
-    # idinfo citation onlink element
-    # remove the server name portion of the path
-    path = df_row['PATH'].split('\\')[2]
+    if dataIdInfoEl is None:
+        dataIdInfoEl = ET.SubElement(root, 'dataIdInfo')
+    SubElementPath(dataIdInfoEl, 'idPurp', df_row['FULL_NAME'])
+    SubElementPath(dataIdInfoEl, 'idAbs', df_row['ABSTRACT'] + sSuppInfo)
+    SubElementPath(dataIdInfoEl, 'accconst', df_row['METAACCESS'])
+    dataIdInfoEl.append(copy.deepcopy(templates['idCredit']))
+    SubElementPath(dataIdInfoEl, 'resMaint/usrDefFreq/duration', df_row['MAINTFREQ'])
+    dataIdInfoEl.append(copy.deepcopy(templates['resConst']))
+    searchKeysEl = ET.SubElement(dataIdInfoEl, 'searchKeys')
+    for keyword in df_row['FULL_NAME'].split(' '): # keywords obtained from FULL_NAME
+        SubElementPath(searchKeysEl, 'keyword', keyword)
+
+    # idInfo elements
+    idInfoEl = copy.deepcopy(templates['idInfo'])
+    path = df_row['PATH'].split('\\')[2] # remove the server name portion of the path
     pathRoot = '\\\\' + path + '\\'
-    onlink = df_row['PATH'].replace(pathRoot,'')
-
-    subEl = ET.SubElement(idInfoEl,'citation')
-    citeinfoEl = ET.SubElement(subEl,'citeinfo')
-    subEl = ET.SubElement(subEl,'onlink')
-    subEl.text = onlink
-    num_elements += 1
-
-    # idinfo citation origin element
-    subEl = ET.SubElement(citeinfoEl,'origin')
-    subEl.text = organization
-    num_elements += 1
-
-    # idinfo citation pubdate element
-    subEl = ET.SubElement(citeinfoEl,'pubdate')
-    subEl.text = datetime.datetime.now().strftime("%B %d, %Y")
-    num_elements += 1
-
-    # create the idInfo timeperd element
-    timeperdEl = ET.SubElement(idInfoEl,'timeperd')
-
-    # idinfo timeperd update date comment element
-    subEl = ET.SubElement(timeperdEl,'current')
-    subEl.text = timeperd_current
-    num_elements += 1
-
-    # idinfo timeperd update date element
-    subEl = ET.SubElement(timeperdEl,'timeinfo')
-    subEl = ET.SubElement(subEl,'sngdate')
-    subEl = ET.SubElement(subEl,'caldate')
-    subEl.text = df_row['UPDATEDATE']
-    num_elements += 1
-
-    # create the idInfo descript element
-    descriptEl = ET.SubElement(idInfoEl,'descript')
-
-    # idinfo descript abstract element
-    subEl = ET.SubElement(descriptEl,'abstract')
-    subEl.text = df_row['ABSTRACT']
-    num_elements += 1
-
-    # idinfo descript purpose element
-    subEl = ET.SubElement(descriptEl,'purpose')
-    subEl.text = df_row['FULL_NAME']
-    num_elements += 1
-
-    # idinfo descript supplinf element
-    subEl = ET.SubElement(descriptEl,'supplinf')
-    subEl.text = sSuppInfo
-    num_elements += 1
-
-    # idinfo keywords themekey element
-    subEl = ET.SubElement(idInfoEl,'keywords')
-    subEl = ET.SubElement(subEl,'theme')
-    subEl = ET.SubElement(subEl,'themekey')
-    subEl.text = df_row['FULL_NAME']
-    num_elements += 1
-
-    # create the idInfo point of contact elements
-    subEl = ET.SubElement(idInfoEl,'ptcontac')
-    cntinfoEl = ET.SubElement(subEl,'cntinfo')
-    cntperpEl = ET.SubElement(cntinfoEl,'cntperp')
-    cntaddrEl = ET.SubElement(cntinfoEl,'cntaddr')
-    cntvoiceEl = ET.SubElement(cntinfoEl,'cntvoice')
-
-    # idinfo point of contact person element
-    subEl = ET.SubElement(cntperpEl,'cntper')
-    subEl.text = df_row['OWNERNAME']
-    num_elements += 1
-
-    # idinfo point of contact organization element
-    subEl = ET.SubElement(cntperpEl,'cntorg')
-    subEl.text = organization
-    num_elements += 1
-
-    # idinfo point of contact address type element
-    subEl = ET.SubElement(cntaddrEl,'addrtype')
-    subEl.text = addrtype
-    num_elements += 1
-
-    # idinfo point of contact address element
-    subEl = ET.SubElement(cntaddrEl,'address')
-    subEl.text = address
-    num_elements += 1
-
-    # idinfo point of contact city element
-    subEl = ET.SubElement(cntaddrEl,'city')
-    subEl.text = city
-    num_elements += 1
-
-    # idinfo point of contact state element
-    subEl = ET.SubElement(cntaddrEl,'state')
-    subEl.text = state
-    num_elements += 1
-
-    # idinfo point of contact zip element
-    subEl = ET.SubElement(cntaddrEl,'postal')
-    subEl.text = zip
-    num_elements += 1
-
-    # idinfo point of contact country element
-    subEl = ET.SubElement(cntaddrEl,'country')
-    subEl.text = country
-    num_elements += 1
-
-    # idinfo point of contact phone element
-    subEl = ET.SubElement(cntinfoEl,'cntvoice')
-    subEl.text = phone
-    num_elements += 1
-
-    # create the metainfo point of contact elements
-    metainfoEl = ET.SubElement(root,'metainfo')
-    subEl = ET.SubElement(metainfoEl,'metc')
-    cntinfoEl = ET.SubElement(subEl,'cntinfo')
-    cntorgpEl = ET.SubElement(cntinfoEl,'cntorgp')
-    cntaddrEl = ET.SubElement(subEl,'cntaddr')
-
-    # metainfo point of contact person element
-    subEl = ET.SubElement(cntorgpEl,'cntper')
-    subEl.text = librarian
-    num_elements += 1
-
-    # metainfo point of contact organization element
-    subEl = ET.SubElement(cntorgpEl,'cntorg')
-    subEl.text = df_row['OWNERNAME'] + '\n' + organization
-    num_elements += 1
-
-    # metainfo point of contact address type element
-    subEl = ET.SubElement(cntaddrEl,'addrtype')
-    subEl.text = addrtype
-    num_elements += 1
-
-    # metainfo point of contact address element
-    subEl = ET.SubElement(cntaddrEl,'address')
-    subEl.text = address
-    num_elements += 1
-
-    # metainfo point of contact city element
-    subEl = ET.SubElement(cntaddrEl,'city')
-    subEl.text = city
-    num_elements += 1
-
-    # metainfo point of contact state element
-    subEl = ET.SubElement(cntaddrEl,'state')
-    subEl.text = state
-    num_elements += 1
-
-    # metainfo point of contact zip element
-    subEl = ET.SubElement(cntaddrEl,'postal')
-    subEl.text = zip
-    num_elements += 1
-
-    # metainfo point of contact country element
-    subEl = ET.SubElement(cntaddrEl,'country')
-    subEl.text = country
-    num_elements += 1
-
-    # metainfo point of contact phone element
-    subEl = ET.SubElement(cntinfoEl,'cntvoice')
-    subEl.text = phone
-    num_elements += 1
-
-    # idinfo maintenance status element
-    statusEl = ET.SubElement(idInfoEl,'status')
-    subEl = ET.SubElement(statusEl,'progress')
+    idInfoEl.find('citation/onlink').text = df_row['PATH'].replace(pathRoot,'')
+    idInfoEl.find('citation/citeinfo/pubdate').text = datetime.datetime.now().strftime("%B %d, %Y")
+    idInfoEl.find('timeperd/timeinfo/sngdate/caldate').text = df_row['UPDATEDATE']
+    idInfoEl.find('descript/abstract').text = df_row['ABSTRACT']
+    idInfoEl.find('descript/purpose').text = df_row['FULL_NAME']
+    idInfoEl.find('descript/supplinf').text = sSuppInfo
+    idInfoEl.find('keywords/theme/themekey').text = df_row['FULL_NAME']
+    idInfoEl.find('ptcontac/cntinfo/cntperp/cntper').text = df_row['OWNERNAME']
     if df_row['ONMAINT'] and df_row['ONMAINT'].upper() == 'Y':
-        subEl.text = 'Maintained'
-        num_elements += 1
+        idInfoEl.find('status/progress').text = 'Maintained'
     else:
-        subEl.text = 'Not Maintained'
-        num_elements += 1
+        idInfoEl.find('status/progress').text = 'Not Maintained'
+    idInfoEl.find('status/update').text = df_row['MAINTFREQ']
+    root.append(idInfoEl)
 
-    # idinfo maintenance frequency element
-    subEl = ET.SubElement(statusEl,'update')
-    subEl.text = df_row['MAINTFREQ']
-    num_elements += 1
+    # metainfo point of contact elements
+    metainfoEl = copy.deepcopy(templates['metainfo'])
+    metainfoEl.find('metc/cntinfo/cntorgp/cntorg').text = df_row['OWNERNAME'] + '\n' + settings.organization
+    root.append(metainfoEl)
 
     # add descriptions from library metadata table master_metafields to the feature class fields
     attrEls = root.findall('eainfo/detailed/attr')
@@ -441,41 +406,75 @@ def UpdateFCMetadata(fcPathName, metaConnStr):
         lablEl = attrEl.find('attrlabl') # find the attribute name element
         if lablEl is not None: # for unknown reason, the root.findall sometimes gets attributes that are empty
             fldname = lablEl.text
-            try:
-                descrip = df_fieldMeta.loc[fldname]['Description'] # get the field description from the dataframe
-            except Exception as e:
-                #print('\tNo description for field ' + fldname)
-                pass # ignore error returned by dataframe loc. Field not in field metadata table.
-            else:
-                subEl = ET.SubElement(attrEl,'attrdef') #field description element
-                subEl.text = descrip
-                num_elements += 1
-                subEl = ET.SubElement(attrEl,'attrdefs') #field description source element
-                subEl.text = 'Pima County'
-                num_elements += 1
+            if fldname in dictFieldDescrip: # skip fields that aren't in the field metadata table
+                SubElementPath(attrEl, 'attrdef', dictFieldDescrip[fldname]) # field description element
+                SubElementPath(attrEl, 'attrdefs', 'Pima County') # field description source element
 
     # set metadata thumbnail
-    jpgFile = thumbnailsPath + '/' + featName + '.jpg'
-    if os.path.exists(jpgFile):
-        with open(jpgFile, "rb") as img_file:
-            strEncoded = base64.b64encode(img_file.read())
-
+    strEncoded = MetadataAssets.GetThumbnail(featName)
+    if strEncoded is not None:
         attrib = {'EsriPropertyType':'PictureX'}
-        subEl = ET.SubElement(root,'Binary')
+        subEl = root.find('Binary')
+        if subEl is None:
+            subEl = ET.SubElement(root,'Binary')
         subEl = ET.SubElement(subEl,'Thumbnail')
         subEl = ET.SubElement(subEl,'Data',attrib)
         subEl.text = strEncoded
-        num_elements += 1
-
-    if num_elements > 0:
-        # save modifications to XML
-        try:
-            tree.write(xmlfile)
-            arcpy.MetadataImporter_conversion(xmlfile, fcPathName)
-        except Exception as e:
-            print(e.message)
+
+
+metadataDirection = 'METADATA' # sync manifest direction holding the digest of the last imported metadata
+
+
+# Get a digest of everything a feature class's metadata document is built from: the descriptive metadata row, the
+#   field descriptions, the disclaimer, the thumbnail version and the [Metadata] settings. The publication date isn't included.
+def GetMetadataDigest(df_row, dictFieldDescrip, featName):
+    settings = LibMgrSettings.Get()
+    digest = hashlib.sha1()
+    for col in lstDescriptiveColumns:
+        digest.update(repr(df_row.get(col)))
+    for fldname in sorted(dictFieldDescrip):
+        digest.update(repr((fldname, dictFieldDescrip[fldname])))
+    digest.update(MetadataAssets.GetDisclaimer())
+    digest.update(repr(MetadataAssets.GetThumbnailKey(featName))) # the thumbnail time and size stand in for its bytes
+    for option in ['idCredit', 'constraint_useLimit', 'organization', 'timeperd_current', 'addrtype', 'address',
+                   'city', 'state', 'zip', 'country', 'phone', 'librarian', 'preserveExistingMetadata']:
+        digest.update(repr(getattr(settings, option)))
+    return digest.hexdigest()
+
+
+# Update feature class metadata. The existing metadata is exported and extended when preserveExistingMetadata
+#   is set, otherwise a new document is built without the XSLT export. Unless bForce is set (ie. the feature class
+#   was replaced and has no metadata) the import is skipped when the digest of the metadata inputs matches the one
+#   recorded in the sync manifest by the last import. featName is the library feature class name if fcPathName is
+#   a shadow of it (ie. <featName>_shd). Returns True if the metadata was imported.
+def UpdateFCMetadata(fcPathName, metaConnStr, bForce=False, featName=''):
+    settings = LibMgrSettings.Get()
+    if featName == '':
+        featName = fcPathName.split('.')[-1]
+    if featName.lower() in dictDescriptive: # prefetched by LoadMetadataCache
+        df_row = dictDescriptive[featName.lower()]
+        dictFieldDescrip = dictFieldDescriptions.get(featName.lower(), {})
+    else:
+        df_row, dictFieldDescrip = QueryFCMetadata(featName, metaConnStr)
+
+    digest = GetMetadataDigest(df_row, dictFieldDescrip, featName)
+    if not bForce and digest == SyncManifest.GetContentHash(featName, metadataDirection):
+        return False
+
+    #    temporary XML file
+    xmlfile = arcpy.CreateScratchName('.xml',workspace=arcpy.env.scratchFolder)
+
+    if settings.preserveExistingMetadata:
+        root = ExportFCMetadata(fcPathName, xmlfile)
     else:
-        print('No changes to save')
+        root = NewFCMetadata(fcPathName)
+    BuildFCMetadata(root, df_row, dictFieldDescrip, featName)
+
+    # save modifications to XML and record the digest of the imported metadata
+    ET.ElementTree(root).write(xmlfile)
+    arcpy.MetadataImporter_conversion(xmlfile, fcPathName)
+    SyncManifest.RecordSync(featName, metadataDirection, None, None, None, datetime.datetime.now(), digest)
+    return True
 
 
 ## Refresh all metadata dates and file sizes
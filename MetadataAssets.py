@@ -0,0 +1,121 @@
+# MetadataAssets.py - Cached disclaimer text and thumbnail images used to build feature class metadata
+#
+# The disclaimer file is read once per process. The thumbnail directory on the file server is listed once per process
+# and every .jpg is indexed by feature name with its last modified time and size. Base64 encoded thumbnails are kept
+# in a local cache directory with the time and size of the image in the file name, so an image is read from the file
+# server only when it is new or has changed since it was cached. The directory is listed with scandir if it is
+# available (the scandir backport on ArcMap's Python 2.7), otherwise only the .jpg files are stat'ed.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import stat
+import glob
+import base64
+import LibMgrSettings
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # scandir backport for python 2.7
+    except ImportError:
+        scandir = None
+
+# custom error exception for all functions in this module
+class MetadataAssetsError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class MetadataAssetsWarning(Exception):
+    pass
+
+cacheDirName = 'thumbnail_cache' # local cache directory of base64 encoded thumbnails under outLocalPath
+
+disclaimer = None # disclaimer text, set on first use by GetDisclaimer
+
+# thumbnail index keyed by lowercase feature name with values (mtime, size), set on first use by IndexThumbnails
+dictThumbnails = None
+
+
+# Get the disclaimer text (read once per process)
+def GetDisclaimer():
+    global disclaimer
+    if disclaimer is None:
+        with open(LibMgrSettings.Get().disclaimerFile, 'r') as file: # read the disclaimer text file to a string
+            disclaimer = file.read()
+    return disclaimer
+
+
+# List the thumbnail directory once and index its .jpg files. A directory that can't be listed has no thumbnails.
+def IndexThumbnails():
+    global dictThumbnails
+    if dictThumbnails is not None:
+        return dictThumbnails
+
+    thumbnailsPath = LibMgrSettings.Get().thumbnailsPath
+    dictThumbs = {}
+    try:
+        if scandir is not None:
+            for entry in scandir(thumbnailsPath):
+                featName, ext = os.path.splitext(entry.name.lower())
+                if ext == '.jpg' and entry.is_file():
+                    st = entry.stat()
+                    dictThumbs[featName] = (st.st_mtime, st.st_size)
+        else: # without scandir, only the .jpg files are stat'ed, each once
+            for fileName in os.listdir(thumbnailsPath):
+                featName, ext = os.path.splitext(fileName.lower())
+                if ext == '.jpg':
+                    st = os.stat(os.path.join(thumbnailsPath, fileName))
+                    if stat.S_ISREG(st.st_mode):
+                        dictThumbs[featName] = (st.st_mtime, st.st_size)
+    except OSError as e:
+        pass # directory doesn't exist or can't be read
+    dictThumbnails = dictThumbs
+    return dictThumbnails
+
+
+# Get the (mtime, size) of a feature class thumbnail, or None if it doesn't have one
+def GetThumbnailKey(featName):
+    return IndexThumbnails().get(featName.lower())
+
+
+# Get the local cache file path of a thumbnail version
+def GetCachePath(featName, key):
+    cacheDir = os.path.join(LibMgrSettings.Get().outLocalPath, cacheDirName)
+    return os.path.join(cacheDir, featName.lower() + '_' + str(int(key[0])) + '_' + str(key[1]) + '.b64')
+
+
+# Get the base64 encoded thumbnail of a feature class, or None if it doesn't have one.
+#   The image is read from the file server and cached locally only if the cached copy is missing or out of date.
+def GetThumbnail(featName):
+    key = GetThumbnailKey(featName)
+    if key is None:
+        return None
+    cachePath = GetCachePath(featName, key)
+    if os.path.isfile(cachePath):
+        with open(cachePath, 'r') as file:
+            return file.read()
+
+    jpgFile = LibMgrSettings.Get().thumbnailsPath + '/' + featName + '.jpg'
+    with open(jpgFile, 'rb') as img_file:
+        strEncoded = base64.b64encode(img_file.read())
+
+    # replace any cached copies of earlier versions. Failing to cache only costs a read next time.
+    try:
+        cacheDir = os.path.dirname(cachePath)
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        for oldPath in glob.glob(os.path.join(cacheDir, featName.lower() + '_*_*.b64')):
+            lstParts = os.path.basename(oldPath)[len(featName) + 1:-4].split('_')
+            if len(lstParts) == 2 and lstParts[0].isdigit() and lstParts[1].isdigit(): # not another feature's thumbnail
+                os.remove(oldPath)
+        tmpPath = cachePath + '.' + str(os.getpid()) # write then rename so other processes never read a partial file
+        with open(tmpPath, 'w') as file:
+            file.write(strEncoded)
+        os.rename(tmpPath, cachePath)
+    except (OSError, IOError) as e:
+        pass
+    return strEncoded
@@ -0,0 +1,85 @@
+# Projection.py - Functions to project coordinate arrays between a Transverse Mercator projection and geographic
+#
+# The projection formulas are the ellipsoidal Transverse Mercator series from Snyder, Map Projections - A Working
+# Manual (USGS Professional Paper 1395), p. 60-64, evaluated on whole NumPy arrays at once. They are accurate to well
+# under a millimeter within a state plane zone. No datum transformation is applied, so the projected and geographic
+# coordinate systems must share a datum (ie. NAD 1983 HARN State Plane feet and NAD 1983 HARN geographic).
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import numpy
+
+# custom error exception for all functions in this module
+class ProjectionError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class ProjectionWarning(Exception):
+    pass
+
+
+# Get Transverse Mercator parameters from an arcpy SpatialReference as a dictionary, or None if the spatial reference
+#   isn't a Transverse Mercator projection or, if datumName is given, isn't on that datum (no datum transformation is
+#   applied). Linear parameters are converted to meters and angles to radians.
+def GetTransverseMercatorParams(sr, datumName=None):
+    if sr.type != 'Projected' or sr.projectionName != 'Transverse_Mercator':
+        return None
+    if datumName is not None and sr.GCS.datumName != datumName:
+        return None
+    a = sr.GCS.semiMajorAxis
+    b = sr.GCS.semiMinorAxis
+    return {'a': a, 'e2': 1.0 - (b * b) / (a * a), 'k0': sr.scaleFactor,
+            'lat0': numpy.radians(sr.latitudeOfOrigin), 'lon0': numpy.radians(sr.centralMeridian),
+            'fe': sr.falseEasting * sr.metersPerUnit, 'fn': sr.falseNorthing * sr.metersPerUnit,
+            'metersPerUnit': sr.metersPerUnit, 'datum': sr.GCS.datumName}
+
+
+# Get the meridian distance from the equator to latitude phi (radians) in meters
+def GetMeridianDistance(phi, a, e2):
+    e4 = e2 * e2
+    e6 = e4 * e2
+    return a * ((1.0 - e2 / 4.0 - 3.0 * e4 / 64.0 - 5.0 * e6 / 256.0) * phi -
+                (3.0 * e2 / 8.0 + 3.0 * e4 / 32.0 + 45.0 * e6 / 1024.0) * numpy.sin(2.0 * phi) +
+                (15.0 * e4 / 256.0 + 45.0 * e6 / 1024.0) * numpy.sin(4.0 * phi) -
+                (35.0 * e6 / 3072.0) * numpy.sin(6.0 * phi))
+
+
+# Project Transverse Mercator x and y arrays (in the projection's linear unit) to latitude and longitude arrays in
+#   degrees. NaN coordinates stay NaN.
+def InverseTransverseMercator(x, y, params):
+    a = params['a']
+    e2 = params['e2']
+    k0 = params['k0']
+    ep2 = e2 / (1.0 - e2)
+    x = (numpy.asarray(x, dtype=numpy.float64) * params['metersPerUnit'] - params['fe'])
+    y = (numpy.asarray(y, dtype=numpy.float64) * params['metersPerUnit'] - params['fn'])
+
+    # footpoint latitude
+    m = GetMeridianDistance(params['lat0'], a, e2) + y / k0
+    mu = m / (a * (1.0 - e2 / 4.0 - 3.0 * e2 * e2 / 64.0 - 5.0 * e2 * e2 * e2 / 256.0))
+    e1 = (1.0 - numpy.sqrt(1.0 - e2)) / (1.0 + numpy.sqrt(1.0 - e2))
+    phi1 = mu + (3.0 * e1 / 2.0 - 27.0 * e1 ** 3 / 32.0) * numpy.sin(2.0 * mu) + \
+        (21.0 * e1 ** 2 / 16.0 - 55.0 * e1 ** 4 / 32.0) * numpy.sin(4.0 * mu) + \
+        (151.0 * e1 ** 3 / 96.0) * numpy.sin(6.0 * mu) + \
+        (1097.0 * e1 ** 4 / 512.0) * numpy.sin(8.0 * mu)
+
+    sinPhi1 = numpy.sin(phi1)
+    cosPhi1 = numpy.cos(phi1)
+    tanPhi1 = numpy.tan(phi1)
+    c1 = ep2 * cosPhi1 ** 2
+    t1 = tanPhi1 ** 2
+    w = 1.0 - e2 * sinPhi1 ** 2
+    n1 = a / numpy.sqrt(w)
+    r1 = a * (1.0 - e2) / (w * numpy.sqrt(w))
+    d = x / (n1 * k0)
+
+    lat = phi1 - (n1 * tanPhi1 / r1) * (d ** 2 / 2.0 -
+        (5.0 + 3.0 * t1 + 10.0 * c1 - 4.0 * c1 ** 2 - 9.0 * ep2) * d ** 4 / 24.0 +
+        (61.0 + 90.0 * t1 + 298.0 * c1 + 45.0 * t1 ** 2 - 252.0 * ep2 - 3.0 * c1 ** 2) * d ** 6 / 720.0)
+    lon = params['lon0'] + (d - (1.0 + 2.0 * t1 + c1) * d ** 3 / 6.0 +
+        (5.0 - 2.0 * c1 + 28.0 * t1 - 3.0 * c1 ** 2 + 8.0 * ep2 + 24.0 * t1 ** 2) * d ** 5 / 120.0) / cosPhi1
+    return (numpy.degrees(lat), numpy.degrees(lon))
+
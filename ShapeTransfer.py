@@ -0,0 +1,124 @@
+# ShapeTransfer.py - Functions to publish shapefiles exported on local disk to the library file server
+#
+# Exporting straight to the UNC shapefile folders makes many small writes over SMB, and readers can open a half
+# written .shp/.dbf pair. Instead, shapefiles are exported to a local directory and each finished sidecar file is
+# copied to the share under a temporary name (<name>.<ext>.tmp) with large buffered writes. The copies run on a small
+# pool of threads, so the sidecars of a shapefile (and the shapefiles of a feature class) are transferred in parallel.
+# Once every file of a shapefile has been copied, the files are renamed into place and sidecars left over from the
+# previous version (ie. an out of date spatial index) are deleted.
+#
+# Usage:
+#   transfer = ShapeTransfer.StartTransfer(localDir, featName, targetDir)
+#   ... other work ...
+#   ShapeTransfer.FinishTransfer(transfer)
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import shutil
+import threading
+from multiprocessing.pool import ThreadPool
+import LibMgrSettings
+import ShapefileWriter
+
+# custom error exception for all functions in this module
+class ShapeTransferError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class ShapeTransferWarning(Exception):
+    pass
+
+localDirName = 'shapes_export' # local export directory under outLocalPath (one per process)
+transferBufferSize = 8 * 1024 * 1024 # bytes per read and write when copying to the share
+tempExt = '.tmp' # appended to the file names while they are copied
+
+pool = None # thread pool of this process, created on first use by GetPool
+poolLock = threading.Lock()
+
+
+# Get the transfer thread pool of this process (transferThreads threads)
+def GetPool():
+    global pool
+    with poolLock:
+        if pool is None:
+            pool = ThreadPool(max(1, LibMgrSettings.Get().transferThreads))
+    return pool
+
+
+# Get (and create if needed) the local export directory of this process for a library shapefile folder name
+#   (ie. shapes or shapes_lat_lon), with a trailing slash
+def GetLocalDir(folderName):
+    localDir = os.path.join(LibMgrSettings.Get().outLocalPath, localDirName + '_' + str(os.getpid()), folderName)
+    if not os.path.isdir(localDir):
+        os.makedirs(localDir)
+    return localDir + '/'
+
+
+# Get the sidecar file names of a shapefile in a directory (ie. parcels.shp, parcels.dbf, parcels.shp.xml). The
+#   metadata file is only included if bMetadata is True.
+def GetSidecarNames(dirPath, featName, bMetadata=True):
+    lstExts = ShapefileWriter.lstShapefileExts
+    if bMetadata:
+        lstExts = ShapefileWriter.lstShapefileExts + ShapefileWriter.lstMetadataExts
+    lstNames = []
+    for ext in lstExts:
+        if os.path.isfile(os.path.join(dirPath, featName + ext)):
+            lstNames.append(featName + ext)
+    return lstNames
+
+
+# Copy a file with large buffered reads and writes
+def CopyFile(srcPath, dstPath):
+    with open(srcPath, 'rb') as fsrc:
+        with open(dstPath, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, transferBufferSize)
+
+
+# Start copying a shapefile exported to localDir to temporary names in targetDir on the thread pool.
+#   Returns the transfer to pass to FinishTransfer.
+def StartTransfer(localDir, featName, targetDir):
+    featName = featName.lower()
+    lstNames = GetSidecarNames(localDir, featName)
+    if '.shp' not in [os.path.splitext(name)[1] for name in lstNames]:
+        raise ShapeTransferError('Exported shapefile does not exist - ' + os.path.join(localDir, featName + '.shp'))
+    lstFiles = []
+    for name in lstNames:
+        dstPath = os.path.join(targetDir, name)
+        lstFiles.append((os.path.join(localDir, name), dstPath + tempExt, dstPath))
+    lstResults = [GetPool().apply_async(CopyFile, (srcPath, tmpPath)) for srcPath, tmpPath, dstPath in lstFiles]
+    return {'featName': featName, 'localDir': localDir, 'targetDir': targetDir, 'files': lstFiles, 'results': lstResults}
+
+
+# Wait for a transfer to finish copying, then rename its files into place, delete sidecars of the previous version
+#   that the new one doesn't have (except its metadata file) and delete the local export. If any copy fails, the
+#   temporary files are deleted, the previous version is left as it was and the error is raised.
+def FinishTransfer(transfer):
+    error = None
+    for result in transfer['results']:
+        try:
+            result.get()
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        for srcPath, tmpPath, dstPath in transfer['files']:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+        raise error
+
+    # the files are all on the share, so the shapefile is replaced with renames only
+    lstNewPaths = [dstPath for srcPath, tmpPath, dstPath in transfer['files']]
+    for name in GetSidecarNames(transfer['targetDir'], transfer['featName'], False): # keep the metadata file
+        path = os.path.join(transfer['targetDir'], name)
+        if path not in lstNewPaths:
+            os.remove(path)
+    for srcPath, tmpPath, dstPath in transfer['files']:
+        if os.path.exists(dstPath):
+            os.remove(dstPath)
+        os.rename(tmpPath, dstPath)
+
+    ShapefileWriter.DeleteShapefile(os.path.join(transfer['localDir'], transfer['featName']), True)
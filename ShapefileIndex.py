@@ -0,0 +1,166 @@
+# ShapefileIndex.py - Quadtree spatial index (.qix) writer for shapefiles
+#
+# The .qix file is the quadtree index read by MapServer, GDAL/OGR and QGIS. It is built without arcpy: the record
+# offsets are read from the .shx, and the shape type and bounding box of every record are gathered from a memory map of
+# the .shp with numpy, a chunk of records at a time. The tree is bulk loaded from the bounding box arrays. Each shape is
+# placed in the deepest node whose bounds contain it, with the same node splits (two overlapping halves of the longer
+# side, twice) and default depth as shptree. Empty subtrees are left out and a node holding a single shape isn't split,
+# which keeps point indexes from growing a chain of nodes down to the full depth for every point.
+#
+# File layout (little endian):
+#   header  'SQT', byte order (1 = LSB), version (1), 3 reserved bytes, int number of shapes, int depth
+#   node    int bytes of all descendant nodes, 4 doubles bounds (minx, miny, maxx, maxy), int number of shapes,
+#           int shape ids (0 based), int number of subnodes, then each subnode
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import struct
+
+# custom error exception for all functions in this module
+class ShapefileIndexError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class ShapefileIndexWarning(Exception):
+    pass
+
+maxDefaultDepth = 12 # deepest tree built for the default depth, as in shptree
+splitRatio = 0.55 # fraction of a node's longer side in each half, so the halves overlap
+chunkSize = 65536 # records gathered from the .shp per numpy operation
+tempExt = '.tmp' # appended to the index file name while it is written
+
+lstPointTypes = [1, 11, 21] # Point, PointZ and PointM records have x and y instead of a bounding box
+
+
+# Get the default tree depth for a number of shapes (about 8 shapes per leaf when they are spread out)
+def GetDefaultDepth(nShapes):
+    depth = 0
+    nMaxNodeCount = 1
+    while nMaxNodeCount * 4 < nShapes:
+        depth += 1
+        nMaxNodeCount = nMaxNodeCount * 2
+    return max(1, min(depth, maxDefaultDepth))
+
+
+# Split bounds (minx, miny, maxx, maxy) into two overlapping halves across the longer side
+def SplitBounds(bounds):
+    minx, miny, maxx, maxy = bounds
+    if maxx - minx > maxy - miny:
+        span = (maxx - minx) * splitRatio
+        return (minx, miny, minx + span, maxy), (maxx - span, miny, maxx, maxy)
+    span = (maxy - miny) * splitRatio
+    return (minx, miny, maxx, miny + span), (minx, maxy - span, maxx, maxy)
+
+
+# Get the four quadrant bounds of a node in the order shapes are offered to them
+def GetQuadrants(bounds):
+    half1, half2 = SplitBounds(bounds)
+    quad1, quad2 = SplitBounds(half1)
+    quad3, quad4 = SplitBounds(half2)
+    return [quad1, quad2, quad3, quad4]
+
+
+# Read the shape count, the ids and bounding boxes of the non null shapes and the header bounds of a shapefile.
+#   Returns (number of records, id array, n x 4 bounds array, header bounds tuple).
+def ReadShapeBounds(basePath):
+    import numpy
+
+    with open(basePath + '.shx', 'rb') as shxFile:
+        shxData = shxFile.read()
+    if len(shxData) < 100 or struct.unpack('>i', shxData[0:4])[0] != 9994:
+        raise ShapefileIndexError('Not a shapefile index (.shx) - ' + basePath + '.shx')
+    arrRecords = numpy.frombuffer(shxData[100:], dtype='>i4').reshape(-1, 2).astype(numpy.int64) * 2
+    nRecords = len(arrRecords)
+
+    shpSize = os.path.getsize(basePath + '.shp')
+    with open(basePath + '.shp', 'rb') as shpFile:
+        headerBounds = struct.unpack('<4d', shpFile.read(100)[36:68])
+    if nRecords == 0 or shpSize <= 100:
+        return (nRecords, numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, 4)), headerBounds)
+
+    # each record has an 8 byte header, then the shape type and either x, y or the bounding box
+    arrShp = numpy.memmap(basePath + '.shp', dtype=numpy.uint8, mode='r')
+    arrByteOffsets = numpy.arange(36, dtype=numpy.int64)
+    lstIds = []
+    lstBounds = []
+    for start in range(0, nRecords, chunkSize):
+        arrOffsets = arrRecords[start:start + chunkSize, 0]
+        arrLengths = arrRecords[start:start + chunkSize, 1]
+        arrIndex = numpy.minimum(arrOffsets[:, None] + 8 + arrByteOffsets, shpSize - 1)
+        arrBytes = numpy.ascontiguousarray(arrShp[arrIndex])
+        arrTypes = arrBytes[:, 0:4].copy().view('<i4').ravel()
+        arrCoords = arrBytes[:, 4:36].copy().view('<f8')
+        arrPoint = numpy.zeros(len(arrTypes), dtype=bool)
+        for pointType in lstPointTypes:
+            arrPoint |= arrTypes == pointType
+        arrCoords[arrPoint, 2:4] = arrCoords[arrPoint, 0:2]
+        arrValid = (arrTypes != 0) & (arrLengths >= numpy.where(arrPoint, 20, 36)) & numpy.isfinite(arrCoords).all(axis=1)
+        lstIds.append(numpy.nonzero(arrValid)[0] + start)
+        lstBounds.append(arrCoords[arrValid])
+    del arrShp
+    return (nRecords, numpy.concatenate(lstIds), numpy.concatenate(lstBounds), headerBounds)
+
+
+# Bulk load a node from the ids and bounds of the shapes inside its bounds. Shapes contained by a quadrant go to the
+#   first quadrant that contains them, the rest stay in the node. Returns the node (bounds, ids, subnodes).
+def BuildNode(bounds, arrIds, arrBounds, depth):
+    import numpy
+
+    lstSubnodes = []
+    if depth > 1 and len(arrIds) > 1:
+        arrRemaining = numpy.ones(len(arrIds), dtype=bool)
+        for quad in GetQuadrants(bounds):
+            arrInQuad = arrRemaining & (arrBounds[:, 0] >= quad[0]) & (arrBounds[:, 1] >= quad[1]) & \
+                (arrBounds[:, 2] <= quad[2]) & (arrBounds[:, 3] <= quad[3])
+            if arrInQuad.any():
+                lstSubnodes.append(BuildNode(quad, arrIds[arrInQuad], arrBounds[arrInQuad], depth - 1))
+                arrRemaining &= ~arrInQuad
+        arrIds = arrIds[arrRemaining]
+    return (bounds, arrIds, lstSubnodes)
+
+
+# Get the size in bytes of a node's record, not counting its subnodes
+def GetNodeSize(node):
+    return 4 + 32 + 4 + 4 * len(node[1]) + 4
+
+
+# Append the records of a node and its subnodes to a list of byte strings. Returns the size of the node's subtree.
+def PackNode(node, lstChunks):
+    bounds, arrIds, lstSubnodes = node
+    iPos = len(lstChunks)
+    lstChunks.append(None) # filled in once the size of the subnodes is known
+    lstChunks.append(arrIds.astype('<i4').tobytes())
+    lstChunks.append(struct.pack('<i', len(lstSubnodes)))
+    iDescendants = 0
+    for subnode in lstSubnodes:
+        iDescendants += PackNode(subnode, lstChunks)
+    lstChunks[iPos] = struct.pack('<i4di', iDescendants, bounds[0], bounds[1], bounds[2], bounds[3], len(arrIds))
+    return GetNodeSize(node) + iDescendants
+
+
+# Build the quadtree index (<basePath>.qix) of a shapefile if it is missing or older than the .shp.
+#   Returns True if the index was built, False if it was up to date.
+def BuildIndex(basePath, depth=0):
+    shpPath = basePath + '.shp'
+    qixPath = basePath + '.qix'
+    if os.path.isfile(qixPath) and os.path.getmtime(qixPath) >= os.path.getmtime(shpPath):
+        return False
+
+    nRecords, arrIds, arrBounds, headerBounds = ReadShapeBounds(basePath)
+    if depth == 0:
+        depth = GetDefaultDepth(nRecords)
+    root = BuildNode(headerBounds, arrIds, arrBounds, depth)
+
+    lstChunks = [b'SQT' + struct.pack('<BB3xii', 1, 1, nRecords, depth)]
+    PackNode(root, lstChunks)
+    tmpPath = qixPath + tempExt # write then rename so readers never open a partial index
+    with open(tmpPath, 'wb') as qixFile:
+        qixFile.write(b''.join(lstChunks))
+    if os.path.exists(qixPath):
+        os.remove(qixPath)
+    os.rename(tmpPath, qixPath)
+    return True
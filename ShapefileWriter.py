@@ -0,0 +1,446 @@
+# ShapefileWriter.py - Native streaming shapefile writer (.shp, .shx, .dbf, .prj, .cpg)
+#
+# The writer is pure python (struct) and has no arcpy dependency, so it can be exercised anywhere with synthetic
+# features. Records are packed a batch at a time and written with large sequential writes through buffered files.
+# Headers are written as placeholders and filled in when the writer is closed. Geometry is 2D; Z and M values are
+# dropped by ParseWKB and feature classes with Z or M are left to SafeConvert by ExportFeatureClass.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import math
+import os
+import re
+import struct
+import datetime
+
+# custom error exception for all functions in this module
+class ShapefileWriterError(Exception):
+    pass
+
+# custom warning exception for all functions in this module. Raised when a feature class can't be written by the
+#   native writer and should be exported by SafeConvert instead.
+class ShapefileWriterWarning(Exception):
+    pass
+
+# shapefile shape types
+SHP_NULL = 0
+SHP_POINT = 1
+SHP_POLYLINE = 3
+SHP_POLYGON = 5
+SHP_MULTIPOINT = 8
+
+# shape types by arcpy Describe shapeType
+dictShapeTypes = {'Point': SHP_POINT, 'Multipoint': SHP_MULTIPOINT, 'Polyline': SHP_POLYLINE, 'Polygon': SHP_POLYGON}
+
+# dbf field definitions (type, length, decimals) by arcpy field type. Field types not listed are not exported.
+dictFieldDefs = {'String': ('C', 254, 0), 'SmallInteger': ('N', 6, 0), 'Integer': ('N', 11, 0),
+                 'Single': ('F', 13, 11), 'Double': ('N', 19, 11), 'Date': ('D', 8, 0),
+                 'Guid': ('C', 38, 0), 'GlobalID': ('C', 38, 0)}
+
+# file extensions of a shapefile and the sidecars that must be removed when it is replaced
+lstShapefileExts = ['.shp', '.shx', '.dbf', '.prj', '.cpg', '.sbn', '.sbx', '.qix', '.fbn', '.fbx', '.ain', '.aih',
+                    '.atx', '.ixs', '.mxs']
+# file extensions of the shapefile metadata, which is kept when the shapefile is replaced by a version without its own
+lstMetadataExts = ['.shp.xml']
+
+maxFileSize = 2147483647 # shapefile component files are limited to 2 GB
+bufferSize = 1048576 # output file buffer size
+batchSize = 10000 # features read from the cursor per batch
+progressInterval = 100000 # features between progress log messages
+tempSuffix = '.tmp' # appended to the shapefile name while it is written
+
+
+# Delete a shapefile and its sidecar files. basePath is the shapefile path without extension. The metadata file is
+#   only deleted if bMetadata is True.
+def DeleteShapefile(basePath, bMetadata=False):
+    lstExts = lstShapefileExts
+    if bMetadata:
+        lstExts = lstShapefileExts + lstMetadataExts
+    for ext in lstExts:
+        if os.path.exists(basePath + ext):
+            os.remove(basePath + ext)
+
+
+# Rename a shapefile written under a temporary name into place, replacing the shapefile and its sidecar files.
+#   The metadata file of the shapefile is kept unless the new version has one. tempBasePath and basePath are shapefile
+#   paths without extension.
+def ReplaceShapefile(tempBasePath, basePath):
+    DeleteShapefile(basePath)
+    for ext in lstShapefileExts + lstMetadataExts:
+        if os.path.exists(tempBasePath + ext):
+            if os.path.exists(basePath + ext):
+                os.remove(basePath + ext)
+            os.rename(tempBasePath + ext, basePath + ext)
+
+
+# Get the signed area of a ring (positive if counterclockwise)
+def GetRingArea(ring):
+    area = 0.0
+    for i in range(len(ring) - 1):
+        area += ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1]
+    return area / 2.0
+
+
+# Parse WKB geometry to a list of parts, each a list of (x, y) tuples. Z and M values are dropped.
+#   Polygon rings are oriented for shapefiles (exterior rings clockwise, interior rings counterclockwise).
+#   Returns an empty list for null or empty geometry.
+def ParseWKB(wkb):
+    lstParts = []
+    if wkb is not None and len(wkb) > 0:
+        ParseWKBGeometry(bytes(wkb), 0, lstParts)
+    return lstParts
+
+
+# Parse one WKB geometry starting at offset into lstParts. Returns the offset after the geometry.
+def ParseWKBGeometry(wkb, offset, lstParts):
+    bo = '<' if ord(wkb[offset:offset + 1]) == 1 else '>'
+    wkbType = struct.unpack(bo + 'I', wkb[offset + 1:offset + 5])[0]
+    offset += 5
+
+    # coordinate dimensions from ISO (1000s) or EWKB (high bit flags) type codes
+    nDims = 2
+    if wkbType & 0x80000000:
+        nDims += 1
+    if wkbType & 0x40000000:
+        nDims += 1
+    wkbType = wkbType & 0x0FFFFFFF
+    if wkbType >= 3000:
+        nDims += 2
+    elif wkbType >= 1000:
+        nDims += 1
+    baseType = wkbType % 1000
+    coordFmt = bo + 'd' * nDims
+    coordSize = 8 * nDims
+
+    if baseType == 1: # point
+        coords = struct.unpack(coordFmt, wkb[offset:offset + coordSize])
+        offset += coordSize
+        if coords[0] == coords[0] and coords[1] == coords[1]: # empty points are NaN
+            lstParts.append([(coords[0], coords[1])])
+    elif baseType == 2: # linestring
+        offset = ParseWKBPoints(wkb, offset, bo, coordFmt, coordSize, lstParts)
+    elif baseType == 3: # polygon
+        nRings = struct.unpack(bo + 'I', wkb[offset:offset + 4])[0]
+        offset += 4
+        for iRing in range(nRings):
+            offset = ParseWKBPoints(wkb, offset, bo, coordFmt, coordSize, lstParts)
+            ring = lstParts[-1]
+            area = GetRingArea(ring)
+            if (iRing == 0 and area > 0) or (iRing > 0 and area < 0):
+                ring.reverse()
+    elif baseType in (4, 5, 6, 7): # multipoint, multilinestring, multipolygon, geometry collection
+        nGeoms = struct.unpack(bo + 'I', wkb[offset:offset + 4])[0]
+        offset += 4
+        for iGeom in range(nGeoms):
+            offset = ParseWKBGeometry(wkb, offset, lstParts)
+    else:
+        raise ShapefileWriterError('Unsupported WKB geometry type ' + str(wkbType))
+    return offset
+
+
+# Parse a WKB point list (linestring or ring) starting at offset and append it to lstParts. Returns the new offset.
+def ParseWKBPoints(wkb, offset, bo, coordFmt, coordSize, lstParts):
+    nPoints = struct.unpack(bo + 'I', wkb[offset:offset + 4])[0]
+    offset += 4
+    lstPoints = []
+    for iPoint in range(nPoints):
+        coords = struct.unpack(coordFmt, wkb[offset:offset + coordSize])
+        lstPoints.append((coords[0], coords[1]))
+        offset += coordSize
+    lstParts.append(lstPoints)
+    return offset
+
+
+# Get shapefile field definitions (name, type, length, decimals) for a list of (name, arcpy field type, length) tuples.
+#   Characters other than letters, digits and underscores are replaced with underscores (ie. SHAPE.STArea() from a
+#   SQL Server geodatabase), then names are truncated to 10 characters and made unique. Field types with no dbf type
+#   are skipped.
+def GetFieldDefs(lstFields):
+    lstFieldDefs = []
+    lstNames = []
+    for fldName, fldType, fldLength in lstFields:
+        if fldType not in dictFieldDefs:
+            continue
+        dbfType, length, decimals = dictFieldDefs[fldType]
+        if dbfType == 'C' and fldType == 'String':
+            length = max(1, min(fldLength, 254))
+        validName = re.sub('[^A-Za-z0-9_]', '_', str(fldName))
+        name = validName[:10]
+        i = 1
+        while name.upper() in lstNames: # make truncated names unique (ie. DESCRIPTIO, DESCRIPT_1)
+            suffix = '_' + str(i)
+            name = validName[:10 - len(suffix)] + suffix
+            i += 1
+        lstNames.append(name.upper())
+        lstFieldDefs.append((name, dbfType, length, decimals))
+    return lstFieldDefs
+
+
+# Format a number right justified in a dbf numeric field, reducing decimals if needed to fit the field length.
+#   NaN and infinite values have no dbf representation and are written as blanks (null).
+def FormatNumber(value, length, decimals):
+    if math.isnan(value) or math.isinf(value):
+        return ' ' * length
+    if decimals == 0:
+        strValue = str(int(round(value)))
+    else:
+        strValue = '%.*f' % (decimals, value)
+        while len(strValue) > length and decimals > 0:
+            decimals -= 1
+            strValue = '%.*f' % (decimals, value)
+    if len(strValue) > length:
+        strValue = ('%.*e' % (max(0, length - 7), value))[:length]
+    return strValue.rjust(length)
+
+
+# Format one attribute value for a dbf field. Null values are written as blanks.
+def FormatValue(value, dbfType, length, decimals, encoding):
+    if value is None:
+        return ' ' * length
+    if dbfType == 'C':
+        if not isinstance(value, unicode):
+            value = unicode(value)
+        strValue = value.encode(encoding)[:length]
+        strValue = strValue.decode(encoding, 'ignore').encode(encoding) # don't leave a partial multibyte character
+        return strValue.ljust(length)
+    if dbfType == 'D':
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return '%04d%02d%02d' % (value.year, value.month, value.day)
+        return ' ' * length
+    return FormatNumber(float(value), length, decimals)
+
+
+# Streaming shapefile writer. Write features with WriteRecords and finish with Close.
+class ShapefileWriter(object):
+
+    # basePath - output shapefile path without extension
+    # shapeType - shapefile shape type (SHP_POINT, SHP_MULTIPOINT, SHP_POLYLINE or SHP_POLYGON)
+    # lstFieldDefs - list of (name, dbf type, length, decimals) from GetFieldDefs
+    # prjWkt - ESRI WKT for the .prj file. No .prj is written if empty.
+    def __init__(self, basePath, shapeType, lstFieldDefs, prjWkt='', encoding='utf-8'):
+        self.basePath = basePath
+        self.shapeType = shapeType
+        self.lstFieldDefs = lstFieldDefs
+        self.encoding = encoding
+        self.recordCount = 0
+        self.shpLength = 100 # file lengths in bytes, starting with the 100 byte headers
+        self.dbfRecordLength = 1 + sum(fldDef[2] for fldDef in lstFieldDefs) # deletion flag + fields
+        self.dbfHeaderLength = 32 + 32 * len(lstFieldDefs) + 1
+        self.bbox = None # [xmin, ymin, xmax, ymax]
+
+        if len(lstFieldDefs) > 255:
+            raise ShapefileWriterWarning('More than 255 fields')
+        if self.dbfRecordLength > 65535:
+            raise ShapefileWriterWarning('dbf record length over 65535 bytes')
+
+        self.shpFile = open(basePath + '.shp', 'wb', bufferSize)
+        self.shxFile = open(basePath + '.shx', 'wb', bufferSize)
+        self.dbfFile = open(basePath + '.dbf', 'wb', bufferSize)
+        self.shpFile.write('\0' * 100) # header placeholders filled in by Close
+        self.shxFile.write('\0' * 100)
+        self.dbfFile.write('\0' * self.dbfHeaderLength)
+
+        if prjWkt:
+            with open(basePath + '.prj', 'w') as prjFile:
+                prjFile.write(prjWkt)
+        with open(basePath + '.cpg', 'w') as cpgFile:
+            cpgFile.write(encoding.upper())
+
+    # Write a batch of features. lstFeatures is a list of (lstParts, lstValues) tuples where lstParts is a list of
+    #   parts, each a list of (x, y) tuples (see ParseWKB), and lstValues has one value per field definition.
+    def WriteRecords(self, lstFeatures):
+        lstShp = []
+        lstShx = []
+        lstDbf = []
+        for lstParts, lstValues in lstFeatures:
+            content = self.PackShape(lstParts)
+            self.recordCount += 1
+            lstShx.append(struct.pack('>2i', self.shpLength // 2, len(content) // 2))
+            lstShp.append(struct.pack('>2i', self.recordCount, len(content) // 2))
+            lstShp.append(content)
+            self.shpLength += 8 + len(content)
+
+            lstDbf.append(' ') # deletion flag
+            for value, (name, dbfType, length, decimals) in zip(lstValues, self.lstFieldDefs):
+                lstDbf.append(FormatValue(value, dbfType, length, decimals, self.encoding))
+
+        if self.shpLength > maxFileSize or \
+                self.dbfHeaderLength + self.recordCount * self.dbfRecordLength > maxFileSize:
+            raise ShapefileWriterError('Shapefile exceeds the 2 GB file size limit - ' + self.basePath)
+        self.shpFile.write(''.join(lstShp))
+        self.shxFile.write(''.join(lstShx))
+        self.dbfFile.write(''.join(lstDbf))
+
+    # Pack the content of one shape record and extend the shapefile bounding box
+    def PackShape(self, lstParts):
+        lstPoints = [pt for part in lstParts for pt in part]
+        if len(lstPoints) == 0:
+            return struct.pack('<i', SHP_NULL)
+
+        xs = [pt[0] for pt in lstPoints]
+        ys = [pt[1] for pt in lstPoints]
+        box = [min(xs), min(ys), max(xs), max(ys)]
+        if self.bbox is None:
+            self.bbox = box
+        else:
+            self.bbox = [min(self.bbox[0], box[0]), min(self.bbox[1], box[1]),
+                         max(self.bbox[2], box[2]), max(self.bbox[3], box[3])]
+
+        if self.shapeType == SHP_POINT:
+            return struct.pack('<i2d', SHP_POINT, lstPoints[0][0], lstPoints[0][1])
+
+        coords = [c for pt in lstPoints for c in pt]
+        if self.shapeType == SHP_MULTIPOINT:
+            return struct.pack('<i4di%dd' % len(coords), SHP_MULTIPOINT, box[0], box[1], box[2], box[3],
+                               len(lstPoints), *coords)
+
+        lstStarts = []
+        iStart = 0
+        for part in lstParts:
+            lstStarts.append(iStart)
+            iStart += len(part)
+        return struct.pack('<i4d2i%di%dd' % (len(lstStarts), len(coords)), self.shapeType,
+                           box[0], box[1], box[2], box[3], len(lstStarts), len(lstPoints), *(lstStarts + coords))
+
+    # Pack the 100 byte .shp/.shx header for a file length in bytes
+    def PackShpHeader(self, fileLength):
+        bbox = self.bbox or [0.0, 0.0, 0.0, 0.0]
+        return struct.pack('>7i', 9994, 0, 0, 0, 0, 0, fileLength // 2) + \
+            struct.pack('<2i8d', 1000, self.shapeType, bbox[0], bbox[1], bbox[2], bbox[3], 0.0, 0.0, 0.0, 0.0)
+
+    # Pack the dbf header and field descriptors
+    def PackDbfHeader(self):
+        today = datetime.date.today()
+        lstHeader = [struct.pack('<4BIHH20x', 0x03, today.year - 1900, today.month, today.day,
+                                 self.recordCount, self.dbfHeaderLength, self.dbfRecordLength)]
+        for name, dbfType, length, decimals in self.lstFieldDefs:
+            lstHeader.append(struct.pack('<11sc4xBB14x', name, dbfType, length, decimals))
+        lstHeader.append('\r')
+        return ''.join(lstHeader)
+
+    # Write the headers and close the files
+    def Close(self):
+        self.dbfFile.write('\x1a') # dbf end of file marker
+        self.shpFile.seek(0)
+        self.shpFile.write(self.PackShpHeader(self.shpLength))
+        self.shxFile.seek(0)
+        self.shxFile.write(self.PackShpHeader(100 + 8 * self.recordCount))
+        self.dbfFile.seek(0)
+        self.dbfFile.write(self.PackDbfHeader())
+        self.shpFile.close()
+        self.shxFile.close()
+        self.dbfFile.close()
+
+
+# Transform the coordinates of a batch of features with a function of x and y arrays returning new x and y arrays
+#   (ie. a projection). Every coordinate in the batch is transformed in one call.
+def TransformBatch(lstBatch, transform):
+    import numpy
+
+    lstCoords = [pt for lstParts, values in lstBatch for part in lstParts for pt in part]
+    if len(lstCoords) == 0:
+        return lstBatch
+    arrCoords = numpy.array(lstCoords, dtype=numpy.float64)
+    arrX, arrY = transform(arrCoords[:, 0], arrCoords[:, 1])
+    iterCoords = iter(zip(arrX.tolist(), arrY.tolist()))
+    return [([[next(iterCoords) for pt in part] for part in lstParts], values) for lstParts, values in lstBatch]
+
+
+# Check that a feature class can be written natively from its arcpy Describe.
+#   Raises ShapefileWriterWarning if it can't (ie. Z or M geometry).
+def CheckFeatureClass(desc):
+    if desc.shapeType not in dictShapeTypes:
+        raise ShapefileWriterWarning('Unsupported shape type ' + desc.shapeType)
+    if desc.hasZ or desc.hasM:
+        raise ShapefileWriterWarning('Z or M geometry')
+
+
+# Get the geometry derived fields of a feature class from its arcpy Describe as a list of (field name, cursor token)
+#   in field order (ie. Shape_Area in a file geodatabase, SHAPE.STArea() in SQL Server, none in_memory)
+def GetDerivedFields(desc):
+    dictTokens = {}
+    if getattr(desc, 'areaFieldName', ''):
+        dictTokens[desc.areaFieldName.upper()] = 'SHAPE@AREA'
+    if getattr(desc, 'lengthFieldName', ''):
+        dictTokens[desc.lengthFieldName.upper()] = 'SHAPE@LENGTH'
+    return [(fld.name, dictTokens[fld.name.upper()]) for fld in desc.fields if fld.name.upper() in dictTokens]
+
+
+# Get the attribute fields of a feature class written to the dbf from its arcpy Describe (not the geometry derived fields)
+def GetAttributeFields(desc):
+    setDerived = set(name.upper() for name, token in GetDerivedFields(desc))
+    return [fld for fld in desc.fields if fld.type in dictFieldDefs and fld.name.upper() not in setDerived]
+
+
+# Export a feature class to a shapefile with the native writer, reading the feature class in batches from a cursor.
+#   Any existing shapefile with the same name is replaced once the export succeeds. Returns the number of features
+#   written. Raises ShapefileWriterWarning if the feature class can't be written natively (ie. Z or M geometry).
+def ExportFeatureClass(featPath, outPath, featName, logger=None, lstDerivedFields=None):
+    return ExportFeatureClassFanOut(featPath, [(outPath, featName, None, '')], logger, lstDerivedFields)
+
+
+# Export a feature class to several shapefiles with one read of the feature class. Each batch read from the cursor is
+#   written to every sink. Sinks are tuples of (output directory, shapefile name, transform, prj WKT), where transform
+#   is None or a function applied to the coordinates by TransformBatch, and an empty prj WKT means the feature class
+#   spatial reference. The geometry derived fields are written after the attribute fields, computed from the geometry.
+#   lstDerivedFields (field name, cursor token) replaces the feature class's own derived fields (ie. the library
+#   field names when exporting a staged copy). Each shapefile is written under a temporary name and renamed into place
+#   when every sink is complete, so a failed export leaves any existing shapefiles as they were.
+#   Returns the number of features written to each shapefile.
+#   Raises ShapefileWriterWarning if the feature class can't be written natively (ie. Z or M geometry).
+def ExportFeatureClassFanOut(featPath, lstSinks, logger=None, lstDerivedFields=None):
+    import arcpy
+
+    desc = arcpy.Describe(featPath)
+    CheckFeatureClass(desc)
+    if lstDerivedFields is None:
+        lstDerivedFields = GetDerivedFields(desc)
+
+    lstFields = GetAttributeFields(desc)
+    lstFieldDefs = GetFieldDefs([(fld.name, fld.type, fld.length) for fld in lstFields] +
+                                [(name, 'Double', 0) for name, token in lstDerivedFields])
+    srcPrjWkt = desc.spatialReference.exportToString().split(';')[0] # drop the xy/z/m domains and tolerances
+
+    lstWriters = []
+    bComplete = False
+    try:
+        for outPath, featName, transform, prjWkt in lstSinks:
+            tempBasePath = os.path.join(outPath, featName + tempSuffix)
+            DeleteShapefile(tempBasePath, True) # left behind by an earlier failed export
+            lstWriters.append((ShapefileWriter(tempBasePath, dictShapeTypes[desc.shapeType], lstFieldDefs, prjWkt or srcPrjWkt), transform))
+
+        lstBatch = []
+        with arcpy.da.SearchCursor(featPath, ['SHAPE@WKB'] + [fld.name for fld in lstFields] +
+                                   [token for name, token in lstDerivedFields]) as cursor:
+            for row in cursor:
+                lstBatch.append((ParseWKB(row[0]), row[1:]))
+                if len(lstBatch) == batchSize:
+                    WriteBatch(lstWriters, lstBatch)
+                    lstBatch = []
+                    if logger and lstWriters[0][0].recordCount % progressInterval == 0:
+                        logger.info('\t\tExported ' + str(lstWriters[0][0].recordCount) + ' features')
+        if len(lstBatch) > 0:
+            WriteBatch(lstWriters, lstBatch)
+        bComplete = True
+    finally:
+        for writer, transform in lstWriters:
+            writer.Close()
+        if not bComplete: # remove the partial shapefiles
+            for writer, transform in lstWriters:
+                DeleteShapefile(writer.basePath, True)
+
+    for (outPath, featName, transform, prjWkt), (writer, writerTransform) in zip(lstSinks, lstWriters):
+        ReplaceShapefile(writer.basePath, os.path.join(outPath, featName))
+    return lstWriters[0][0].recordCount
+
+
+# Write a batch of features to a list of (writer, transform) sinks
+def WriteBatch(lstWriters, lstBatch):
+    for writer, transform in lstWriters:
+        if transform is None:
+            writer.WriteRecords(lstBatch)
+        else:
+            writer.WriteRecords(TransformBatch(lstBatch, transform))
@@ -0,0 +1,161 @@
+# SyncManifest.py - Functions to read and record the state of the last successful sync of each feature class
+#
+# The manifest is a local SQLite database with one row per feature class and sync direction (EditGDBtoLIB,
+# StgSHPtoLIB, StgGDBtoLIB, COVtoLIB, LIBtoSHP). It records the source and target fingerprints, the row count,
+# the publish datetime and (in hash fingerprint mode) the source content hash from the last successful sync, so a run
+# can decide "nothing changed" from the fingerprints in the catalog snapshots without probing the source or target.
+# SQLite allows one writer at a time, so with --WORKERS the worker processes only read the manifest. Their writes are
+# queued (bQueueWrites) and returned with each task, and the main process writes them with ApplyWrites.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import sqlite3
+import datetime
+
+# custom error exception for all functions in this module
+class SyncManifestError(Exception):
+    pass
+
+# custom warning exception for all functions in this module
+class SyncManifestWarning(Exception):
+    pass
+
+manifestPath = '' # path of the manifest database for this process, set by Open
+conn = None # connection to the manifest database for this process
+bQueueWrites = False # set in worker processes to queue writes in lstPendingWrites instead of writing them
+lstPendingWrites = [] # queued writes as (function name, arguments)
+dictPendingStates = {} # states of the queued writes keyed by (feature, direction), so this process reads its own writes
+
+
+# Open (and create if needed) the manifest database. Each process opens its own connection.
+def Open(path):
+    global manifestPath, conn
+    manifestPath = path
+    conn = sqlite3.connect(path, timeout=60) # wait on the main process writing to the manifest
+    conn.execute('CREATE TABLE IF NOT EXISTS sync_state (' +\
+        'feature TEXT NOT NULL, direction TEXT NOT NULL, ' +\
+        'src_fingerprint TEXT, tgt_fingerprint TEXT, row_count INTEGER, published TEXT, content_hash TEXT, ' +\
+        'PRIMARY KEY (feature, direction))')
+    # add columns missing from manifests created by earlier versions
+    lstColumns = [col[1] for col in conn.execute('PRAGMA table_info(sync_state)').fetchall()]
+    if 'content_hash' not in lstColumns:
+        conn.execute('ALTER TABLE sync_state ADD COLUMN content_hash TEXT')
+    conn.commit()
+
+
+# Return True if the manifest is open
+def IsOpen():
+    return conn is not None
+
+
+# Get the last sync state of a feature class and direction as a dictionary, or None if it has never been recorded
+def GetState(featName, direction):
+    if conn is None:
+        return None
+    if (featName.lower(), direction) in dictPendingStates:
+        return dict(dictPendingStates[(featName.lower(), direction)])
+    curs = conn.execute('SELECT src_fingerprint, tgt_fingerprint, row_count, published, content_hash FROM sync_state ' +\
+        'WHERE feature = ? AND direction = ?', (featName.lower(), direction))
+    rslt = curs.fetchone()
+    if rslt is None:
+        return None
+    return {'src_fingerprint': rslt[0], 'tgt_fingerprint': rslt[1], 'row_count': rslt[2], 'published': rslt[3],
+            'content_hash': rslt[4]}
+
+
+# Determine if the source and target are unchanged since the last successful sync.
+#   Returns False if either fingerprint is unknown (None) or the manifest can't be read.
+def IsUnchanged(featName, direction, srcFingerprint, tgtFingerprint):
+    if srcFingerprint is None or tgtFingerprint is None:
+        return False
+    try:
+        state = GetState(featName, direction)
+    except Exception as e:
+        return False
+    if state is None:
+        return False
+    return state['src_fingerprint'] == srcFingerprint and state['tgt_fingerprint'] == tgtFingerprint
+
+
+# Get the datetime of the last successful sync, or None if there isn't one
+def GetPublishedDate(featName, direction):
+    try:
+        state = GetState(featName, direction)
+    except Exception as e:
+        return None
+    if state is None or state['published'] is None:
+        return None
+    return datetime.datetime.strptime(state['published'], '%Y-%m-%d %H:%M:%S')
+
+
+# Get the source content hash published by the last successful sync, or None if there isn't one
+def GetContentHash(featName, direction):
+    try:
+        state = GetState(featName, direction)
+    except Exception as e:
+        return None
+    if state is None:
+        return None
+    return state['content_hash']
+
+
+# Record a successful sync of a feature class and direction
+def RecordSync(featName, direction, srcFingerprint, tgtFingerprint, rowCount, published, contentHash=None):
+    if conn is None:
+        return
+    if isinstance(published, datetime.datetime):
+        published = published.strftime('%Y-%m-%d %H:%M:%S')
+    if bQueueWrites:
+        lstPendingWrites.append(('RecordSync', (featName, direction, srcFingerprint, tgtFingerprint, rowCount, published, contentHash)))
+        dictPendingStates[(featName.lower(), direction)] = {'src_fingerprint': srcFingerprint, 'tgt_fingerprint': tgtFingerprint,
+            'row_count': rowCount, 'published': published, 'content_hash': contentHash}
+        return
+    conn.execute('INSERT OR REPLACE INTO sync_state ' +\
+        '(feature, direction, src_fingerprint, tgt_fingerprint, row_count, published, content_hash) ' +\
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (featName.lower(), direction, srcFingerprint, tgtFingerprint, rowCount, published, contentHash))
+    conn.commit()
+
+
+# Record new fingerprints for a feature class and direction whose source content was found unchanged,
+#   so the next run can skip it from the fingerprints without hashing the source again
+def RecordUnchanged(featName, direction, srcFingerprint, tgtFingerprint):
+    if conn is None:
+        return
+    if bQueueWrites:
+        lstPendingWrites.append(('RecordUnchanged', (featName, direction, srcFingerprint, tgtFingerprint)))
+        state = GetState(featName, direction)
+        if state is not None: # like the UPDATE, there is nothing to change without a recorded sync
+            state['src_fingerprint'] = srcFingerprint
+            state['tgt_fingerprint'] = tgtFingerprint
+            dictPendingStates[(featName.lower(), direction)] = state
+        return
+    conn.execute('UPDATE sync_state SET src_fingerprint = ?, tgt_fingerprint = ? WHERE feature = ? AND direction = ?',
+        (srcFingerprint, tgtFingerprint, featName.lower(), direction))
+    conn.commit()
+
+
+# Clear the queued writes, once they have been handed to the main process
+def ClearPendingWrites():
+    del lstPendingWrites[:]
+    dictPendingStates.clear()
+
+
+# Write the writes queued by a worker process (lstPendingWrites) to the manifest
+def ApplyWrites(lstWrites):
+    for funcName, args in lstWrites:
+        if funcName == 'RecordSync':
+            RecordSync(*args)
+        elif funcName == 'RecordUnchanged':
+            RecordUnchanged(*args)
+
+
+# Close the manifest database
+def Close():
+    global conn
+    if conn is not None:
+        conn.close()
+        conn = None
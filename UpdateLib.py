@@ -4,8 +4,19 @@ import sys, os, traceback
 import LibMgrUtility
 from datetime import datetime as datim
 import Metadata
+import GDBCatalog
+import FileCatalog
+import SyncManifest
+import DeltaSync
+import ShapefileWriter
+import ShapeTransfer
+import ShapefileIndex
+import CloudFormats
+import Projection
 #import PC_Python
-import ConfigParser
+import LibMgrSettings
+import GDBPrivileges
+import GDBLocks
 
 # custom error exception for all functions in this module
 class UpdateLibError(Exception):
@@ -15,19 +26,372 @@ class UpdateLibError(Exception):
 class UpdateLibWarning(Exception):
     pass
 
-def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    metaServer = parser.get('Source', 'metaServer')
-    metaDb = parser.get('Source', 'metaDb')
-    libGDBSchema = parser.get('Library', 'libGDBSchema')
-    libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-    libGDBAdminConn = parser.get('Library', 'libGDBAdminConn')
-    libGDBServer = parser.get('Library', 'libGDBServer')
-    libGDBDb = parser.get('Library', 'libGDBDb')
-    outLocalPath = parser.get('Local', 'outLocalPath')
-    outLocalFGDB = parser.get('Local', 'outLocalFGDB')
+# raised by the *toLIB functions when the library feature class must be replaced but is locked by other users and
+#   locked feature classes are deferred (bDeferLocked). The caller retries the row later.
+class UpdateLibLocked(UpdateLibWarning):
+    pass
+
+
+# Get the staged shapefile directory for a metadata row, with a trailing slash
+def GetStageShapePath(row):
+    srcPath = row['stagepath'].lower()
+    if srcPath[-1] != '\\' and srcPath[-1] != '/': # Check for trailing slash. Set one if not there.
+        srcPath = srcPath + '/'
+    return srcPath
+
+
+# Get the library shapefile directory for a metadata row, with a trailing slash
+def GetLibraryShapePath(row):
+    shplibPath = row['updatepath'].lower().replace('\\covers\\','\\shapes\\')
+    if shplibPath[-1] != '\\' and shplibPath[-1] != '/': # Check for trailing slash. Set one if not there.
+        shplibPath = shplibPath + '/'
+    return shplibPath
+
+
+# results of ApplyDeltaToLibrary
+deltaReplace = 0 # the library feature class must be replaced instead
+deltaApplied = 1 # the library feature class was updated in place
+deltaUnchanged = 2 # no rows differ, so the library feature class was left as is
+
+
+# Apply a staged feature class to the library feature class as row inserts, updates and deletes.
+#   Returns deltaApplied if the library was updated in place, deltaUnchanged if there were no row changes to apply or
+#   deltaReplace if the library feature class must be replaced instead.
+def ApplyDeltaToLibrary(localFeatPath, libFeatPath, libGDBDirectConn, libGDBSchema, libGDBSqlConn, deltaKeyField, featName, logger, lstErrCnt):
+    if not GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn):
+        return deltaReplace # nothing to apply a delta to
+
+    try:
+        iIns, iUpd, iDel = DeltaSync.ApplyDelta(localFeatPath, libFeatPath, libGDBDirectConn, deltaKeyField)
+    except DeltaSync.DeltaSyncWarning as e:
+        logger.info('\tDelta sync not possible (' + str(e) + '). Replacing library feature class')
+        return deltaReplace
+    except Exception as e:
+        logger.warning('\tWARNING - Applying delta to library feature class. Replacing library feature class - ' + featName, exc_info=True)
+        lstErrCnt[1] += 1
+        return deltaReplace
+    if iIns == 0 and iUpd == 0 and iDel == 0:
+        logger.info('\tSUCCESS - Applying delta to library feature class - no rows changed')
+        return deltaUnchanged
+    logger.info('\tSUCCESS - Applying delta to library feature class - inserted: ' + str(iIns) +\
+        ', updated: ' + str(iUpd) + ', deleted: ' + str(iDel))
+    return deltaApplied
+
+
+# Record in the manifest that a delta found no row changes, so the source isn't staged again until it changes. The
+#   library date, metadata and shapefile are left as they are.
+def RecordDeltaUnchanged(featName, direction, srcFingerprint, libFingerprint, logger, lstErrCnt):
+    logger.info('\tLibrary feature class content is unchanged. Skipping publish')
+    try:
+        SyncManifest.RecordUnchanged(featName, direction, srcFingerprint, libFingerprint)
+    except Exception as e:
+        logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+        lstErrCnt[1] += 1
+
+
+# suffixes of the shadow and retired library feature classes used by PublishShadow
+shadowSuffix = '_shd'
+retiredSuffix = '_old'
+
+
+# Publish a staged feature class to the library through a shadow feature class. The staged copy is loaded into
+#   <featName>_shd beside the library feature class and its metadata and privileges are set there. The shadow is then
+#   swapped in with two renames and the previous version is deleted, so readers lose the library feature class only
+#   between the renames instead of for the whole load. Returns an empty list of disconnected users like SafeConvert.
+#   Raises UpdateLibError if the library feature class is locked by other users, since it couldn't be renamed, or if
+#   the shadow can't be swapped in.
+def PublishShadow(row, localFGDBPath, featName, metaConnStr, logger, lstErrCnt):
+    settings = LibMgrSettings.Get()
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBSchema = settings.libGDBSchema
+    libGDBSqlConn = settings.libGDBSqlConn
+    libGDBDb = settings.libGDBDb
+
+    shadowName = featName + shadowSuffix
+    retiredName = featName + retiredSuffix
+    libFeatPath = libGDBDirectConn + '/' + libGDBSchema + '.' + featName
+    shadowPath = libGDBDirectConn + '/' + libGDBSchema + '.' + shadowName
+    retiredPath = libGDBDirectConn + '/' + libGDBSchema + '.' + retiredName
+
+    # a locked library feature class can't be renamed, so don't build a shadow that can't be swapped in
+    if GDBLocks.IsLocked(featName, libGDBSchema, libGDBSqlConn):
+        raise UpdateLibError('Library feature class is locked by other users. Not publishing shadow - ' + featName)
+
+    # load the shadow, replacing any left behind by an earlier publish that failed
+    for path in [shadowPath, retiredPath]:
+        if arcpy.Exists(path):
+            arcpy.Delete_management(path)
+    arcpy.FeatureClassToFeatureClass_conversion(localFGDBPath + '/' + featName, libGDBDirectConn, shadowName)
+    logger.info('\tSUCCESS - Loading shadow feature class - ' + shadowName)
+
+    # set metadata and privileges on the shadow so it is complete when it is swapped in
+    try:
+        Metadata.UpdateFCMetadata(shadowPath, metaConnStr, True, featName)
+    except Exception as e:
+        logger.warning('\tWARNING - Updating feature class metadata for ' + shadowName, exc_info=True)
+        lstErrCnt[1] += 1
+    try:
+        LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, shadowName, True, libGDBSqlConn, True)
+    except Exception as e:
+        logger.error('\tError - Setting privileges - ' + shadowName, exc_info=True)
+        lstErrCnt[0] += 1
+
+    # swap the shadow in. If the shadow can't be renamed, the previous version is put back.
+    bExists = arcpy.Exists(libFeatPath)
+    if bExists:
+        arcpy.Rename_management(libFeatPath, retiredPath)
+    try:
+        arcpy.Rename_management(shadowPath, libFeatPath)
+    except Exception as e:
+        logger.error('\tERROR - Renaming shadow feature class ' + shadowName + ' to ' + featName, exc_info=True)
+        if bExists:
+            try:
+                arcpy.Rename_management(retiredPath, libFeatPath)
+            except Exception as e:
+                logger.error('\tERROR - Restoring previous library feature class from ' + retiredName, exc_info=True)
+                lstErrCnt[0] += 1
+            else:
+                logger.info('\tRestored previous library feature class from ' + retiredName)
+        raise UpdateLibError('Swapping shadow feature class into the library failed - ' + featName)
+    GDBPrivileges.UpdateSnapshot(featName, libGDBSchema, libGDBSqlConn, GDBPrivileges.GetGrants(shadowName, libGDBSchema, libGDBSqlConn))
+    logger.info('\tSUCCESS - Swapping shadow feature class into the library')
+
+    if bExists:
+        try:
+            arcpy.Delete_management(retiredPath)
+        except Exception as e: # still in use by a reader. It is deleted by the next publish of the feature class.
+            logger.warning('\tWARNING - Deleting previous library feature class - ' + retiredName, exc_info=True)
+            lstErrCnt[1] += 1
+    return []
+
+
+# Export a feature class to a shapefile with the configured shapefile writer (arcpy or native).
+#   The native writer falls back to SafeConvert for feature classes it can't write (ie. Z or M geometry).
+#   lstDerivedFields (field name, cursor token) names the geometry derived fields written by the native writer (ie. the
+#   library field names when exporting a staged copy), None for the feature class's own.
+def ExportShapefile(srcWrkspc, srcFeatNameQual, shpPath, featName, shapefileWriter, logger, lstDerivedFields=None):
+    if shapefileWriter == 'native':
+        try:
+            iCnt = ShapefileWriter.ExportFeatureClass(srcWrkspc + '/' + srcFeatNameQual, shpPath, featName, logger,
+                                                      lstDerivedFields)
+        except ShapefileWriter.ShapefileWriterWarning as e:
+            logger.info('\tNative shapefile writer not used (' + str(e) + '). Using SafeConvert')
+        else:
+            logger.info('\tExported ' + str(iCnt) + ' features with the native shapefile writer')
+            return
+    PC_Geoprocessing.SafeConvert(srcWrkspc, srcFeatNameQual, shpPath, featName + '.shp', logger)
+
+
+# Build the quadtree spatial index (.qix) of an exported shapefile with shapefileIndex = true. The index is only
+#   rebuilt if the shapefile is newer. A shapefile whose index can't be built is still exported, without an index.
+def IndexShapefile(shpPath, featName, logger, lstErrCnt):
+    if not LibMgrSettings.Get().shapefileIndex:
+        return
+    try:
+        if ShapefileIndex.BuildIndex(shpPath + featName):
+            logger.info('\tSUCCESS - Building shapefile spatial index - ' + shpPath + featName + '.qix')
+    except Exception as e:
+        logger.warning('\tWARNING - Building shapefile spatial index - ' + shpPath + featName, exc_info=True)
+        lstErrCnt[1] += 1
+
+
+# Export a feature class to a library shapefile folder. With shapefileTransfer = local, the shapefile is exported to a
+#   local directory of folderName (ie. shapes) and its transfer to the library folder is started on the transfer thread
+#   pool. Returns the transfer to finish with ShapeTransfer.FinishTransfer, or None if it was exported directly.
+def ExportLibraryShapefile(srcWrkspc, srcFeatNameQual, shpPath, folderName, featName, logger, lstErrCnt, lstDerivedFields=None):
+    settings = LibMgrSettings.Get()
+    if settings.shapefileTransfer != 'local':
+        ExportShapefile(srcWrkspc, srcFeatNameQual, shpPath, featName, settings.shapefileWriter, logger, lstDerivedFields)
+        IndexShapefile(shpPath, featName, logger, lstErrCnt)
+        return None
+    localShpPath = ShapeTransfer.GetLocalDir(folderName)
+    ShapefileWriter.DeleteShapefile(localShpPath + featName, True) # left behind by an earlier failed transfer
+    ExportShapefile(srcWrkspc, srcFeatNameQual, localShpPath, featName, settings.shapefileWriter, logger, lstDerivedFields)
+    IndexShapefile(localShpPath, featName, logger, lstErrCnt) # transferred with the shapefile
+    return ShapeTransfer.StartTransfer(localShpPath, featName, shpPath)
+
+
+# Export a library feature class to its shapefile and its geographic (lat/lon) shapefile with one read of the feature
+#   class. Each batch read is written to the State Plane shapefile and, projected with the inverse Transverse Mercator,
+#   to the lat/lon shapefile. Returns a tuple of the two transfers like ExportLibraryShapefile, or None if the copies
+#   must be exported separately (not the native writer, not Transverse Mercator on the geographic datum, Z or M).
+def ExportLatLonFanOut(srcFeatPath, shplibPath, shplibGeoPath, featName, srGeographic, logger, lstErrCnt, lstDerivedFields=None):
+    settings = LibMgrSettings.Get()
+    if settings.shapefileWriter != 'native':
+        return None
+    params = Projection.GetTransverseMercatorParams(arcpy.Describe(srcFeatPath).spatialReference, srGeographic.datumName)
+    if params is None:
+        return None
+
+    # project State Plane x and y arrays to longitude (x) and latitude (y) arrays
+    def ProjectToGeographic(x, y):
+        lat, lon = Projection.InverseTransverseMercator(x, y, params)
+        return (lon, lat)
+
+    if settings.shapefileTransfer == 'local':
+        shpPath = ShapeTransfer.GetLocalDir('shapes')
+        shpGeoPath = ShapeTransfer.GetLocalDir('shapes_lat_lon')
+    else:
+        shpPath = shplibPath
+        shpGeoPath = shplibGeoPath
+    prjWkt = srGeographic.exportToString().split(';')[0]
+    lstSinks = [(shpPath, featName, None, ''), (shpGeoPath, featName, ProjectToGeographic, prjWkt)]
+    try:
+        iCnt = ShapefileWriter.ExportFeatureClassFanOut(srcFeatPath, lstSinks, logger, lstDerivedFields)
+    except ShapefileWriter.ShapefileWriterWarning as e:
+        logger.info('\tSingle read export not used (' + str(e) + '). Exporting the lat/lon copy separately')
+        return None
+    logger.info('\tExported ' + str(iCnt) + ' features to the shapefile and lat/lon shapefile with one read')
+    IndexShapefile(shpPath, featName, logger, lstErrCnt)
+    IndexShapefile(shpGeoPath, featName, logger, lstErrCnt)
+
+    if settings.shapefileTransfer == 'local':
+        return (ShapeTransfer.StartTransfer(shpPath, featName, shplibPath), ShapeTransfer.StartTransfer(shpGeoPath, featName, shplibGeoPath))
+    return (None, None)
+
+
+# staged copies published to the library in this iteration keyed by feature name, so LIBtoSHP can export the
+#   shapefile from the library ready staged copy instead of reading the library feature class back
+dictStaged = {}
+
+# LIBtoSHP refreshes whose shapefiles are still transferring to the library, finished by FinishPendingExports
+lstPendingExports = []
+
+
+# Get the geometry derived fields to export a staged copy of a library feature class with, so its shapefile has the
+#   same fields as one exported from the library (ie. Shape_Area in a file geodatabase is written as SHAPE.STArea()).
+#   Returns the library's derived fields as (field name, cursor token), or None if the shapefile must be exported from
+#   the library (the attribute fields differ, or the derived fields differ and the arcpy writer can't rename them).
+def GetStagedDerivedFields(stagedFeatPath, libFeatPath, shapefileWriter):
+    descStaged = arcpy.Describe(stagedFeatPath)
+    descLib = arcpy.Describe(libFeatPath)
+    lstStagedNames = [fld.name.upper() for fld in ShapefileWriter.GetAttributeFields(descStaged)]
+    lstLibNames = [fld.name.upper() for fld in ShapefileWriter.GetAttributeFields(descLib)]
+    if lstStagedNames != lstLibNames:
+        return None
+    lstDerivedFields = ShapefileWriter.GetDerivedFields(descLib)
+    if [name.upper() for name, token in ShapefileWriter.GetDerivedFields(descStaged)] == [name.upper() for name, token in lstDerivedFields]:
+        return lstDerivedFields
+    if shapefileWriter != 'native':
+        return None
+    try:
+        ShapefileWriter.CheckFeatureClass(descStaged)
+    except ShapefileWriter.ShapefileWriterWarning as e:
+        return None # SafeConvert would write the staged copy's derived fields
+    return lstDerivedFields
+
+
+# Get the source of the cloudFormats copies of a library shapefile exported from srcFeatPath, so the copies have the
+#   feature class field names and types instead of the shapefile's. A staged copy in a file geodatabase is used as is.
+#   The library feature class or a copy staged in memory is first copied to localFGDBPath, since GDAL reads file
+#   geodatabases (OpenFileGDB) but not SDE connections or the in_memory workspace. Returns (file geodatabase path,
+#   feature class name).
+def GetCloudFormatSource(srcFeatPath, localFGDBPath, featName):
+    srcWrkspc, srcName = srcFeatPath.rsplit('/', 1)
+    if srcWrkspc.lower().endswith('.gdb'):
+        return (srcWrkspc, srcName)
+    localCloudFeatPath = localFGDBPath + '/' + featName + '_cloud' # keep a staged copy of featName
+    if arcpy.Exists(localCloudFeatPath):
+        arcpy.Delete_management(localCloudFeatPath)
+    arcpy.CopyFeatures_management(srcFeatPath, localCloudFeatPath)
+    return (localFGDBPath, featName + '_cloud')
+
+
+# Delete the copy of a library shapefile in a cloud format from its library folder, so an older copy isn't left
+#   beside the refreshed shapefile
+def DeleteLibraryCloudFormat(shplibPath, featName, fmt, logger, lstErrCnt):
+    try:
+        if CloudFormats.DeleteCloudFormat(shplibPath, featName, fmt):
+            logger.info('\tDeleted stale ' + fmt + ' copy of shapefile')
+    except Exception as e:
+        logger.error('\tERROR - Deleting stale ' + fmt + ' copy of shapefile - ' + featName, exc_info=True)
+        lstErrCnt[0] += 1
+
+
+# Write the cloudFormats copies (ie. GeoParquet, FlatGeobuf) of a library shapefile to its library folder from the
+#   source from GetCloudFormatSource. If there is no source (tplSource is None), or a copy can't be written, the copy
+#   is deleted from the library folder.
+def ExportLibraryCloudFormats(tplSource, shplibPath, featName, logger, lstErrCnt):
+    for fmt in LibMgrSettings.Get().cloudFormats:
+        if tplSource is None:
+            DeleteLibraryCloudFormat(shplibPath, featName, fmt, logger, lstErrCnt)
+            continue
+        try:
+            CloudFormats.ExportCloudFormat(tplSource[0], tplSource[1], shplibPath, featName, fmt)
+        except Exception as e:
+            logger.error('\tERROR - Writing ' + fmt + ' copy of shapefile - ' + featName, exc_info=True)
+            lstErrCnt[0] += 1
+            DeleteLibraryCloudFormat(shplibPath, featName, fmt, logger, lstErrCnt)
+        else:
+            logger.info('\tSUCCESS - Writing ' + fmt + ' copy of shapefile')
+
+
+# Get the staging workspace for a feature class. With stagingBackend = memory, feature classes below the size
+#   thresholds are staged in the in_memory workspace. SHAPEFILESIZE and the row count from the last sync in the
+#   manifest are the size estimates. Feature classes over either threshold or with no estimate spill to localFGDBPath.
+def GetStagingWorkspace(row, direction, localFGDBPath):
+    settings = LibMgrSettings.Get()
+    stagingBackend = settings.stagingBackend
+    memoryMaxBytes = settings.memoryStagingMaxBytes
+    memoryMaxRows = settings.memoryStagingMaxRows
+
+    if stagingBackend != 'memory':
+        return localFGDBPath
+
+    lstEstimates = []
+    try:
+        shpSize = float(row['SHAPEFILESIZE'])
+    except (TypeError, ValueError, KeyError) as e:
+        shpSize = None
+    if shpSize is not None and shpSize == shpSize: # not NaN
+        lstEstimates.append(shpSize <= memoryMaxBytes)
+    try:
+        state = SyncManifest.GetState(row['feature'].lower(), direction)
+    except Exception as e:
+        state = None
+    if state is not None and state['row_count'] is not None:
+        lstEstimates.append(state['row_count'] <= memoryMaxRows)
+
+    if len(lstEstimates) > 0 and all(lstEstimates):
+        return 'in_memory'
+    return localFGDBPath
+
+
+# Release a staged feature class held in the in_memory workspace. Staged copies on disk are kept until the next run.
+def ReleaseStaging(localFeatPath):
+    if localFeatPath.lower().startswith('in_memory/'):
+        try:
+            arcpy.Delete_management(localFeatPath)
+        except Exception as e:
+            pass # in_memory is cleared when the feature class finishes processing
+
+
+# Release the staged copy of a feature class published in this iteration, once its shapefile has been exported
+def ReleaseStaged(featName):
+    localFeatPath = dictStaged.pop(featName.lower(), None)
+    if localFeatPath is not None:
+        ReleaseStaging(localFeatPath)
+
+
+# Raise UpdateLibLocked if locked feature classes are deferred (bDeferLocked) and the library feature class is locked
+#   by other users. Called once a replace of the library feature class is known to be needed.
+def CheckLibraryLock(featName, bDeferLocked, logger):
+    settings = LibMgrSettings.Get()
+    if bDeferLocked and GDBLocks.IsLocked(featName, settings.libGDBSchema, settings.libGDBSqlConn):
+        logger.info('\tLibrary feature class is locked by other users. Deferring the refresh to the end of the run')
+        raise UpdateLibLocked('Library feature class is locked by other users - ' + featName)
+
+
+def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr, localFGDBPath='', bDeferLocked=False):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBAdminConn = settings.libGDBAdminConn
+    publishMode = settings.publishMode
+    libGDBDb = settings.libGDBDb
+    deltaSync = settings.deltaSync
+    deltaKeyField = settings.deltaKeyField
 
     rsltUpdated = False
     bSync = False
@@ -41,19 +405,21 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     srcSchemaName = stdExpSrc.split('.')[2]
     
     # assemble source connections
-    metaDBSqlConn = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
-    srcGDBDirectConn = 'Database Connections/logon@' + srcDbName + '@' + srcServerName + '.sde'
-    srcGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + srcServerName + ';DATABASE=' + srcDbName + ';Trusted_Connection=yes'
+    metaDBSqlConn = settings.metaDBSqlConn
+    srcGDBDirectConn = LibMgrSettings.GetSdeConnFile(srcServerName, srcDbName)
+    srcGDBSqlConn = LibMgrSettings.GetSqlConnStr(srcServerName, srcDbName)
 
     # assemble library SQL connection string
-    libGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + libGDBServer + ';DATABASE=' + libGDBDb + ';Trusted_Connection=yes'
+    libGDBSqlConn = settings.libGDBSqlConn
 
     featName = row['feature'].lower()
     srcFeatNameQual = srcSchemaName + '.' + featName
     srcFeatPath = srcGDBDirectConn + '/' + srcFeatNameQual
     libFeatNameQual = libGDBSchema + '.' + featName
     libFeatPath = libGDBDirectConn + '/' + libFeatNameQual
-    localFGDBPath = outLocalPath + '/' + outLocalFGDB
+    if localFGDBPath == '': # use the shared staging file geodatabase unless a worker process passed its own
+        localFGDBPath = settings.outLocalFGDBPath
+    localFGDBPath = GetStagingWorkspace(row, 'EditGDBtoLIB', localFGDBPath) # small feature classes may be staged in memory
     localFeatPath = localFGDBPath + '/' + featName
 
     if ignorestatus: # set flag indicating if sync is required
@@ -63,12 +429,23 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     logger.info('\tSource: ' + srcFeatPath)
     logger.info('\tTarget: ' + libFeatPath)
 
+    # fingerprints from the snapshots to compare with the last successful sync recorded in the manifest
+    srcFingerprint = GDBCatalog.GetFingerprint(featName, srcSchemaName, srcGDBSqlConn, True)
+    libFingerprint = GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn)
+    if not bSync and SyncManifest.IsUnchanged(featName, 'EditGDBtoLIB', srcFingerprint, libFingerprint):
+        logger.info('\tSUCCESS - Source and target unchanged since last sync. Skipping refresh')
+        return rsltUpdated
+
     if not bSync: # if the sync flag is still false get the last modified datetimes to make determination
-        if arcpy.Exists(srcFeatPath): # Check that the source feature class exists.
+        if GDBCatalog.FeatureClassExists(srcFeatPath, featName, srcSchemaName, srcGDBSqlConn): # Check that the source feature class exists.
             try:
-                srcdt = PC_Geoprocessing.GetVersionedGDBLastModDate(featName, srcGDBSqlConn, srcSchemaName)
-                if arcpy.Exists(libFeatPath): # If the target GDBLib feature class exists, get last modified date
-                    libdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                srcdt = GDBCatalog.GetLastModDate(featName, srcSchemaName, srcGDBSqlConn)
+                if GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn): # If the target GDBLib feature class exists, get last modified date
+                    libdt = GDBCatalog.GetCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                    if deltaSync: # a delta updates the library in place without changing its create date
+                        pubdt = SyncManifest.GetPublishedDate(featName, 'EditGDBtoLIB')
+                        if pubdt is not None and pubdt > libdt:
+                            libdt = pubdt
                 else:
                     bSync = True
                 if not bSync: # if the sync flag is still false, determine if source is newer than target
@@ -85,7 +462,7 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     if bSync: # finally, if the sync flag is true, proceed with update
         # create local copy of the source feature class to prep for library
         try:
-            arcpy.FeatureClassToFeatureClass_conversion(srcFeatPath,localFGDBPath,featName)
+            schemaPlan = LibMgrUtility.CopyToStaging(srcFeatPath, localFGDBPath, featName) # copy with the library schema
         except Exception as e:
             logger.error('\tERROR - Creating local copy of the source feature class - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -95,7 +472,7 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # make required field changes to prep for library
         try:
-            LibMgrUtility.PrepFieldsForLibrary(localFeatPath)
+            LibMgrUtility.PrepFieldsForLibrary(localFeatPath, schemaPlan)
         except Exception as e:
             logger.error('\tERROR - Preparing feature class fields for library - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -118,7 +495,21 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # copy the staged feature class to the library
         try:
-            lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+            deltaResult = deltaReplace
+            if deltaSync: # apply only the row changes if possible, before falling back to replacing the library feature class
+                deltaResult = ApplyDeltaToLibrary(localFeatPath, libFeatPath, libGDBDirectConn, libGDBSchema, libGDBSqlConn, deltaKeyField, featName, logger, lstErrCnt)
+            if deltaResult == deltaUnchanged:
+                RecordDeltaUnchanged(featName, 'EditGDBtoLIB', srcFingerprint, libFingerprint, logger, lstErrCnt)
+                return rsltUpdated
+            bDeltaApplied = deltaResult == deltaApplied
+            if not bDeltaApplied:
+                CheckLibraryLock(featName, bDeferLocked, logger)
+            if not bDeltaApplied and publishMode == 'shadow':
+                lstDisconnected = PublishShadow(row, localFGDBPath, featName, metaConnStr, logger, lstErrCnt)
+            elif not bDeltaApplied:
+                lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+        except UpdateLibLocked as e:
+            raise # retried by the caller
         except PC_Geoprocessing.PC_GeoprocessingError as e:
             logger.error('\tERROR - SafeConverting local copy to target - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -133,19 +524,25 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
         else:
             updateDT = datim.strptime(datim.now().strftime('%Y-%m-%d %H:%M:%S'),'%Y-%m-%d %H:%M:%S')
             rsltUpdated = True
+            GDBCatalog.RefreshFeatureClass(featName, libGDBSchema, libGDBSqlConn) # keep the catalog snapshot current for LIBtoSHP
 
-            # Update feature class metadata from the library metadata table
+            # Update feature class metadata from the library metadata table. A replaced feature class has lost its
+            #   metadata. One updated in place or published through a shadow has it and is only updated if the
+            #   metadata inputs changed.
             try:
-                Metadata.UpdateFCMetadata(libFeatPath, metaConnStr)
+                bImported = Metadata.UpdateFCMetadata(libFeatPath, metaConnStr, not bDeltaApplied and publishMode != 'shadow')
             except Exception as e:
                 logger.warning('\tWARNING - Updating feature class metadata for ' + featName, exc_info=True)
                 lstErrCnt[1] += 1
             else:
-                logger.info('\tSUCCESS - Updating feature class metadata')
+                if bImported:
+                    logger.info('\tSUCCESS - Updating feature class metadata')
+                else:
+                    logger.info('\tFeature class metadata is unchanged. Skipping metadata update')
 
             # set privileges on the updated feature class
             try:
-                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True)
+                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True, libGDBSqlConn, not bDeltaApplied and publishMode != 'shadow')
             except Exception as e:
                 logger.error('\tError - Setting privileges - ' + featName, exc_info=True)
                 lstErrCnt[0] += 1
@@ -162,25 +559,30 @@ def EditGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
                 lstErrCnt[1] += 1
             else:
                 logger.info('\tSUCCESS - Updating metadata table for library feature class')
+
+            # record the successful sync in the manifest
+            try:
+                SyncManifest.RecordSync(featName, 'EditGDBtoLIB', srcFingerprint, GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn), LibMgrUtility.GetRowCount(localFeatPath), updateDT)
+            except Exception as e:
+                logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                lstErrCnt[1] += 1
+
+            dictStaged[featName] = localFeatPath # LIBtoSHP exports from the staged copy. Released by ReleaseStaged.
     else:
         logger.info('\tLibrary feature class is up to date. Skipping refresh')
 
     return rsltUpdated
 
 
-def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    metaServer = parser.get('Source', 'metaServer')
-    metaDb = parser.get('Source', 'metaDb')
-    libGDBSchema = parser.get('Library', 'libGDBSchema')
-    libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-    libGDBAdminConn = parser.get('Library', 'libGDBAdminConn')
-    libGDBServer = parser.get('Library', 'libGDBServer')
-    libGDBDb = parser.get('Library', 'libGDBDb')
-    outLocalPath = parser.get('Local', 'outLocalPath')
-    outLocalFGDB = parser.get('Local', 'outLocalFGDB')
+def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr, localFGDBPath='', bDeferLocked=False):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBAdminConn = settings.libGDBAdminConn
+    publishMode = settings.publishMode
+    libGDBDb = settings.libGDBDb
+    fingerprintMode = settings.fingerprintMode
 
     rsltUpdated = False
     bSync = False
@@ -188,20 +590,20 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     sdt = datim(1900,1,1) # 1900/01/01 initial value for source GDB feature class datetime
     
     # assemble metadata SQL connection string
-    metaDBSqlConn = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
+    metaDBSqlConn = settings.metaDBSqlConn
 
     # assemble library SQL connection string
-    libGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + libGDBServer + ';DATABASE=' + libGDBDb + ';Trusted_Connection=yes'
+    libGDBSqlConn = settings.libGDBSqlConn
     
     featName = row['feature'].lower()
-    srcPath = row['stagepath'].lower()
-    if srcPath[-1] != '\\' and srcPath[-1] != '/': # Check for trailing slash. Set one if not there.
-        srcPath = srcPath + '/'
+    srcPath = GetStageShapePath(row)
     srcFeatNameQual = featName + '.shp'
     srcFeatPath = srcPath + srcFeatNameQual
     libFeatNameQual = libGDBSchema + '.' + featName
     libFeatPath = libGDBDirectConn + '/' + libFeatNameQual
-    localFGDBPath = outLocalPath + '/' + outLocalFGDB
+    if localFGDBPath == '': # use the shared staging file geodatabase unless a worker process passed its own
+        localFGDBPath = settings.outLocalFGDBPath
+    localFGDBPath = GetStagingWorkspace(row, 'StgSHPtoLIB', localFGDBPath) # small feature classes may be staged in memory
     localFeatPath = localFGDBPath + '/' + featName
 
     if ignorestatus: # set flag indicating if sync is required
@@ -211,12 +613,19 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     logger.info('\tSource: ' + srcFeatPath)
     logger.info('\tTarget: ' + libFeatPath)
 
+    # fingerprints from the snapshots to compare with the last successful sync recorded in the manifest
+    srcFingerprint = FileCatalog.GetFingerprint(srcPath, featName)
+    libFingerprint = GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn)
+    if not bSync and SyncManifest.IsUnchanged(featName, 'StgSHPtoLIB', srcFingerprint, libFingerprint):
+        logger.info('\tSUCCESS - Source and target unchanged since last sync. Skipping refresh')
+        return rsltUpdated
+
     if not bSync: # if the sync flag is still false get the last modified datetimes to make determination
-        if os.path.exists(srcFeatPath): # Check that the source shapefile exists
+        if FileCatalog.ShapefileExists(srcPath, featName): # Check that the source shapefile exists
             try:
-                srcdt = PC_Geoprocessing.GetShapefileLastModDate(srcFeatPath)
-                if arcpy.Exists(libFeatPath): # If the target GDBLib feature class exists, get last modified date
-                    libdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                srcdt = FileCatalog.GetShapefileLastModDate(srcPath, featName)
+                if GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn): # If the target GDBLib feature class exists, get last modified date
+                    libdt = GDBCatalog.GetCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
                 else:
                     bSync = True
                 if not bSync: # if the sync flag is still false, determine if source is newer than target
@@ -228,10 +637,29 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
             return
         logger.info('\tSUCCESS - Determining if source is newer than target - ' + str(bSync))
 
+    # in hash fingerprint mode, reload only if the source content differs from the last published content
+    srcHash = None
+    if bSync and fingerprintMode == 'hash':
+        try:
+            srcHash = FileCatalog.HashFiles(FileCatalog.GetShapefileHashFiles(srcPath, featName))
+        except Exception as e:
+            logger.warning('\tWARNING - Hashing source shapefile content - ' + featName, exc_info=True)
+            lstErrCnt[1] += 1
+        else:
+            if not ignorestatus and srcHash == SyncManifest.GetContentHash(featName, 'StgSHPtoLIB') \
+                    and GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn):
+                bSync = False
+                logger.info('\tSUCCESS - Source content is unchanged since last sync')
+                try: # record the new fingerprints so the next run skips without hashing again
+                    SyncManifest.RecordUnchanged(featName, 'StgSHPtoLIB', srcFingerprint, libFingerprint)
+                except Exception as e:
+                    logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                    lstErrCnt[1] += 1
+
     if bSync: # finally, if the sync flag is true, proceed with update
         # create local FGDB version of the source shapefile to prep for library
         try:
-            arcpy.FeatureClassToFeatureClass_conversion(srcFeatPath,localFGDBPath,featName)
+            schemaPlan = LibMgrUtility.CopyToStaging(srcFeatPath, localFGDBPath, featName) # copy with the library schema
         except Exception as e:
             logger.error('\tERROR - Creating local FGDB version of the source shapefile - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -241,7 +669,7 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # make required field changes to prep for library
         try:
-            LibMgrUtility.PrepFieldsForLibrary(localFeatPath)
+            LibMgrUtility.PrepFieldsForLibrary(localFeatPath, schemaPlan)
         except Exception as e:
             logger.error('\tERROR - Preparing feature class fields for library - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -251,7 +679,13 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # copy the staged feature class to the library
         try:
-            lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+            CheckLibraryLock(featName, bDeferLocked, logger)
+            if publishMode == 'shadow':
+                lstDisconnected = PublishShadow(row, localFGDBPath, featName, metaConnStr, logger, lstErrCnt)
+            else:
+                lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+        except UpdateLibLocked as e:
+            raise # retried by the caller
         except PC_Geoprocessing.PC_GeoprocessingError as e:
             logger.error('\tERROR - SafeConverting local copy to target - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -266,18 +700,22 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
         else:
             updateDT = datim.strptime(datim.now().strftime('%Y-%m-%d %H:%M:%S'),'%Y-%m-%d %H:%M:%S')
             rsltUpdated = True
+            GDBCatalog.RefreshFeatureClass(featName, libGDBSchema, libGDBSqlConn) # keep the catalog snapshot current for LIBtoSHP
 
             # Update feature class metadata from the library metadata table
             try:
-                Metadata.UpdateFCMetadata(libFeatPath, metaConnStr)
+                bImported = Metadata.UpdateFCMetadata(libFeatPath, metaConnStr, publishMode != 'shadow') # a replaced feature class has no metadata
             except Exception as e:
                 logger.warning('\tWARNING - Updating feature class metadata for ' + featName, exc_info=True)
                 lstErrCnt[1] += 1
             else:
-                logger.info('\tSUCCESS - Updating feature class metadata')
+                if bImported:
+                    logger.info('\tSUCCESS - Updating feature class metadata')
+                else:
+                    logger.info('\tFeature class metadata is unchanged. Skipping metadata update')
 
             try:
-                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True)
+                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True, libGDBSqlConn, publishMode != 'shadow')
             except Exception as e:
                 logger.error('\tError - Setting privileges - ' + featName, exc_info=True)
                 lstErrCnt[0] += 1
@@ -294,28 +732,32 @@ def StgSHPtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
                 lstErrCnt[1] += 1
             else:
                 logger.info('\tSUCCESS - Updating metadata table for library feature class')
+
+            # record the successful sync in the manifest
+            try:
+                SyncManifest.RecordSync(featName, 'StgSHPtoLIB', srcFingerprint, GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn), LibMgrUtility.GetRowCount(localFeatPath), updateDT, srcHash)
+            except Exception as e:
+                logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                lstErrCnt[1] += 1
+
+            dictStaged[featName] = localFeatPath # LIBtoSHP exports from the staged copy. Released by ReleaseStaged.
     else:
         logger.info('\tLibrary feature class is up to date. Skipping refresh')
 
     return rsltUpdated
 
-def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    metaServer = parser.get('Source', 'metaServer')
-    metaDb = parser.get('Source', 'metaDb')
-    stageGDBDirectConn = parser.get('Source', 'stageGDBDirectConn')
-    stageGDBServer = parser.get('Source', 'stageGDBServer')
-    stageGDBDb = parser.get('Source', 'stageGDBDb')
-    stageGDBSchema = parser.get('Source', 'stageGDBSchema')
-    libGDBSchema = parser.get('Library', 'libGDBSchema')
-    libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-    libGDBAdminConn = parser.get('Library', 'libGDBAdminConn')
-    libGDBServer = parser.get('Library', 'libGDBServer')
-    libGDBDb = parser.get('Library', 'libGDBDb')
-    outLocalPath = parser.get('Local', 'outLocalPath')
-    outLocalFGDB = parser.get('Local', 'outLocalFGDB')
+def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr, localFGDBPath='', bDeferLocked=False):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    stageGDBDirectConn = settings.stageGDBDirectConn
+    stageGDBSchema = settings.stageGDBSchema
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBAdminConn = settings.libGDBAdminConn
+    publishMode = settings.publishMode
+    libGDBDb = settings.libGDBDb
+    deltaSync = settings.deltaSync
+    deltaKeyField = settings.deltaKeyField
 
     rsltUpdated = False
     bSync = False
@@ -323,18 +765,20 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     sdt = datim(1900,1,1) # 1900/01/01 initial value for source GDB feature class datetime
     
     # assemble source SQL connection strings
-    metaDBSqlConn = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
-    gdbStgSqlConn = 'DRIVER={SQL Server};SERVER=' + stageGDBServer + ';DATABASE=' + stageGDBDb + ';Trusted_Connection=yes'
+    metaDBSqlConn = settings.metaDBSqlConn
+    gdbStgSqlConn = settings.stageGDBSqlConn
 
     # assemble library SQL connection string
-    libGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + libGDBServer + ';DATABASE=' + libGDBDb + ';Trusted_Connection=yes'
+    libGDBSqlConn = settings.libGDBSqlConn
 
     featName = row['feature'].lower()
     srcFeatNameQual = stageGDBSchema + '.' + featName
     srcFeatPath = stageGDBDirectConn + '/' + srcFeatNameQual
     libFeatNameQual = libGDBSchema + '.' + featName
     libFeatPath = libGDBDirectConn + '/' + libFeatNameQual
-    localFGDBPath = outLocalPath + '/' + outLocalFGDB
+    if localFGDBPath == '': # use the shared staging file geodatabase unless a worker process passed its own
+        localFGDBPath = settings.outLocalFGDBPath
+    localFGDBPath = GetStagingWorkspace(row, 'StgGDBtoLIB', localFGDBPath) # small feature classes may be staged in memory
     localFeatPath = localFGDBPath + '/' + featName
 
     if ignorestatus: # set flag indicating if sync is required
@@ -344,13 +788,24 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     logger.info('\tSource: ' + srcFeatPath)
     logger.info('\tTarget: ' + libFeatPath)
 
+    # fingerprints from the snapshots to compare with the last successful sync recorded in the manifest
+    srcFingerprint = GDBCatalog.GetFingerprint(featName, stageGDBSchema, gdbStgSqlConn)
+    libFingerprint = GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn)
+    if not bSync and SyncManifest.IsUnchanged(featName, 'StgGDBtoLIB', srcFingerprint, libFingerprint):
+        logger.info('\tSUCCESS - Source and target unchanged since last sync. Skipping refresh')
+        return rsltUpdated
+
     if not bSync: # if the sync flag is still false get the last modified datetimes to make determination
-        if arcpy.Exists(srcFeatPath): # Check that the source feature class exists.
+        if GDBCatalog.FeatureClassExists(srcFeatPath, featName, stageGDBSchema, gdbStgSqlConn): # Check that the source feature class exists.
 
             try:
-                srcdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, stageGDBSchema, gdbStgSqlConn)
-                if arcpy.Exists(libFeatPath): # If the target GDBLib feature class exists, get last modified date
-                    libdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                srcdt = GDBCatalog.GetCreateDate(featName, stageGDBSchema, gdbStgSqlConn)
+                if GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn): # If the target GDBLib feature class exists, get last modified date
+                    libdt = GDBCatalog.GetCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                    if deltaSync: # a delta updates the library in place without changing its create date
+                        pubdt = SyncManifest.GetPublishedDate(featName, 'StgGDBtoLIB')
+                        if pubdt is not None and pubdt > libdt:
+                            libdt = pubdt
                 else:
                     bSync = True
                 if not bSync: # if the sync flag is still false, determine if source is newer than target
@@ -365,7 +820,7 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     if bSync: # finally, if the sync flag is true, proceed with update
         # create local copy of the source feature class to prep for library
         try:
-            arcpy.FeatureClassToFeatureClass_conversion(srcFeatPath,localFGDBPath,featName)
+            schemaPlan = LibMgrUtility.CopyToStaging(srcFeatPath, localFGDBPath, featName) # copy with the library schema
         except Exception as e:
             logger.error('\tERROR - Creating local copy of the source feature class - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -375,7 +830,7 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # make required field changes to prep for library
         try:
-            LibMgrUtility.PrepFieldsForLibrary(localFeatPath)
+            LibMgrUtility.PrepFieldsForLibrary(localFeatPath, schemaPlan)
         except Exception as e:
             logger.error('\tERROR - Preparing feature class fields for library - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -398,7 +853,21 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # copy the staged feature class to the library
         try:
-            lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+            deltaResult = deltaReplace
+            if deltaSync: # apply only the row changes if possible, before falling back to replacing the library feature class
+                deltaResult = ApplyDeltaToLibrary(localFeatPath, libFeatPath, libGDBDirectConn, libGDBSchema, libGDBSqlConn, deltaKeyField, featName, logger, lstErrCnt)
+            if deltaResult == deltaUnchanged:
+                RecordDeltaUnchanged(featName, 'StgGDBtoLIB', srcFingerprint, libFingerprint, logger, lstErrCnt)
+                return rsltUpdated
+            bDeltaApplied = deltaResult == deltaApplied
+            if not bDeltaApplied:
+                CheckLibraryLock(featName, bDeferLocked, logger)
+            if not bDeltaApplied and publishMode == 'shadow':
+                lstDisconnected = PublishShadow(row, localFGDBPath, featName, metaConnStr, logger, lstErrCnt)
+            elif not bDeltaApplied:
+                lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+        except UpdateLibLocked as e:
+            raise # retried by the caller
         except PC_Geoprocessing.PC_GeoprocessingError as e:
             logger.error('\tERROR - SafeConverting local copy to target - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -413,18 +882,24 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
         else:
             updateDT = datim.strptime(datim.now().strftime('%Y-%m-%d %H:%M:%S'),'%Y-%m-%d %H:%M:%S')
             rsltUpdated = True
+            GDBCatalog.RefreshFeatureClass(featName, libGDBSchema, libGDBSqlConn) # keep the catalog snapshot current for LIBtoSHP
 
-            # Update feature class metadata from the library metadata table
+            # Update feature class metadata from the library metadata table. A replaced feature class has lost its
+            #   metadata. One updated in place or published through a shadow has it and is only updated if the
+            #   metadata inputs changed.
             try:
-                Metadata.UpdateFCMetadata(libFeatPath, metaConnStr)
+                bImported = Metadata.UpdateFCMetadata(libFeatPath, metaConnStr, not bDeltaApplied and publishMode != 'shadow')
             except Exception as e:
                 logger.warning('\tWARNING - Updating feature class metadata for ' + featName, exc_info=True)
                 lstErrCnt[1] += 1
             else:
-                logger.info('\tSUCCESS - Updating feature class metadata')
+                if bImported:
+                    logger.info('\tSUCCESS - Updating feature class metadata')
+                else:
+                    logger.info('\tFeature class metadata is unchanged. Skipping metadata update')
 
             try:
-                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True)
+                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True, libGDBSqlConn, not bDeltaApplied and publishMode != 'shadow')
             except Exception as e:
                 logger.error('\tError - Setting privileges - ' + featName, exc_info=True)
                 lstErrCnt[0] += 1
@@ -441,25 +916,30 @@ def StgGDBtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
                 lstErrCnt[1] += 1
             else:
                 logger.info('\tSUCCESS - Updating metadata table for library feature class')
+
+            # record the successful sync in the manifest
+            try:
+                SyncManifest.RecordSync(featName, 'StgGDBtoLIB', srcFingerprint, GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn), LibMgrUtility.GetRowCount(localFeatPath), updateDT)
+            except Exception as e:
+                logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                lstErrCnt[1] += 1
+
+            dictStaged[featName] = localFeatPath # LIBtoSHP exports from the staged copy. Released by ReleaseStaged.
     else:
         logger.info('\tLibrary feature class is up to date. Skipping refresh')
 
     return rsltUpdated
 
 
-def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    metaServer = parser.get('Source', 'metaServer')
-    metaDb = parser.get('Source', 'metaDb')
-    libGDBSchema = parser.get('Library', 'libGDBSchema')
-    libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-    libGDBAdminConn = parser.get('Library', 'libGDBAdminConn')
-    libGDBServer = parser.get('Library', 'libGDBServer')
-    libGDBDb = parser.get('Library', 'libGDBDb')
-    outLocalPath = parser.get('Local', 'outLocalPath')
-    outLocalFGDB = parser.get('Local', 'outLocalFGDB')
+def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr, localFGDBPath='', bDeferLocked=False):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBAdminConn = settings.libGDBAdminConn
+    publishMode = settings.publishMode
+    libGDBDb = settings.libGDBDb
+    fingerprintMode = settings.fingerprintMode
 
     rsltUpdated = False
     bSync = False
@@ -467,10 +947,10 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     sdt = datim(1900,1,1) # 1900/01/01 initial value for source coverage datetime
     
     # assemble metadata SQL connection string
-    metaDBSqlConn = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
+    metaDBSqlConn = settings.metaDBSqlConn
 
     # assemble library SQL connection string
-    libGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + libGDBServer + ';DATABASE=' + libGDBDb + ';Trusted_Connection=yes'
+    libGDBSqlConn = settings.libGDBSqlConn
     
     featName = row['feature'].lower()
     srcPath = row['updatepath'].lower().replace('\\shapes', '\\covers')
@@ -483,7 +963,9 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     srcFeatTypePath = srcFeatPath + '\\' + featType
     libFeatNameQual = libGDBSchema + '.' + featName
     libFeatPath = libGDBDirectConn + '/' + libFeatNameQual
-    localFGDBPath = outLocalPath + '/' + outLocalFGDB
+    if localFGDBPath == '': # use the shared staging file geodatabase unless a worker process passed its own
+        localFGDBPath = settings.outLocalFGDBPath
+    localFGDBPath = GetStagingWorkspace(row, 'COVtoLIB', localFGDBPath) # small feature classes may be staged in memory
     localFeatPath = localFGDBPath + '/' + featName
 
     if ignorestatus: # set flag indicating if sync is required
@@ -493,12 +975,19 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
     logger.info('\tSource: ' + srcFeatPath)
     logger.info('\tTarget: ' + libFeatPath)
 
+    # fingerprints from the snapshots to compare with the last successful sync recorded in the manifest
+    srcFingerprint = None # coverages have no snapshot. Use the last modified date check below.
+    libFingerprint = GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn)
+    if not bSync and SyncManifest.IsUnchanged(featName, 'COVtoLIB', srcFingerprint, libFingerprint):
+        logger.info('\tSUCCESS - Source and target unchanged since last sync. Skipping refresh')
+        return rsltUpdated
+
     if not bSync: # if the sync flag is still false get the last modified datetimes to make determination
         if arcpy.Exists(srcFeatPath): # Check that the source coverage exists
             try:
                 srcdt = PC_Geoprocessing.GetCoverageLastModDate(srcFeatPath)
-                if arcpy.Exists(libFeatPath): # If the target GDBLib feature class exists, get last modified date
-                    libdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
+                if GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn): # If the target GDBLib feature class exists, get last modified date
+                    libdt = GDBCatalog.GetCreateDate(featName, libGDBSchema, libGDBSqlConn) # get last modified date (create date)
                 else:
                     bSync = True
                 if not bSync: # if the sync flag is still false, determine if source is newer than target
@@ -512,10 +1001,29 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
             return
         logger.info('\tSUCCESS - Determining if source is newer than target - ' + str(bSync))
 
+    # in hash fingerprint mode, reload only if the source content differs from the last published content
+    srcHash = None
+    if bSync and fingerprintMode == 'hash':
+        try:
+            srcHash = FileCatalog.HashFiles(FileCatalog.GetCoverageHashFiles(srcFeatPath))
+        except Exception as e:
+            logger.warning('\tWARNING - Hashing source coverage content - ' + featName, exc_info=True)
+            lstErrCnt[1] += 1
+        else:
+            if not ignorestatus and srcHash == SyncManifest.GetContentHash(featName, 'COVtoLIB') \
+                    and GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn):
+                bSync = False
+                logger.info('\tSUCCESS - Source content is unchanged since last sync')
+                try: # record the new fingerprints so the next run skips without hashing again
+                    SyncManifest.RecordUnchanged(featName, 'COVtoLIB', srcFingerprint, libFingerprint)
+                except Exception as e:
+                    logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                    lstErrCnt[1] += 1
+
     if bSync: # finally, if the sync flag is true, proceed with update
         # create local FGDB version of the source coverage to prep for library
         try:
-            arcpy.FeatureClassToFeatureClass_conversion(srcFeatTypePath,localFGDBPath,featName)
+            schemaPlan = LibMgrUtility.CopyToStaging(srcFeatTypePath, localFGDBPath, featName) # copy with the library schema
         except Exception as e:
             logger.error('\tERROR - Creating local FGDB version of the source coverage - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -525,7 +1033,7 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # make required field changes to prep for library
         try:
-            LibMgrUtility.PrepFieldsForLibrary(localFeatPath)
+            LibMgrUtility.PrepFieldsForLibrary(localFeatPath, schemaPlan)
         except Exception as e:
             logger.error('\tERROR - Preparing feature class fields for library - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -535,7 +1043,13 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
 
         # copy the staged feature class to the library
         try:
-            lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+            CheckLibraryLock(featName, bDeferLocked, logger)
+            if publishMode == 'shadow':
+                lstDisconnected = PublishShadow(row, localFGDBPath, featName, metaConnStr, logger, lstErrCnt)
+            else:
+                lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDBPath, featName, libGDBDirectConn, libFeatNameQual, logger, '', '', bForce, libGDBAdminConn)
+        except UpdateLibLocked as e:
+            raise # retried by the caller
         except PC_Geoprocessing.PC_GeoprocessingError as e:
             logger.error('\tERROR - SafeConverting local copy to target - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -550,18 +1064,22 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
         else:
             updateDT = datim.strptime(datim.now().strftime('%Y-%m-%d %H:%M:%S'),'%Y-%m-%d %H:%M:%S')
             rsltUpdated = True
+            GDBCatalog.RefreshFeatureClass(featName, libGDBSchema, libGDBSqlConn) # keep the catalog snapshot current for LIBtoSHP
 
             # Update feature class metadata from the library metadata table
             try:
-                Metadata.UpdateFCMetadata(libFeatPath, metaConnStr)
+                bImported = Metadata.UpdateFCMetadata(libFeatPath, metaConnStr, publishMode != 'shadow') # a replaced feature class has no metadata
             except Exception as e:
                 logger.warning('\tWARNING - Updating feature class metadata for ' + featName, exc_info=True)
                 lstErrCnt[1] += 1
             else:
-                logger.info('\tSUCCESS - Updating feature class metadata')
+                if bImported:
+                    logger.info('\tSUCCESS - Updating feature class metadata')
+                else:
+                    logger.info('\tFeature class metadata is unchanged. Skipping metadata update')
 
             try:
-                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True)
+                LibMgrUtility.SetFeatureClassPrivileges(row['SENSITIVE'], row['SenSubGrp'], libGDBDirectConn, libGDBDb, libGDBSchema, featName, True, libGDBSqlConn, publishMode != 'shadow')
             except Exception as e:
                 logger.error('\tError - Setting privileges - ' + featName, exc_info=True)
                 lstErrCnt[0] += 1
@@ -578,25 +1096,100 @@ def COVtoLIB(row, ignorestatus, bForce, logger, lstErrCnt, metaConnStr):
                 lstErrCnt[1] += 1
             else:
                 logger.info('\tSUCCESS - Updating metadata table for library feature class')
+
+            # record the successful sync in the manifest
+            try:
+                SyncManifest.RecordSync(featName, 'COVtoLIB', srcFingerprint, GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn), LibMgrUtility.GetRowCount(localFeatPath), updateDT, srcHash)
+            except Exception as e:
+                logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+                lstErrCnt[1] += 1
+
+            dictStaged[featName] = localFeatPath # LIBtoSHP exports from the staged copy. Released by ReleaseStaged.
     else:
         logger.info('\tLibrary feature class is up to date. Skipping refresh')
 
     return rsltUpdated
 
 
-def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
-    # Set connection strings and get other settings from configuration file
-    parser = ConfigParser.SafeConfigParser()
-    parser.read('LibMgr.ini')
-    metaServer = parser.get('Source', 'metaServer')
-    metaDb = parser.get('Source', 'metaDb')
-    libGDBSchema = parser.get('Library', 'libGDBSchema')
-    libGDBDirectConn = parser.get('Library', 'libGDBDirectConn')
-    libGDBServer = parser.get('Library', 'libGDBServer')
-    libGDBDb = parser.get('Library', 'libGDBDb')
-    geographicWKID = parser.get('Settings', 'geographicWKID')
-    outLocalPath = parser.get('Local', 'outLocalPath')
-    outLocalFGDB = parser.get('Local', 'outLocalFGDB')
+# sync directions that publish to the library feature class
+lstLibDirections = ['EditGDBtoLIB', 'StgSHPtoLIB', 'StgGDBtoLIB', 'COVtoLIB']
+
+
+# Get the latest datetime a feature class was published to the library from the manifest, or None if it has no
+#   recorded publish. A delta sync updates the library feature class without changing its create date.
+def GetLibraryPublishedDate(featName):
+    pubdt = None
+    for direction in lstLibDirections:
+        dt = SyncManifest.GetPublishedDate(featName, direction)
+        if dt is not None and (pubdt is None or dt > pubdt):
+            pubdt = dt
+    return pubdt
+
+
+# Finish a LIBtoSHP refresh: wait for the shapefile transfers (if exported locally), write the cloudFormats copies
+#   from tplCloudSource once the shapefile is in place, then update the metadata table and record the sync in the
+#   manifest. Returns False if the shapefile didn't reach the library.
+def FinishLIBtoSHP(row, transfer, geoTransfer, featName, shplibPath, srcFingerprint, updateDT, tplCloudSource, logger, lstErrCnt):
+    settings = LibMgrSettings.Get()
+    metaDBSqlConn = settings.metaDBSqlConn
+
+    # wait for the shapefiles exported locally to reach the library folders and rename them into place
+    if geoTransfer is not None:
+        try:
+            ShapeTransfer.FinishTransfer(geoTransfer)
+        except Exception as e:
+            logger.error('\tERROR - Transferring lat/lon shapefile to the library - ' + featName, exc_info=True)
+            lstErrCnt[0] += 1
+        else:
+            logger.info('\tSUCCESS - Transferring lat/lon shapefile to the library - ' + featName)
+    if transfer is not None:
+        try:
+            ShapeTransfer.FinishTransfer(transfer)
+        except Exception as e:
+            logger.error('\tERROR - Transferring shapefile to the library - ' + featName, exc_info=True)
+            lstErrCnt[0] += 1
+            return False
+        logger.info('\tSUCCESS - Transferring shapefile to the library - ' + featName)
+
+    # write the cloud format copies now that the shapefile they match is in the library folder
+    if len(settings.cloudFormats) > 0:
+        ExportLibraryCloudFormats(tplCloudSource, shplibPath, featName, logger, lstErrCnt)
+
+    # update metadata
+    row['DATETOUCHED'] = updateDT
+    row['SHPDATE'] = updateDT
+    FileCatalog.RefreshShapefile(shplibPath, featName) # keep the directory snapshot current after the export
+    row['SHAPEFILESIZE'] = FileCatalog.GetShapefileSize(shplibPath, featName)
+    try:
+        Metadata.UpdateLibraryMetadata(row, metaDBSqlConn, logger)
+    except Exception as e:
+        logger.warning('\tWARNING - Updating metadata table for library feature class - ' + featName, exc_info=True)
+        lstErrCnt[1] += 1
+    else:
+        logger.info('\tSUCCESS - Updating metadata table for library feature class - ' + featName)
+
+    # record the successful sync in the manifest
+    try:
+        SyncManifest.RecordSync(featName, 'LIBtoSHP', srcFingerprint, FileCatalog.GetFingerprint(shplibPath, featName), None, updateDT)
+    except Exception as e:
+        logger.warning('\tWARNING - Recording sync state in manifest - ' + featName, exc_info=True)
+        lstErrCnt[1] += 1
+    return True
+
+
+# Finish the overlapped LIBtoSHP refreshes in order, except the newest iKeep (still transferring while the next
+#   feature class is processed)
+def FinishPendingExports(iKeep=0):
+    while len(lstPendingExports) > iKeep:
+        FinishLIBtoSHP(*lstPendingExports.pop(0))
+
+
+def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt, localFGDBPath='', bOverlap=False):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    geographicWKID = settings.geographicWKID
 
     rsltUpdated = False
     bSync = False
@@ -604,33 +1197,62 @@ def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
     sdt = datim(1900,1,1) # 1900/01/01 initial value for source coverage datetime
     
     # assemble metadata SQL connection string
-    metaDBSqlConn = 'DRIVER={SQL Server};SERVER=' + metaServer + ';DATABASE=' + metaDb + ';Trusted_Connection=yes'
+    metaDBSqlConn = settings.metaDBSqlConn
 
     # assemble library SQL connection string
-    libGDBSqlConn = 'DRIVER={SQL Server};SERVER=' + libGDBServer + ';DATABASE=' + libGDBDb + ';Trusted_Connection=yes'
+    libGDBSqlConn = settings.libGDBSqlConn
 
     featName = row['feature'].lower()
     srcFeatNameQual = libGDBSchema + '.' + featName
     srcFeatPath = libGDBDirectConn + '/' + srcFeatNameQual
     shplibFeatNameQual = featName + '.shp'
-    shplibPath = row['updatepath'].lower().replace('\\covers\\','\\shapes\\')
-    if shplibPath[-1] != '\\' and shplibPath[-1] != '/': # Check for trailing slash. Set one if not there.
-        shplibPath = shplibPath + '/'
+    shplibPath = GetLibraryShapePath(row)
     shplibFeatPath = shplibPath + shplibFeatNameQual
+    if localFGDBPath == '': # use the shared staging file geodatabase unless a worker process passed its own
+        localFGDBPath = settings.outLocalFGDBPath
+    srcWrkspc = libGDBDirectConn
 
     if ignorestatus: # set flag indicating if sync is required
         bSync = True
 
+    # a feature class just published from a staged copy is exported from that copy instead of read back from the library,
+    #   with the library's geometry derived field names, unless the shapefile fields would differ
+    lstDerivedFields = None
+    if featName in dictStaged:
+        bSync = True
+        try:
+            lstDerivedFields = GetStagedDerivedFields(dictStaged[featName], srcFeatPath, settings.shapefileWriter)
+        except Exception as e:
+            logger.warning('\tWARNING - Comparing staged copy fields with library - ' + featName, exc_info=True)
+        if lstDerivedFields is None:
+            logger.info('\tStaged copy fields differ from the library. Exporting from the library')
+        else:
+            srcFeatPath = dictStaged[featName]
+            srcWrkspc, srcFeatNameQual = srcFeatPath.rsplit('/', 1)
+
     logger.info(featName.upper())
     logger.info('\tSource: ' + srcFeatPath)
     logger.info('\tTarget: ' + shplibFeatPath)
 
+    # fingerprints from the snapshots to compare with the last successful sync recorded in the manifest. A delta
+    #   sync doesn't change the library create date, so the last publish to the library is part of the fingerprint.
+    pubdt = GetLibraryPublishedDate(featName)
+    srcFingerprint = GDBCatalog.GetFingerprint(featName, libGDBSchema, libGDBSqlConn)
+    if srcFingerprint is not None and pubdt is not None:
+        srcFingerprint = srcFingerprint + ' published ' + str(pubdt)
+    shplibFingerprint = FileCatalog.GetFingerprint(shplibPath, featName)
+    if not bSync and SyncManifest.IsUnchanged(featName, 'LIBtoSHP', srcFingerprint, shplibFingerprint):
+        logger.info('\tSUCCESS - Source and target unchanged since last sync. Skipping refresh')
+        return rsltUpdated
+
     if not bSync: # if the sync flag is still false get the last modified datetimes to make determination
-        if arcpy.Exists(srcFeatPath): # Check that the source feature class exists.
+        if GDBCatalog.FeatureClassExists(srcFeatPath, featName, libGDBSchema, libGDBSqlConn): # Check that the source feature class exists.
             try:
-                srcdt = PC_Geoprocessing.GetNonVersionedGDBCreateDate(featName, libGDBSchema, libGDBSqlConn)
-                if arcpy.Exists(shplibFeatPath): # If the target library shapefile exists, get last modified date
-                    shplibdt = PC_Geoprocessing.GetShapefileLastModDate(shplibFeatPath) # get last modified date
+                srcdt = GDBCatalog.GetCreateDate(featName, libGDBSchema, libGDBSqlConn)
+                if pubdt is not None and pubdt > srcdt: # updated in place by a delta sync after it was created
+                    srcdt = pubdt
+                if FileCatalog.ShapefileExists(shplibPath, featName): # If the target library shapefile exists, get last modified date
+                    shplibdt = FileCatalog.GetShapefileLastModDate(shplibPath, featName) # get last modified date
                 else:
                     bSync = True
                 if not bSync: # if the sync flag is still false, determine if source is newer than target
@@ -645,9 +1267,22 @@ def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
         logger.info('\tSUCCESS - Determining if source is newer than target - ' + str(bSync))
 
     if bSync: # finally, if the sync flag is true, proceed with update
-        # copy the staged feature class to the library
+        bLatLon = row['MAKELATLON'] and not row['SENSITIVE'] # don't project copies of sensitive shapefiles
+        shplibGeoPath = shplibPath.replace('\\shapes\\', '\\shapes_lat_lon\\')
+        srGeographic = arcpy.SpatialReference(int(geographicWKID))
+        geoTransfer = None
+
+        # copy the staged feature class to the library. The lat/lon copy is written in the same read if possible.
         try:
-            lstDisconnected = PC_Geoprocessing.SafeConvert(libGDBDirectConn, srcFeatNameQual, shplibPath, shplibFeatNameQual, logger)
+            tplTransfers = None
+            if bLatLon:
+                tplTransfers = ExportLatLonFanOut(srcFeatPath, shplibPath, shplibGeoPath, featName, srGeographic, logger, lstErrCnt,
+                                                  lstDerivedFields)
+            if tplTransfers is None:
+                transfer = ExportLibraryShapefile(srcWrkspc, srcFeatNameQual, shplibPath, 'shapes', featName, logger, lstErrCnt,
+                                                  lstDerivedFields)
+            else:
+                transfer, geoTransfer = tplTransfers
         except PC_Geoprocessing.PC_GeoprocessingError as e:
             logger.error('\tERROR - SafeConverting local copy to target - ' + featName, exc_info=True)
             lstErrCnt[0] += 1
@@ -663,15 +1298,11 @@ def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
             updateDT = datim.strptime(datim.now().strftime('%Y-%m-%d %H:%M:%S'),'%Y-%m-%d %H:%M:%S')
             rsltUpdated = True
 
-            # project shapefile to copy in shapes_latlon folder if MAKELATLON is true
-            if ((row['MAKELATLON']) and (not row['SENSITIVE'])): # don't project copies of sensitive shapefiles
+            # project shapefile to copy in shapes_latlon folder if MAKELATLON is true and it wasn't written with the shapefile
+            if bLatLon and tplTransfers is None:
                 logger.info('\tProjecting feature class to geographic spatial reference (lat/lon) shapefile')
-                shplibGeoPath = shplibPath.replace('\\shapes\\', '\\shapes_lat_lon\\')
-                shplibGeoFeatFilePath = shplibGeoPath + shplibFeatNameQual
-                srGeographic = arcpy.SpatialReference(int(geographicWKID))
                 try: # project the feature class to geographic spatial reference (lat/lon) in local FGDB
-                    localFGDB = outLocalPath + '/' + outLocalFGDB
-                    localGeoFeatFilePath = localFGDB + '/' + featName
+                    localGeoFeatFilePath = localFGDBPath + '/' + featName + '_geo' # keep a staged copy of featName
                     if arcpy.Exists(localGeoFeatFilePath):
                         arcpy.Delete_management(localGeoFeatFilePath)
                     arcpy.Project_management(in_dataset=srcFeatPath, out_dataset=localGeoFeatFilePath, out_coor_system=srGeographic)
@@ -683,7 +1314,7 @@ def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
 
                 # copy the projected feature class to geographic spatial reference (lat/lon) shapefile library
                 try:
-                    lstDisconnected = PC_Geoprocessing.SafeConvert(localFGDB, featName, shplibGeoPath, shplibFeatNameQual, logger)
+                    geoTransfer = ExportLibraryShapefile(localFGDBPath, featName + '_geo', shplibGeoPath, 'shapes_lat_lon', featName, logger, lstErrCnt)
                 except PC_Geoprocessing.PC_GeoprocessingError as e:
                     logger.error('\tERROR - SafeConverting local copy to lat/lon target - ' + featName, exc_info=True)
                     lstErrCnt[0] += 1
@@ -694,18 +1325,60 @@ def LIBtoSHP(row, ignorestatus, force, logger, lstErrCnt):
                     logger.error('\tERROR - SafeConverting local copy to lat/lon target - ' + featName, exc_info=True)
                     lstErrCnt[0] += 1
 
-            # update metadata
-            row['DATETOUCHED'] = updateDT
-            row['SHPDATE'] = updateDT
-            row['SHAPEFILESIZE'] = PC_Geoprocessing.GetShapefileSize(shplibPath, shplibFeatNameQual)
-            try:
-                Metadata.UpdateLibraryMetadata(row, metaDBSqlConn, logger)
-            except Exception as e:
-                logger.warning('\tWARNING - Updating metadata table for library feature class - ' + featName, exc_info=True)
-                lstErrCnt[1] += 1
-            else:
-                logger.info('\tSUCCESS - Updating metadata table for library feature class')
+            # get the source of the cloud format copies now, while a copy staged in memory still exists. The copies
+            #   are written by FinishLIBtoSHP after the shapefile transfer succeeds.
+            tplCloudSource = None
+            if len(settings.cloudFormats) > 0:
+                try:
+                    tplCloudSource = GetCloudFormatSource(srcFeatPath, localFGDBPath, featName)
+                except Exception as e:
+                    logger.error('\tERROR - Copying feature class for the cloud format copies - ' + featName, exc_info=True)
+                    lstErrCnt[0] += 1
+
+            # finish the transfers and record the refresh now, or after the next feature class has started if the
+            #   caller overlaps exports (bOverlap). FinishPendingExports finishes overlapped exports.
+            tplFinish = (row, transfer, geoTransfer, featName, shplibPath, srcFingerprint, updateDT, tplCloudSource,
+                         logger, lstErrCnt)
+            if bOverlap and (transfer is not None or geoTransfer is not None):
+                lstPendingExports.append(tplFinish)
+            elif not FinishLIBtoSHP(*tplFinish):
+                return
     else:
         logger.info('\tLibrary shapefile is up to date. Skipping refresh')
 
     return rsltUpdated
+
+
+# Push feature class metadata changes to a library feature class without reloading its data.
+#   The import is skipped if the metadata inputs are unchanged since the last import, unless ignorestatus is set.
+def METAtoLIB(row, ignorestatus, logger, lstErrCnt, metaConnStr):
+    # Get connection strings and other settings loaded once from the configuration file
+    settings = LibMgrSettings.Get()
+    libGDBSchema = settings.libGDBSchema
+    libGDBDirectConn = settings.libGDBDirectConn
+    libGDBSqlConn = settings.libGDBSqlConn
+
+    rsltUpdated = False
+    featName = row['feature'].lower()
+    libFeatPath = libGDBDirectConn + '/' + libGDBSchema + '.' + featName
+
+    logger.info(featName.upper())
+    logger.info('\tTarget: ' + libFeatPath)
+
+    if not GDBCatalog.FeatureClassExists(libFeatPath, featName, libGDBSchema, libGDBSqlConn):
+        logger.warning('\tWARNING - Library feature class does not exist. Skipping metadata update - ' + featName)
+        lstErrCnt[1] += 1
+        return rsltUpdated
+
+    try:
+        rsltUpdated = Metadata.UpdateFCMetadata(libFeatPath, metaConnStr, ignorestatus)
+    except Exception as e:
+        logger.warning('\tWARNING - Updating feature class metadata for ' + featName, exc_info=True)
+        lstErrCnt[1] += 1
+    else:
+        if rsltUpdated:
+            logger.info('\tSUCCESS - Updating feature class metadata')
+        else:
+            logger.info('\tFeature class metadata is unchanged. Skipping metadata update')
+
+    return rsltUpdated
@@ -0,0 +1,79 @@
+# bench_ShapefileWriter.py - Throughput benchmark of the native shapefile writer with synthetic features
+#
+# Times parsing WKB and writing synthetic point, line and polygon features in the batch size used by
+# ExportFeatureClass, without arcpy, and prints the features and megabytes written per second for each shape type:
+#   python bench_ShapefileWriter.py [features] [vertices per line or polygon] [output directory]
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import datetime
+import math
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ShapefileWriter
+
+
+# Get the WKB of synthetic feature i of a shape type with nVertices per line or polygon ring
+def GetSyntheticWKB(shapeType, i, nVertices):
+    x0 = 700000.0 + (i % 1000) * 100.0
+    y0 = 900000.0 + (i // 1000) * 100.0
+    if shapeType == ShapefileWriter.SHP_POINT:
+        return struct.pack('<BIdd', 1, 1, x0, y0)
+    lstPoints = [(x0 + 40.0 * math.cos(2 * math.pi * j / nVertices), y0 + 40.0 * math.sin(2 * math.pi * j / nVertices))
+                 for j in range(nVertices)]
+    if shapeType == ShapefileWriter.SHP_POLYLINE:
+        return struct.pack('<BII', 1, 2, len(lstPoints)) + ''.join(struct.pack('<dd', x, y) for x, y in lstPoints)
+    lstPoints.append(lstPoints[0])
+    return struct.pack('<BII', 1, 3, 1) + struct.pack('<I', len(lstPoints)) + \
+        ''.join(struct.pack('<dd', x, y) for x, y in lstPoints)
+
+
+# Write nFeatures synthetic features of a shape type to outDir. Returns (parse seconds, write seconds, bytes written).
+def BenchmarkShapeType(outDir, name, shapeType, nFeatures, nVertices):
+    lstFieldDefs = ShapefileWriter.GetFieldDefs([('NAME', 'String', 50), ('CODE', 'Integer', 0), ('AREA', 'Double', 0),
+                                                 ('UPDATED', 'Date', 0)])
+    updated = datetime.datetime(2024, 1, 1)
+    lstWKB = [GetSyntheticWKB(shapeType, i, nVertices) for i in range(min(nFeatures, ShapefileWriter.batchSize))]
+
+    basePath = os.path.join(outDir, name)
+    writer = ShapefileWriter.ShapefileWriter(basePath, shapeType, lstFieldDefs)
+    parseTime = 0.0
+    writeTime = 0.0
+    for start in range(0, nFeatures, ShapefileWriter.batchSize):
+        nBatch = min(ShapefileWriter.batchSize, nFeatures - start)
+        startTime = time.time()
+        lstBatch = [(ShapefileWriter.ParseWKB(lstWKB[i]), ['feature ' + str(start + i), start + i, 1234.5, updated])
+                    for i in range(nBatch)]
+        parseTime += time.time() - startTime
+        startTime = time.time()
+        writer.WriteRecords(lstBatch)
+        writeTime += time.time() - startTime
+    startTime = time.time()
+    writer.Close()
+    writeTime += time.time() - startTime
+    nBytes = sum(os.path.getsize(basePath + ext) for ext in ['.shp', '.shx', '.dbf'])
+    return (parseTime, writeTime, nBytes)
+
+
+if __name__ == '__main__':
+    nFeatures = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nVertices = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    outDir = sys.argv[3] if len(sys.argv) > 3 else tempfile.mkdtemp()
+    try:
+        for name, shapeType in [('points', ShapefileWriter.SHP_POINT), ('lines', ShapefileWriter.SHP_POLYLINE),
+                                ('polygons', ShapefileWriter.SHP_POLYGON)]:
+            parseTime, writeTime, nBytes = BenchmarkShapeType(outDir, name, shapeType, nFeatures, nVertices)
+            totalTime = max(parseTime + writeTime, 1e-9)
+            print('%-10s %10d features  parse %8.3f s  write %8.3f s  %10.0f features/s  %8.1f MB/s' %
+                  (name, nFeatures, parseTime, writeTime, nFeatures / totalTime, nBytes / 1048576.0 / totalTime))
+    finally:
+        if len(sys.argv) <= 3:
+            shutil.rmtree(outDir)
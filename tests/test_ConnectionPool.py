@@ -0,0 +1,114 @@
+# test_ConnectionPool.py - Tests of borrowing pooled connections and retrying a query on a new connection
+#
+# The connections are stand-ins for pyodbc connections. A minimal pyodbc module is put in sys.modules if pyodbc isn't
+# installed, and pyodbc.connect is replaced for each test only.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import sys
+import types
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = types.ModuleType('pyodbc')
+    pyodbc.Error = type('Error', (Exception,), {})
+    pyodbc.connect = None
+    sys.modules['pyodbc'] = pyodbc
+import ConnectionPool
+
+
+# Stand-in for a pyodbc connection that can be dropped by the server
+class FakeConnection(object):
+    def __init__(self):
+        self.bDropped = False
+        self.bClosed = False
+
+    def rollback(self):
+        if self.bDropped:
+            raise pyodbc.Error('08S01', 'Communication link failure')
+
+    def close(self):
+        self.bClosed = True
+
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        self.connect = pyodbc.connect
+        self.lstOpened = []
+        pyodbc.connect = self.Connect
+        ConnectionPool.dictPools.clear()
+
+    def tearDown(self):
+        pyodbc.connect = self.connect
+        ConnectionPool.dictPools.clear()
+
+    def Connect(self, connStr):
+        conn = FakeConnection()
+        self.lstOpened.append(conn)
+        return conn
+
+    # query that fails on a dropped connection
+    def Query(self, conn):
+        if conn.bDropped:
+            raise pyodbc.Error('08S01', 'Communication link failure')
+        return 'result'
+
+    def testReusesConnection(self):
+        self.assertEqual(ConnectionPool.Run('db', self.Query), 'result')
+        self.assertEqual(ConnectionPool.Run('db', self.Query), 'result')
+        self.assertEqual(len(self.lstOpened), 1)
+
+    def testRetriesDroppedPooledConnection(self):
+        ConnectionPool.Run('db', self.Query)
+        self.lstOpened[0].bDropped = True # dropped by the server while idle in the pool
+        self.assertEqual(ConnectionPool.Run('db', self.Query), 'result')
+        self.assertEqual(len(self.lstOpened), 2)
+        self.assertTrue(self.lstOpened[0].bClosed)
+        self.assertEqual([conn for conn, returned in ConnectionPool.dictPools['db']], [self.lstOpened[1]])
+
+    def testNewConnectionNotRetried(self):
+        calls = []
+
+        def FailingQuery(conn):
+            calls.append(conn)
+            raise pyodbc.Error('42S02', 'Invalid object name')
+
+        with self.assertRaises(pyodbc.Error):
+            ConnectionPool.Run('db', FailingQuery)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(ConnectionPool.dictPools['db'], [])
+
+    def testOtherErrorsNotRetried(self):
+        ConnectionPool.Run('db', self.Query)
+
+        def FailingQuery(conn):
+            raise KeyError('COVER_NAME')
+
+        with self.assertRaises(KeyError):
+            ConnectionPool.Run('db', FailingQuery)
+        self.assertEqual(len(self.lstOpened), 1)
+        self.assertEqual(len(ConnectionPool.dictPools['db']), 1) # the connection still works
+
+    @unittest.skipIf(ConnectionPool.PandasDatabaseError is None, 'pandas is not installed')
+    def testPandasDatabaseErrorDiscardsConnection(self):
+        ConnectionPool.Run('db', self.Query)
+        self.lstOpened[0].bDropped = True
+
+        def ReadSql(conn):
+            try:
+                return self.Query(conn)
+            except pyodbc.Error as e:
+                raise ConnectionPool.PandasDatabaseError('Execution failed on sql: ' + str(e))
+
+        self.assertEqual(ConnectionPool.Run('db', ReadSql), 'result')
+        self.assertTrue(self.lstOpened[0].bClosed)
+
+
+if __name__ == '__main__':
+    unittest.main()
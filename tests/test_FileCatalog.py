@@ -0,0 +1,108 @@
+# test_FileCatalog.py - Tests of the coverage content hash inputs with a synthetic coverage workspace
+#
+# The workspace has a coverage directory of .adf files and an info directory whose arc.dir lists the INFO tables of
+# that coverage and of another coverage. HashFiles is written for the ArcMap Python 2 interpreter, so the hash test is
+# skipped under Python 3.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FileCatalog
+
+
+# Pack an arc.dir record for a table name and its INFO data file name
+def PackArcDirRecord(tableName, infoName):
+    record = tableName.ljust(32).encode('ascii') + infoName.ljust(8).encode('ascii')
+    return record.ljust(FileCatalog.arcDirRecordLength, b'\0')
+
+
+class CoverageHashFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.covPath = os.path.join(self.tempDir, 'parcels')
+        self.infoPath = os.path.join(self.tempDir, 'info')
+        os.mkdir(self.covPath)
+        os.mkdir(self.infoPath)
+        for fileName in ['pat.adf', 'arc.adf', 'tic.adf', 'readme.txt']:
+            self.WriteFile(os.path.join(self.covPath, fileName), b'coverage ' + fileName.encode('ascii'))
+        self.WriteFile(os.path.join(self.infoPath, 'arc.dir'),
+                       PackArcDirRecord('PARCELS.TIC', 'ARC0000') + PackArcDirRecord('ROADS.AAT', 'ARC0001') +
+                       PackArcDirRecord('PARCELS.PAT', 'ARC0002') + PackArcDirRecord('PARCELS.BND', 'ARC0003'))
+        for infoName in ['arc0000', 'arc0001', 'arc0002']: # PARCELS.BND has no files
+            self.WriteFile(os.path.join(self.infoPath, infoName + '.dat'), b'data ' + infoName.encode('ascii'))
+            self.WriteFile(os.path.join(self.infoPath, infoName + '.nit'), b'definition ' + infoName.encode('ascii'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def WriteFile(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def testIncludesInfoTables(self):
+        lstFilePaths = FileCatalog.GetCoverageHashFiles(self.covPath)
+        lstExpected = [os.path.join(self.covPath, fileName) for fileName in ['arc.adf', 'pat.adf', 'tic.adf']] + \
+            [os.path.join(self.infoPath, fileName) for fileName in ['arc0002.dat', 'arc0002.nit',  # PARCELS.PAT
+                                                                    'arc0000.dat', 'arc0000.nit']] # PARCELS.TIC
+        self.assertEqual(lstFilePaths, lstExpected)
+        self.assertEqual(FileCatalog.GetCoverageInfoFiles(self.covPath + os.sep), lstExpected[3:]) # trailing separator
+
+    def testNoInfoDirectory(self):
+        shutil.rmtree(self.infoPath)
+        self.assertEqual(len(FileCatalog.GetCoverageHashFiles(self.covPath)), 3)
+
+    @unittest.skipIf(sys.version_info[0] > 2, 'HashFiles is written for Python 2 (ArcMap)')
+    def testAttributeChangeChangesHash(self):
+        hashBefore = FileCatalog.HashFiles(FileCatalog.GetCoverageHashFiles(self.covPath))
+        self.WriteFile(os.path.join(self.infoPath, 'arc0002.dat'), b'data arc0003') # same size, new attribute values
+        self.assertNotEqual(FileCatalog.HashFiles(FileCatalog.GetCoverageHashFiles(self.covPath)), hashBefore)
+
+        hashBefore = FileCatalog.HashFiles(FileCatalog.GetCoverageHashFiles(self.covPath))
+        self.WriteFile(os.path.join(self.infoPath, 'arc0001.dat'), b'data changed for roads')
+        self.assertEqual(FileCatalog.HashFiles(FileCatalog.GetCoverageHashFiles(self.covPath)), hashBefore)
+
+
+class ScanDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        for fileName in ['parcels.shp', 'parcels.dbf', 'parcels.shx', 'parcels.shp.xml', 'roads.SHP', 'notes.txt']:
+            with open(os.path.join(self.tempDir, fileName), 'wb') as f:
+                f.write(b'data ' + fileName.encode('ascii'))
+        os.mkdir(os.path.join(self.tempDir, 'folder.shp')) # not a shapefile
+        self.scandir = FileCatalog.scandir
+
+    def tearDown(self):
+        FileCatalog.scandir = self.scandir
+        FileCatalog.dictDirs.clear()
+        shutil.rmtree(self.tempDir)
+
+    def CheckSnapshot(self):
+        FileCatalog.dictDirs.clear()
+        dictFeats = FileCatalog.ScanDirectory(self.tempDir)
+        self.assertEqual(sorted(dictFeats), ['parcels', 'roads'])
+        self.assertEqual(sorted(dictFeats['parcels']), ['.dbf', '.shp', '.shx'])
+        self.assertEqual(dictFeats['parcels']['.shp'][1], len(b'data parcels.shp'))
+        return dictFeats
+
+    def testScandirAndFallbackMatch(self):
+        if FileCatalog.scandir is None:
+            self.skipTest('scandir is not available')
+        dictFeats = self.CheckSnapshot()
+        FileCatalog.scandir = None # as on ArcMap's Python 2.7 without the scandir backport
+        self.assertEqual(self.CheckSnapshot(), dictFeats)
+
+    def testFallback(self):
+        FileCatalog.scandir = None
+        self.CheckSnapshot()
+
+
+if __name__ == '__main__':
+    unittest.main()
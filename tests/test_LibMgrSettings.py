@@ -0,0 +1,114 @@
+# test_LibMgrSettings.py - Tests of loading and validating LibMgr.ini
+#
+# LibMgrSettings uses the Python 2 ConfigParser module, so these tests are skipped where it isn't available.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import LibMgrSettings
+    import CloudFormats
+except ImportError:
+    LibMgrSettings = None
+
+iniPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'LibMgr.ini')
+
+# options of features added after the original configuration, which are optional
+lstOptional = [('Local', 'syncManifest'), ('Settings', 'fingerprintMode'), ('Settings', 'deltaSync'),
+               ('Settings', 'deltaKeyField'), ('Settings', 'shapefileWriter'), ('Settings', 'stagingBackend'),
+               ('Settings', 'memoryStagingMaxBytes'), ('Settings', 'memoryStagingMaxRows'), ('Settings', 'lockRetries'),
+               ('Settings', 'lockRetryDelay'), ('Settings', 'lockEscalateForce'), ('Settings', 'publishMode'),
+               ('Settings', 'shapefileTransfer'), ('Settings', 'transferThreads'), ('Settings', 'shapefileIndex'),
+               ('Settings', 'cloudFormats'), ('Metadata', 'preserveExistingMetadata')]
+
+
+@unittest.skipIf(LibMgrSettings is None, 'ConfigParser is not available')
+class SettingsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        with open(iniPath) as iniFile:
+            self.lstLines = iniFile.read().splitlines()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    # write LibMgr.ini without the options in lstRemove and with the values in dictReplace. Returns its path.
+    def WriteIni(self, lstRemove=[], dictReplace={}):
+        lstLines = []
+        for line in self.lstLines:
+            option = line.split('=')[0].strip()
+            if option in lstRemove:
+                continue
+            if option in dictReplace:
+                line = option + ' = ' + dictReplace[option]
+            lstLines.append(line)
+        path = os.path.join(self.tempDir, 'LibMgr.ini')
+        with open(path, 'w') as iniFile:
+            iniFile.write('\n'.join(lstLines) + '\n')
+        return path
+
+    def testShippedConfiguration(self):
+        settings = LibMgrSettings.Settings(iniPath)
+        self.assertEqual(settings.geographicWKID, 4152)
+        self.assertEqual(settings.cloudFormats, [])
+
+    def testOptionalDefaults(self):
+        settings = LibMgrSettings.Settings(self.WriteIni([option for section, option in lstOptional]))
+        self.assertEqual(settings.syncManifest, settings.outLocalPath + '/sync_manifest.sqlite')
+        self.assertEqual(settings.fingerprintMode, 'mtime')
+        self.assertFalse(settings.deltaSync)
+        self.assertEqual(settings.shapefileWriter, 'arcpy')
+        self.assertEqual(settings.stagingBackend, 'disk')
+        self.assertEqual(settings.lockRetries, 0)
+        self.assertFalse(settings.lockEscalateForce)
+        self.assertEqual(settings.publishMode, 'replace')
+        self.assertEqual(settings.shapefileTransfer, 'direct')
+        self.assertEqual(settings.transferThreads, 4)
+        self.assertFalse(settings.shapefileIndex)
+        self.assertEqual(settings.cloudFormats, [])
+        self.assertTrue(settings.preserveExistingMetadata)
+
+    def testEmptyOptionalGetsDefault(self):
+        settings = LibMgrSettings.Settings(self.WriteIni(dictReplace={'publishMode': '', 'transferThreads': ''}))
+        self.assertEqual(settings.publishMode, 'replace')
+        self.assertEqual(settings.transferThreads, 4)
+
+    def testRequiredAndInvalidOptions(self):
+        path = self.WriteIni(['libGDBSchema'], {'geographicWKID': 'wgs84', 'publishMode': 'swap', 'deltaSync': 'true',
+                                                'deltaKeyField': ''})
+        with self.assertRaises(LibMgrSettings.LibMgrSettingsError) as cm:
+            LibMgrSettings.Settings(path)
+        message = str(cm.exception)
+        self.assertIn('[Library] libGDBSchema is missing', message)
+        self.assertIn('[Settings] geographicWKID is not an integer', message)
+        self.assertIn('[Settings] publishMode must be one of replace, shadow', message)
+        self.assertIn('[Settings] deltaKeyField is required with deltaSync = true', message)
+
+    def testUnavailableCloudFormatDisabled(self):
+        ogr = CloudFormats.ogr
+        CloudFormats.ogr = None # as without the GDAL python bindings
+        try:
+            settings = LibMgrSettings.Settings(self.WriteIni(dictReplace={'cloudFormats': 'geoparquet, flatgeobuf'}))
+        finally:
+            CloudFormats.ogr = ogr
+        self.assertEqual(settings.cloudFormats, [])
+        self.assertEqual(len(settings.lstWarnings), 2)
+        self.assertIn('cloudFormats geoparquet is disabled', settings.lstWarnings[0])
+
+    def testGetNotification(self):
+        exchangeserver, emailFrom, emailToList = LibMgrSettings.GetNotification(self.WriteIni(['libGDBSchema']))
+        self.assertEqual(emailFrom, 'noreply@pima.gov')
+        self.assertEqual(len(emailToList), 1)
+        self.assertIsNone(LibMgrSettings.GetNotification(os.path.join(self.tempDir, 'missing.ini')))
+
+
+if __name__ == '__main__':
+    unittest.main()
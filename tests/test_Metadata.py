@@ -0,0 +1,86 @@
+# test_Metadata.py - Tests of the feature class metadata document builder
+#
+# Metadata imports arcpy, so these tests are skipped where arcpy isn't installed.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import Metadata
+    import MetadataAssets
+except ImportError:
+    Metadata = None
+
+
+# Get a descriptive metadata row with every column set
+def GetTestRow():
+    df_row = {}
+    for col in Metadata.lstDescriptiveColumns:
+        df_row[col] = col.lower() + ' value'
+    df_row['FULL_NAME'] = 'Test Parcels'
+    df_row['PATH'] = '\\\\server\\share\\covers\\'
+    df_row['ONMAINT'] = 'Y'
+    df_row['ONMG'] = 'YES'
+    for col in ['SOURCSCALE', 'SOUR2SCALE', 'MGSCALELOW', 'MGSCALEHIGH']:
+        df_row[col] = 2400
+    return df_row
+
+
+@unittest.skipIf(Metadata is None, 'arcpy is not installed')
+class BuildFCMetadataTest(unittest.TestCase):
+    def setUp(self):
+        MetadataAssets.disclaimer = 'Test disclaimer'
+        MetadataAssets.dictThumbnails = {}
+        self.dictFieldDescrip = {'PARCEL': 'Parcel number', 'OWNER': 'Owner name'}
+
+    # Build a document as UpdateFCMetadata does from an exported document with a field list
+    def NewDocument(self):
+        root = ET.Element('metadata')
+        ET.SubElement(root, 'dataIdInfo')
+        detailedEl = Metadata.SubElementPath(root, 'eainfo/detailed')
+        for fldname in ['OBJECTID', 'PARCEL', 'OWNER']:
+            Metadata.SubElementPath(detailedEl, 'attr/attrlabl', fldname)
+        return root
+
+    def test_build_twice_gives_same_xml(self):
+        root = self.NewDocument()
+        Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        strFirst = ET.tostring(root)
+        Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        self.assertEqual(ET.tostring(root), strFirst)
+
+    def test_build_keeps_one_copy_of_each_element(self):
+        root = self.NewDocument()
+        for i in range(3):
+            Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        self.assertEqual(len(root.findall('idInfo')), 1)
+        self.assertEqual(len(root.findall('metainfo')), 1)
+        for tag in Metadata.lstDataIdInfoTags:
+            self.assertEqual(len(root.findall('dataIdInfo/' + tag)), 1, tag)
+        self.assertEqual(len(root.findall('eainfo/detailed/attr/attrdef')), 2)
+
+    def test_build_keeps_elements_it_does_not_write(self):
+        root = self.NewDocument()
+        Metadata.SubElementPath(root, 'dataIdInfo/idCitation/resTitle', 'Parcels')
+        Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        self.assertEqual(root.find('dataIdInfo/idCitation/resTitle').text, 'Parcels')
+
+    def test_changed_row_replaces_values(self):
+        root = self.NewDocument()
+        Metadata.BuildFCMetadata(root, GetTestRow(), self.dictFieldDescrip, 'parcels')
+        df_row = GetTestRow()
+        df_row['ABSTRACT'] = 'New abstract'
+        Metadata.BuildFCMetadata(root, df_row, self.dictFieldDescrip, 'parcels')
+        self.assertEqual([el.text for el in root.findall('idInfo/descript/abstract')], ['New abstract'])
+
+
+if __name__ == '__main__':
+    unittest.main()
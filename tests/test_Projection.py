@@ -0,0 +1,93 @@
+# test_Projection.py - Accuracy tests of the vectorized inverse Transverse Mercator
+#
+# The control points are State Plane coordinates in EPSG:2868 (NAD 1983 HARN StatePlane Arizona Central FIPS 0202,
+# international feet) across the zone, with their NAD 1983 HARN latitude and longitude from PROJ 9 (pyproj 3.7), whose
+# extended Transverse Mercator is accurate to a few nanometers. Projection needs NumPy, so these tests are skipped
+# where it isn't installed.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import numpy
+    import Projection
+except ImportError:
+    Projection = None
+
+tolerance = 1e-7 # degrees, about a centimeter
+
+# (x, y) in feet, (latitude, longitude) in degrees
+lstControlPoints = [(700000.0, 0.0, 31.000000000000, -111.916666666667),
+                    (700000.0, 1000000.0, 33.748858588928, -111.916666666667),
+                    (600000.0, 900000.0, 33.473593208747, -112.244614351413),
+                    (550000.0, 1500000.0, 35.121793618279, -112.418290578363),
+                    (850000.0, 400000.0, 32.098760933512, -111.432256211918),
+                    (1100000.0, 1300000.0, 34.566048110151, -110.588001502392),
+                    (300000.0, 650000.0, 32.780133336572, -113.218141944237),
+                    (1100000.0, 200000.0, 31.543420352070, -110.632656513352),
+                    (300000.0, 1650000.0, 35.527470269581, -113.260994754389)]
+
+
+# Stand-ins for the arcpy SpatialReference properties read by GetTransverseMercatorParams
+class FakeGCS(object):
+    def __init__(self, datumName):
+        self.semiMajorAxis = 6378137.0
+        self.semiMinorAxis = 6356752.314140356
+        self.datumName = datumName
+
+class FakeSpatialReference(object):
+    def __init__(self, projectionName='Transverse_Mercator', datumName='D_North_American_1983_HARN'):
+        self.type = 'Projected'
+        self.projectionName = projectionName
+        self.GCS = FakeGCS(datumName)
+        self.scaleFactor = 0.9999
+        self.latitudeOfOrigin = 31.0
+        self.centralMeridian = -111.0 - 55.0 / 60.0
+        self.falseEasting = 700000.0
+        self.falseNorthing = 0.0
+        self.metersPerUnit = 0.3048
+
+
+@unittest.skipIf(Projection is None, 'NumPy is not installed')
+class InverseTransverseMercatorTest(unittest.TestCase):
+    def setUp(self):
+        self.params = Projection.GetTransverseMercatorParams(FakeSpatialReference(), 'D_North_American_1983_HARN')
+
+    def testControlPoints(self):
+        arrX = numpy.array([pt[0] for pt in lstControlPoints])
+        arrY = numpy.array([pt[1] for pt in lstControlPoints])
+        arrLat, arrLon = Projection.InverseTransverseMercator(arrX, arrY, self.params)
+        for (x, y, lat, lon), calcLat, calcLon in zip(lstControlPoints, arrLat, arrLon):
+            self.assertAlmostEqual(calcLat, lat, delta=tolerance, msg='latitude at ' + str((x, y)))
+            self.assertAlmostEqual(calcLon, lon, delta=tolerance, msg='longitude at ' + str((x, y)))
+
+    def testNaNStaysNaN(self):
+        arrLat, arrLon = Projection.InverseTransverseMercator([numpy.nan, 700000.0], [numpy.nan, 0.0], self.params)
+        self.assertTrue(numpy.isnan(arrLat[0]) and numpy.isnan(arrLon[0]))
+        self.assertAlmostEqual(arrLat[1], 31.0, delta=tolerance)
+
+    def testParams(self):
+        self.assertAlmostEqual(self.params['fe'], 213360.0)
+        self.assertAlmostEqual(self.params['e2'], 0.00669438002290, places=12) # GRS 1980
+        self.assertEqual(self.params['datum'], 'D_North_American_1983_HARN')
+
+    def testNotTransverseMercator(self):
+        self.assertIsNone(Projection.GetTransverseMercatorParams(FakeSpatialReference('Lambert_Conformal_Conic')))
+        sr = FakeSpatialReference()
+        sr.type = 'Geographic'
+        self.assertIsNone(Projection.GetTransverseMercatorParams(sr))
+
+    def testMismatchedDatum(self):
+        sr = FakeSpatialReference(datumName='D_North_American_1983')
+        self.assertIsNone(Projection.GetTransverseMercatorParams(sr, 'D_North_American_1983_HARN'))
+        self.assertIsNotNone(Projection.GetTransverseMercatorParams(sr)) # no datum to match
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+# test_ShapefileIndex.py - Tests of the quadtree spatial index (.qix) writer with synthetic point and polygon shapefiles
+#
+# The shapefiles are written by the test with struct, so it runs under Python 2 and 3. ShapefileIndex needs NumPy, so
+# these tests are skipped where it isn't installed. The bbox query comparison with GDAL/OGR with and without the .qix
+# is skipped where the GDAL python bindings (osgeo) aren't installed.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ShapefileIndex
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from osgeo import ogr
+except ImportError:
+    ogr = None
+
+
+# Write a .shp, .shx and one field .dbf for a list of records, each None (null shape), an (x, y) point or a polygon
+#   bounding box (xmin, ymin, xmax, ymax) written as a rectangle
+def WriteShapefile(basePath, shapeType, lstRecords):
+    lstContents = []
+    lstBoxes = []
+    for record in lstRecords:
+        if record is None:
+            lstContents.append(struct.pack('<i', 0))
+        elif shapeType == 1:
+            lstContents.append(struct.pack('<i2d', 1, record[0], record[1]))
+            lstBoxes.append((record[0], record[1], record[0], record[1]))
+        else:
+            xmin, ymin, xmax, ymax = record
+            coords = [xmin, ymin, xmin, ymax, xmax, ymax, xmax, ymin, xmin, ymin]
+            lstContents.append(struct.pack('<i4d3i10d', 5, xmin, ymin, xmax, ymax, 1, 5, 0, *coords))
+            lstBoxes.append(record)
+    bbox = [min(box[0] for box in lstBoxes), min(box[1] for box in lstBoxes),
+            max(box[2] for box in lstBoxes), max(box[3] for box in lstBoxes)]
+
+    shpLength = 100 + sum(8 + len(content) for content in lstContents)
+    with open(basePath + '.shp', 'wb') as shpFile, open(basePath + '.shx', 'wb') as shxFile:
+        for fileObj, fileLength in [(shpFile, shpLength), (shxFile, 100 + 8 * len(lstContents))]:
+            fileObj.write(struct.pack('>7i', 9994, 0, 0, 0, 0, 0, fileLength // 2) +
+                          struct.pack('<2i8d', 1000, shapeType, bbox[0], bbox[1], bbox[2], bbox[3], 0, 0, 0, 0))
+        offset = 100
+        for i, content in enumerate(lstContents):
+            shpFile.write(struct.pack('>2i', i + 1, len(content) // 2) + content)
+            shxFile.write(struct.pack('>2i', offset // 2, len(content) // 2))
+            offset += 8 + len(content)
+    with open(basePath + '.dbf', 'wb') as dbfFile:
+        dbfFile.write(struct.pack('<4BIHH20x', 3, 124, 1, 1, len(lstRecords), 65, 11))
+        dbfFile.write(struct.pack('<11sc4xBB14x', b'ID', b'N', 10, 0) + b'\r')
+        for i in range(len(lstRecords)):
+            dbfFile.write(b' ' + str(i).rjust(10).encode('ascii'))
+        dbfFile.write(b'\x1a')
+    return lstBoxes
+
+
+# Read a .qix file. Returns (header values, root node) where each node is (bounds, ids, subnodes, record size,
+#   descendant bytes recorded) and raises AssertionError if the file isn't consumed exactly.
+def ReadIndex(qixPath):
+    with open(qixPath, 'rb') as qixFile:
+        data = qixFile.read()
+    header = struct.unpack('<3sBB3xii', data[0:16])
+
+    def ReadNode(offset):
+        iDescendants = struct.unpack('<i', data[offset:offset + 4])[0]
+        bounds = struct.unpack('<4d', data[offset + 4:offset + 36])
+        nShapes = struct.unpack('<i', data[offset + 36:offset + 40])[0]
+        ids = list(struct.unpack('<%di' % nShapes, data[offset + 40:offset + 40 + 4 * nShapes]))
+        nSubnodes = struct.unpack('<i', data[offset + 40 + 4 * nShapes:offset + 44 + 4 * nShapes])[0]
+        size = 44 + 4 * nShapes
+        subOffset = offset + size
+        lstSubnodes = []
+        for i in range(nSubnodes):
+            subnode, subOffset = ReadNode(subOffset)
+            lstSubnodes.append(subnode)
+        return ((bounds, ids, lstSubnodes, size, iDescendants), subOffset)
+
+    root, end = ReadNode(16)
+    assert end == len(data), 'index has trailing bytes'
+    return (header, root)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class ShapefileIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.random = random.Random(2868)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def GetPoints(self, n):
+        return [(self.random.uniform(0, 10000), self.random.uniform(0, 10000)) for i in range(n)]
+
+    def GetBoxes(self, n):
+        lstBoxes = []
+        for i in range(n):
+            x = self.random.uniform(0, 10000)
+            y = self.random.uniform(0, 10000)
+            lstBoxes.append((x, y, x + self.random.uniform(1, 500), y + self.random.uniform(1, 500)))
+        return lstBoxes
+
+    # check a node and its subnodes. Returns the subtree size in bytes and adds the ids found to lstIds.
+    def CheckNode(self, node, lstBoxes, dictBoxIds, lstIds):
+        bounds, ids, lstSubnodes, size, iDescendants = node
+        self.assertEqual(size, ShapefileIndex.GetNodeSize((bounds, ids, lstSubnodes)))
+        for shapeId in ids:
+            box = lstBoxes[dictBoxIds[shapeId]]
+            self.assertTrue(bounds[0] <= box[0] and bounds[1] <= box[1] and box[2] <= bounds[2] and box[3] <= bounds[3])
+        lstIds.extend(ids)
+        iActual = 0
+        for subnode in lstSubnodes:
+            subBounds = subnode[0]
+            self.assertTrue(bounds[0] <= subBounds[0] and bounds[1] <= subBounds[1] and
+                            subBounds[2] <= bounds[2] and subBounds[3] <= bounds[3])
+            iActual += self.CheckNode(subnode, lstBoxes, dictBoxIds, lstIds)
+        self.assertEqual(iDescendants, iActual)
+        return size + iActual
+
+    def CheckIndex(self, shapeType, lstRecords):
+        basePath = os.path.join(self.tempDir, 'test')
+        lstBoxes = WriteShapefile(basePath, shapeType, lstRecords)
+        self.assertTrue(ShapefileIndex.BuildIndex(basePath))
+        self.assertFalse(os.path.exists(basePath + '.qix' + ShapefileIndex.tempExt))
+
+        header, root = ReadIndex(basePath + '.qix')
+        self.assertEqual(header, (b'SQT', 1, 1, len(lstRecords), ShapefileIndex.GetDefaultDepth(len(lstRecords))))
+        dictBoxIds = {}
+        for shapeId, record in enumerate(lstRecords):
+            if record is not None:
+                dictBoxIds[shapeId] = len(dictBoxIds)
+        lstIds = []
+        self.CheckNode(root, lstBoxes, dictBoxIds, lstIds)
+        self.assertEqual(sorted(lstIds), sorted(dictBoxIds)) # every non null shape exactly once
+        return basePath
+
+    def testPoints(self):
+        lstRecords = self.GetPoints(5000)
+        lstRecords[10] = None
+        lstRecords[4999] = None
+        self.CheckIndex(1, lstRecords)
+
+    def testPolygons(self):
+        lstRecords = self.GetBoxes(3000)
+        lstRecords[0] = None
+        lstRecords.append((0.0, 0.0, 10500.0, 10500.0)) # covers everything, stays in the root
+        basePath = self.CheckIndex(5, lstRecords)
+        self.assertIn(len(lstRecords) - 1, ReadIndex(basePath + '.qix')[1][1])
+
+    def testSingleShape(self):
+        self.CheckIndex(5, [(1.0, 2.0, 3.0, 4.0)])
+
+    def testUpToDate(self):
+        basePath = self.CheckIndex(1, self.GetPoints(10))
+        self.assertFalse(ShapefileIndex.BuildIndex(basePath))
+        os.utime(basePath + '.shp', (os.path.getmtime(basePath + '.qix') + 10,) * 2)
+        self.assertTrue(ShapefileIndex.BuildIndex(basePath))
+
+    def testDefaultDepth(self):
+        self.assertEqual(ShapefileIndex.GetDefaultDepth(0), 1)
+        self.assertEqual(ShapefileIndex.GetDefaultDepth(100000), 12)
+        self.assertEqual(ShapefileIndex.GetDefaultDepth(10 ** 9), ShapefileIndex.maxDefaultDepth)
+
+    @unittest.skipIf(ogr is None, 'GDAL python bindings (osgeo) are not installed')
+    def testOgrQueriesMatch(self):
+        lstRecords = self.GetBoxes(2000)
+        basePath = os.path.join(self.tempDir, 'ogr')
+        WriteShapefile(basePath, 5, lstRecords)
+        lstBBoxes = [(1000, 1000, 2000, 2000), (0, 0, 10000, 500), (5000, 5000, 5001, 5001)]
+
+        def Query(bbox):
+            ds = ogr.Open(basePath + '.shp')
+            lyr = ds.GetLayer(0)
+            lyr.SetSpatialFilterRect(*bbox)
+            setFids = set(feat.GetFID() for feat in lyr)
+            ds = None
+            return setFids
+
+        lstWithout = [Query(bbox) for bbox in lstBBoxes]
+        ShapefileIndex.BuildIndex(basePath)
+        self.assertEqual([Query(bbox) for bbox in lstBBoxes], lstWithout)
+
+
+if __name__ == '__main__':
+    unittest.main()
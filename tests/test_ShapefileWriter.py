@@ -0,0 +1,316 @@
+# test_ShapefileWriter.py - Tests of the native shapefile writer with synthetic point, line and polygon features
+#
+# ShapefileWriter is written for the ArcMap Python 2 interpreter, so these tests are skipped under Python 3.
+# ExportFeatureClassFanOut is tested with a minimal arcpy stand-in put in sys.modules for the test only.
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import datetime
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import types
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ShapefileWriter
+
+bPython2 = sys.version_info[0] == 2
+
+
+# Pack a WKB point, linestring or polygon (little endian, 2D)
+def PackWKBPoint(x, y):
+    return struct.pack('<BIdd', 1, 1, x, y)
+
+def PackWKBLine(lstPoints):
+    return struct.pack('<BII', 1, 2, len(lstPoints)) + ''.join(struct.pack('<dd', x, y) for x, y in lstPoints)
+
+def PackWKBPolygon(lstRings):
+    wkb = struct.pack('<BII', 1, 3, len(lstRings))
+    for ring in lstRings:
+        wkb += struct.pack('<I', len(ring)) + ''.join(struct.pack('<dd', x, y) for x, y in ring)
+    return wkb
+
+
+# Read the 100 byte .shp/.shx header. Returns (file code, file length in bytes, version, shape type, bbox).
+def ReadShpHeader(path):
+    with open(path, 'rb') as shpFile:
+        header = shpFile.read(100)
+    fileCode = struct.unpack('>i', header[0:4])[0]
+    fileLength = struct.unpack('>i', header[24:28])[0] * 2
+    version, shapeType = struct.unpack('<2i', header[28:36])
+    bbox = struct.unpack('<4d', header[36:68])
+    return (fileCode, fileLength, version, shapeType, bbox)
+
+
+# Read the .shx records as a list of (offset, content length) in bytes
+def ReadShx(path):
+    with open(path, 'rb') as shxFile:
+        data = shxFile.read()[100:]
+    return [(struct.unpack('>i', data[i:i + 4])[0] * 2, struct.unpack('>i', data[i + 4:i + 8])[0] * 2)
+            for i in range(0, len(data), 8)]
+
+
+# Read a dbf. Returns (record count, list of (name, type, length, decimals), list of records as lists of raw values).
+def ReadDbf(path):
+    with open(path, 'rb') as dbfFile:
+        data = dbfFile.read()
+    recordCount, headerLength, recordLength = struct.unpack('<IHH', data[4:12])
+    lstFieldDefs = []
+    for i in range(32, headerLength - 1, 32):
+        name, dbfType, length, decimals = struct.unpack('<11sc4xBB14x', data[i:i + 32])
+        lstFieldDefs.append((name.rstrip('\0'), dbfType, length, decimals))
+    lstRecords = []
+    for i in range(recordCount):
+        record = data[headerLength + i * recordLength:headerLength + (i + 1) * recordLength]
+        lstValues = []
+        iPos = 1
+        for name, dbfType, length, decimals in lstFieldDefs:
+            lstValues.append(record[iPos:iPos + length])
+            iPos += length
+        lstRecords.append(lstValues)
+    return (recordCount, lstFieldDefs, lstRecords, data)
+
+
+@unittest.skipIf(not bPython2, 'ShapefileWriter is written for Python 2 (ArcMap)')
+class ShapefileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    # write features with one string field and return the shapefile path without extension
+    def WriteShapefile(self, name, shapeType, lstWKB):
+        basePath = os.path.join(self.tempDir, name)
+        writer = ShapefileWriter.ShapefileWriter(basePath, shapeType, ShapefileWriter.GetFieldDefs([('NAME', 'String', 20)]))
+        writer.WriteRecords([(ShapefileWriter.ParseWKB(wkb), ['feature ' + str(i)]) for i, wkb in enumerate(lstWKB)])
+        writer.Close()
+        return basePath
+
+    def CheckHeadersAndOffsets(self, basePath, shapeType, bbox, nRecords):
+        shpHeader = ReadShpHeader(basePath + '.shp')
+        shxHeader = ReadShpHeader(basePath + '.shx')
+        self.assertEqual(shpHeader[0], 9994)
+        self.assertEqual(shpHeader[1], os.path.getsize(basePath + '.shp'))
+        self.assertEqual(shpHeader[2], 1000)
+        self.assertEqual(shpHeader[3], shapeType)
+        self.assertEqual(shpHeader[4], bbox)
+        self.assertEqual(shxHeader[1], os.path.getsize(basePath + '.shx'))
+        self.assertEqual(shxHeader[1], 100 + 8 * nRecords)
+        self.assertEqual(shxHeader[2:], shpHeader[2:])
+
+        # every .shx entry points at the record header of the next record number with the same content length
+        with open(basePath + '.shp', 'rb') as shpFile:
+            data = shpFile.read()
+        iExpected = 100
+        for i, (offset, length) in enumerate(ReadShx(basePath + '.shx')):
+            self.assertEqual(offset, iExpected)
+            self.assertEqual(struct.unpack('>2i', data[offset:offset + 8]), (i + 1, length // 2))
+            iExpected = offset + 8 + length
+        self.assertEqual(iExpected, len(data))
+
+    def testPointHeadersAndOffsets(self):
+        lstWKB = [PackWKBPoint(100.0, 200.0), PackWKBPoint(-50.5, 300.25), PackWKBPoint(75.0, -10.0)]
+        basePath = self.WriteShapefile('points', ShapefileWriter.SHP_POINT, lstWKB)
+        self.CheckHeadersAndOffsets(basePath, ShapefileWriter.SHP_POINT, (-50.5, -10.0, 100.0, 300.25), 3)
+        with open(basePath + '.shp', 'rb') as shpFile:
+            data = shpFile.read()
+        self.assertEqual(struct.unpack('<i2d', data[108:128]), (1, 100.0, 200.0))
+
+    def testLineHeadersAndOffsets(self):
+        lstWKB = [PackWKBLine([(0.0, 0.0), (10.0, 5.0), (20.0, 0.0)]), PackWKBLine([(-5.0, 2.0), (3.0, 40.0)])]
+        basePath = self.WriteShapefile('lines', ShapefileWriter.SHP_POLYLINE, lstWKB)
+        self.CheckHeadersAndOffsets(basePath, ShapefileWriter.SHP_POLYLINE, (-5.0, 0.0, 20.0, 40.0), 2)
+
+        # record bounding box, part and point counts of the first line
+        with open(basePath + '.shp', 'rb') as shpFile:
+            data = shpFile.read()
+        self.assertEqual(struct.unpack('<i4d2i', data[108:152]), (3, 0.0, 0.0, 20.0, 5.0, 1, 3))
+
+    def testNullGeometry(self):
+        basePath = self.WriteShapefile('nulls', ShapefileWriter.SHP_POLYLINE, [None, PackWKBLine([(1.0, 2.0), (3.0, 4.0)])])
+        self.CheckHeadersAndOffsets(basePath, ShapefileWriter.SHP_POLYLINE, (1.0, 2.0, 3.0, 4.0), 2)
+        self.assertEqual(ReadShx(basePath + '.shx')[0][1], 4) # null record is only the shape type
+
+    def testRingOrientation(self):
+        exterior = [(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 10.0), (0.0, 0.0)] # counterclockwise
+        hole = [(2.0, 2.0), (2.0, 8.0), (8.0, 8.0), (8.0, 2.0), (2.0, 2.0)] # clockwise
+        lstParts = ShapefileWriter.ParseWKB(PackWKBPolygon([exterior, hole]))
+        self.assertLess(ShapefileWriter.GetRingArea(lstParts[0]), 0) # exterior clockwise
+        self.assertGreater(ShapefileWriter.GetRingArea(lstParts[1]), 0) # interior counterclockwise
+
+        # rings already in shapefile order are kept as they are
+        lstParts = ShapefileWriter.ParseWKB(PackWKBPolygon([list(reversed(exterior)), list(reversed(hole))]))
+        self.assertEqual(lstParts[0], list(reversed(exterior)))
+        self.assertEqual(lstParts[1], list(reversed(hole)))
+
+        basePath = self.WriteShapefile('polygons', ShapefileWriter.SHP_POLYGON, [PackWKBPolygon([exterior, hole])])
+        self.CheckHeadersAndOffsets(basePath, ShapefileWriter.SHP_POLYGON, (0.0, 0.0, 10.0, 10.0), 1)
+        with open(basePath + '.shp', 'rb') as shpFile:
+            data = shpFile.read()
+        nParts, nPoints = struct.unpack('<2i', data[144:152])
+        self.assertEqual((nParts, nPoints), (2, 10))
+        self.assertEqual(struct.unpack('<2i', data[152:160]), (0, 5))
+        coords = struct.unpack('<20d', data[160:320])
+        ring = [(coords[i], coords[i + 1]) for i in range(0, 10, 2)]
+        self.assertLess(ShapefileWriter.GetRingArea(ring), 0)
+
+    def testDbfFormatting(self):
+        lstFieldDefs = ShapefileWriter.GetFieldDefs([('DESCRIPTION', 'String', 10), ('DESCRIPTION2', 'String', 10),
+                                                     ('COUNT', 'Integer', 0), ('AREA', 'Double', 0),
+                                                     ('UPDATED', 'Date', 0), ('SHAPE', 'Geometry', 0)])
+        self.assertEqual([fldDef[0] for fldDef in lstFieldDefs], ['DESCRIPTIO', 'DESCRIPT_1', 'COUNT', 'AREA', 'UPDATED'])
+
+        basePath = os.path.join(self.tempDir, 'attributes')
+        writer = ShapefileWriter.ShapefileWriter(basePath, ShapefileWriter.SHP_POINT, lstFieldDefs)
+        writer.WriteRecords([([[(1.0, 1.0)]], ['a much longer string than ten', u'caf\xe9 au lait', 42, 1234.5,
+                                                 datetime.datetime(2024, 3, 9, 14, 30)]),
+                             ([[(2.0, 2.0)]], [None, u'\xe9' * 6, None, None, None])])
+        writer.Close()
+
+        recordCount, lstDbfDefs, lstRecords, data = ReadDbf(basePath + '.dbf')
+        self.assertEqual(recordCount, 2)
+        self.assertEqual(lstDbfDefs, [('DESCRIPTIO', 'C', 10, 0), ('DESCRIPT_1', 'C', 10, 0), ('COUNT', 'N', 11, 0),
+                                      ('AREA', 'N', 19, 11), ('UPDATED', 'D', 8, 0)])
+        self.assertEqual(lstRecords[0], ['a much lon', u'caf\xe9 au l'.encode('utf-8'), ' ' * 9 + '42',
+                                         '   1234.50000000000', '20240309'])
+        # nulls are blank, and a truncated multibyte string doesn't end in a partial character
+        self.assertEqual(lstRecords[1][0], ' ' * 10)
+        self.assertEqual(lstRecords[1][1], (u'\xe9' * 5).encode('utf-8'))
+        self.assertEqual(lstRecords[1][2:], [' ' * 11, ' ' * 19, ' ' * 8])
+        self.assertEqual(data[-1], '\x1a')
+        with open(basePath + '.cpg') as cpgFile:
+            self.assertEqual(cpgFile.read(), 'UTF-8')
+
+    def testSqlServerFieldNames(self):
+        lstFieldDefs = ShapefileWriter.GetFieldDefs([('SHAPE.STArea()', 'Double', 0), ('SHAPE.STLength()', 'Double', 0),
+                                                     ('SHAPE_STArea', 'Double', 0)])
+        self.assertEqual([fldDef[0] for fldDef in lstFieldDefs], ['SHAPE_STAr', 'SHAPE_STLe', 'SHAPE_ST_1'])
+
+    def testFormatNumberFitsField(self):
+        self.assertEqual(ShapefileWriter.FormatNumber(123456789.123, 13, 11), '123456789.123')
+        self.assertEqual(len(ShapefileWriter.FormatNumber(1.5e30, 19, 11)), 19)
+        self.assertEqual(ShapefileWriter.FormatNumber(-7.6, 6, 0), '    -8')
+        self.assertEqual(ShapefileWriter.FormatNumber(float('nan'), 19, 11), ' ' * 19)
+        self.assertEqual(ShapefileWriter.FormatNumber(float('-inf'), 11, 0), ' ' * 11)
+
+    def testFileSizeGuard(self):
+        maxFileSize = ShapefileWriter.maxFileSize
+        ShapefileWriter.maxFileSize = 1000
+        try:
+            basePath = os.path.join(self.tempDir, 'toolarge')
+            writer = ShapefileWriter.ShapefileWriter(basePath, ShapefileWriter.SHP_POINT, ShapefileWriter.GetFieldDefs([('NAME', 'String', 10)]))
+            writer.WriteRecords([([[(float(i), 0.0)]], ['x']) for i in range(10)]) # 380 bytes of .shp
+            with self.assertRaises(ShapefileWriter.ShapefileWriterError):
+                writer.WriteRecords([([[(float(i), 0.0)]], ['x']) for i in range(30)])
+            writer.Close()
+            self.assertEqual(writer.recordCount, 40)
+            self.assertEqual(os.path.getsize(basePath + '.shp'), 100 + 28 * 10) # the failed batch isn't written
+        finally:
+            ShapefileWriter.maxFileSize = maxFileSize
+
+
+# arcpy stand-ins for ExportFeatureClassFanOut: a point feature class with a NAME field whose cursor can fail
+class FakeField(object):
+    def __init__(self, name, fldType, length):
+        self.name = name
+        self.type = fldType
+        self.length = length
+
+class FakeSpatialReference(object):
+    def exportToString(self):
+        return 'PROJCS["test"];-1000 -1000 10000;0 1;0 1;0.001;0.001;0.001;IsHighPrecision'
+
+class FakeDescribe(object):
+    def __init__(self):
+        self.shapeType = 'Point'
+        self.hasZ = False
+        self.hasM = False
+        self.fields = [FakeField('OBJECTID', 'OID', 4), FakeField('SHAPE', 'Geometry', 0), FakeField('NAME', 'String', 10)]
+        self.spatialReference = FakeSpatialReference()
+
+class FakeSearchCursor(object):
+    lstRows = []
+    failAfter = None # raise after this many rows
+
+    def __init__(self, featPath, lstFields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+    def __iter__(self):
+        for i, row in enumerate(FakeSearchCursor.lstRows):
+            if FakeSearchCursor.failAfter is not None and i == FakeSearchCursor.failAfter:
+                raise RuntimeError('cursor failed')
+            yield row
+
+
+@unittest.skipIf(not bPython2, 'ShapefileWriter is written for Python 2 (ArcMap)')
+class ExportFeatureClassFanOutTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.arcpy = sys.modules.get('arcpy')
+        arcpy = types.ModuleType('arcpy')
+        arcpy.Describe = lambda featPath: FakeDescribe()
+        arcpy.da = types.ModuleType('arcpy.da')
+        arcpy.da.SearchCursor = FakeSearchCursor
+        sys.modules['arcpy'] = arcpy
+        FakeSearchCursor.lstRows = [(PackWKBPoint(float(i), float(i)), 'pt ' + str(i)) for i in range(25)]
+        FakeSearchCursor.failAfter = None
+        self.batchSize = ShapefileWriter.batchSize
+        ShapefileWriter.batchSize = 10
+
+    def tearDown(self):
+        ShapefileWriter.batchSize = self.batchSize
+        if self.arcpy is None:
+            del sys.modules['arcpy']
+        else:
+            sys.modules['arcpy'] = self.arcpy
+        shutil.rmtree(self.tempDir)
+
+    def testFanOutWritesEverySink(self):
+        lstSinks = [(self.tempDir, 'points', None, ''), (self.tempDir, 'points_copy', None, 'GEOGCS["test"]')]
+        self.assertEqual(ShapefileWriter.ExportFeatureClassFanOut('test/points', lstSinks), 25)
+        for name in ['points', 'points_copy']:
+            basePath = os.path.join(self.tempDir, name)
+            self.assertEqual(len(ReadShx(basePath + '.shx')), 25)
+            self.assertEqual(ReadDbf(basePath + '.dbf')[1], [('NAME', 'C', 10, 0)])
+        with open(os.path.join(self.tempDir, 'points.prj')) as prjFile:
+            self.assertEqual(prjFile.read(), 'PROJCS["test"]')
+        self.assertEqual(sorted(os.listdir(self.tempDir)), sorted(name + ext for name in ['points', 'points_copy']
+                                                                  for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']))
+
+    def testReplaceKeepsMetadata(self):
+        with open(os.path.join(self.tempDir, 'points.shp.xml'), 'w') as xmlFile:
+            xmlFile.write('<metadata/>')
+        ShapefileWriter.ExportFeatureClassFanOut('test/points', [(self.tempDir, 'points', None, '')])
+        self.assertEqual(len(ReadShx(os.path.join(self.tempDir, 'points.shx'))), 25)
+        with open(os.path.join(self.tempDir, 'points.shp.xml')) as xmlFile:
+            self.assertEqual(xmlFile.read(), '<metadata/>')
+
+    def testFailedFanOutKeepsExistingShapefiles(self):
+        lstSinks = [(self.tempDir, 'points', None, ''), (self.tempDir, 'points_copy', None, '')]
+        FakeSearchCursor.lstRows = FakeSearchCursor.lstRows[:5]
+        ShapefileWriter.ExportFeatureClassFanOut('test/points', lstSinks)
+        lstFiles = sorted(os.listdir(self.tempDir))
+
+        FakeSearchCursor.lstRows = [(PackWKBPoint(float(i), float(i)), 'pt ' + str(i)) for i in range(25)]
+        FakeSearchCursor.failAfter = 15 # after the first batch is written
+        with self.assertRaises(RuntimeError):
+            ShapefileWriter.ExportFeatureClassFanOut('test/points', lstSinks)
+        self.assertEqual(sorted(os.listdir(self.tempDir)), lstFiles) # no partial or temporary files
+        for name in ['points', 'points_copy']:
+            self.assertEqual(len(ReadShx(os.path.join(self.tempDir, name + '.shx'))), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
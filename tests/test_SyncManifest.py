@@ -0,0 +1,57 @@
+# test_SyncManifest.py - Tests of queuing sync state manifest writes in a worker process for the main process to write
+#
+# Revision History:
+# Date          Developer           Description
+#
+######################################################################################################################
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SyncManifest
+
+
+class QueuedWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        SyncManifest.Open(os.path.join(self.tempDir, 'sync_manifest.sqlite'))
+        SyncManifest.RecordSync('parcels', 'LIBtoSHP', 'src 1', 'tgt 1', None, datetime.datetime(2024, 1, 1))
+
+    def tearDown(self):
+        SyncManifest.bQueueWrites = False
+        SyncManifest.ClearPendingWrites()
+        SyncManifest.Close()
+        shutil.rmtree(self.tempDir)
+
+    def testWorkerWritesAppliedByMainProcess(self):
+        SyncManifest.bQueueWrites = True # as in a worker process
+        SyncManifest.RecordSync('roads', 'EditGDBtoLIB', 'src 2', 'tgt 2', 10, datetime.datetime(2024, 2, 1, 8, 30))
+        SyncManifest.RecordUnchanged('parcels', 'LIBtoSHP', 'src 3', 'tgt 3')
+        SyncManifest.RecordUnchanged('streets', 'LIBtoSHP', 'src 4', 'tgt 4') # never synced, nothing to update
+
+        # the worker reads its own writes
+        self.assertEqual(SyncManifest.GetPublishedDate('roads', 'EditGDBtoLIB'), datetime.datetime(2024, 2, 1, 8, 30))
+        self.assertTrue(SyncManifest.IsUnchanged('parcels', 'LIBtoSHP', 'src 3', 'tgt 3'))
+        self.assertIsNone(SyncManifest.GetState('streets', 'LIBtoSHP'))
+        lstWrites = list(SyncManifest.lstPendingWrites)
+        self.assertEqual(len(lstWrites), 3)
+
+        # nothing was written to the database
+        SyncManifest.ClearPendingWrites()
+        self.assertIsNone(SyncManifest.GetState('roads', 'EditGDBtoLIB'))
+        self.assertTrue(SyncManifest.IsUnchanged('parcels', 'LIBtoSHP', 'src 1', 'tgt 1'))
+
+        SyncManifest.bQueueWrites = False # as in the main process
+        SyncManifest.ApplyWrites(lstWrites)
+        self.assertEqual(SyncManifest.GetState('roads', 'EditGDBtoLIB')['row_count'], 10)
+        self.assertTrue(SyncManifest.IsUnchanged('parcels', 'LIBtoSHP', 'src 3', 'tgt 3'))
+        self.assertEqual(SyncManifest.GetPublishedDate('parcels', 'LIBtoSHP'), datetime.datetime(2024, 1, 1))
+        self.assertIsNone(SyncManifest.GetState('streets', 'LIBtoSHP'))
+
+
+if __name__ == '__main__':
+    unittest.main()